@@ -0,0 +1,104 @@
+import logging
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+
+# Цифровые коды валют в номерах счетов; рубль по традиции обозначается 810, а не 643
+CURRENCY_NUMERIC_CODES = {
+    'RUB': '810',
+    'USD': '840',
+    'EUR': '978',
+    'GBP': '826',
+    'CNY': '156',
+    'JPY': '392',
+    'CHF': '756',
+    'TRY': '949',
+}
+
+# Весовые коэффициенты расчета контрольного ключа (3 цифры БИК + 20 цифр счета)
+_KEY_WEIGHTS = (7, 1, 3) * 8
+
+
+def control_key(bik: str, account_number: str) -> str:
+    """Контрольный ключ (9-я цифра) номера счета по БИК банка"""
+    digits = bik[-3:] + account_number[:8] + '0' + account_number[9:]
+    total = sum(int(digit) * weight % 10 for digit, weight in zip(digits, _KEY_WEIGHTS))
+    return str(total % 10 * 3 % 10)
+
+
+class AccountNumberAllocator:
+    """Выдача номеров счетов из последовательности БД.
+
+    Номер: балансовый счет (5 цифр) + цифровой код валюты (3) + контрольный
+    ключ (1) + порядковый номер из bank_system.account_number_seq (11).
+    Значения последовательности резервируются блоками одним запросом и
+    выдаются из памяти; выданные номера уникальны без повторных попыток
+    вставки. Неиспользованные значения блока просто пропускаются.
+    Последовательность создается при подключении (ensure_sequence), а не в
+    транзакциях проводок.
+    """
+
+    SEQUENCE = 'bank_system.account_number_seq'
+    SEQUENCE_MAX = 10 ** 11 - 1
+
+    def __init__(self, db_manager, prefix: str = '40817', bik: str = '044525000', block_size: int = 100):
+        self.db_manager = db_manager
+        self.prefix = prefix
+        self.bik = bik
+        self.block_size = max(1, block_size)
+        self.logger = logging.getLogger('AccountNumberAllocator')
+        self._pool: Deque[int] = deque()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Сброс зарезервированных значений (при смене базы данных)"""
+        with self._lock:
+            self._pool.clear()
+
+    def ensure_sequence(self):
+        """Создание последовательности в базах, развернутых до ее появления (вызывается при подключении)"""
+        if self.db_manager.execute_query("SELECT to_regclass(%s)", (self.SEQUENCE,))[0][0]:
+            return
+        self.db_manager.execute_query(
+            f"CREATE SEQUENCE IF NOT EXISTS {self.SEQUENCE} START WITH 1000 MAXVALUE {self.SEQUENCE_MAX}"
+        )
+        self.logger.info("Created sequence %s", self.SEQUENCE)
+
+    def _reserve(self, count: int):
+        needed = count - len(self._pool)
+        if needed <= 0:
+            return
+        size = max(needed, self.block_size)
+        rows = self.db_manager.execute_query(
+            f"SELECT nextval('{self.SEQUENCE}') FROM generate_series(1, %s)", (size,)
+        )
+        self._pool.extend(value for (value,) in rows)
+        self.logger.info("Reserved %d account numbers", size)
+
+    def reserve(self, count: int):
+        """Резервирование значений, чтобы в памяти их было не меньше count"""
+        with self._lock:
+            self._reserve(count)
+
+    def _numeric_code(self, currency_code: str, prefix: str) -> str:
+        code = CURRENCY_NUMERIC_CODES.get(currency_code.upper())
+        if code is None:
+            raise ValueError(f"Нет цифрового кода для валюты {currency_code}")
+        if len(prefix) != 5 or not prefix.isdigit():
+            raise ValueError(f"Балансовый счет должен состоять из 5 цифр: {prefix}")
+        return code
+
+    def format(self, currency_code: str, sequence: int, prefix: Optional[str] = None) -> str:
+        prefix = prefix or self.prefix
+        number = f"{prefix}{self._numeric_code(currency_code, prefix)}0{sequence:011d}"
+        return number[:8] + control_key(self.bik, number) + number[9:]
+
+    def allocate_many(self, currency_code: str, count: int, prefix: Optional[str] = None) -> List[str]:
+        self._numeric_code(currency_code, prefix or self.prefix)
+        with self._lock:
+            self._reserve(count)
+            sequences = [self._pool.popleft() for _ in range(count)]
+        return [self.format(currency_code, sequence, prefix) for sequence in sequences]
+
+    def allocate(self, currency_code: str, prefix: Optional[str] = None) -> str:
+        return self.allocate_many(currency_code, 1, prefix)[0]
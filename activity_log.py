@@ -0,0 +1,153 @@
+import logging
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QSortFilterProxyModel, Qt
+from PySide6.QtGui import QBrush, QColor
+from PySide6.QtWidgets import (QAbstractItemView, QComboBox, QHBoxLayout, QLabel,
+                               QLineEdit, QListView, QPushButton, QVBoxLayout, QWidget)
+
+LevelRole = Qt.UserRole + 1
+
+LEVELS = [
+    ("Все", logging.DEBUG),
+    ("Информация", logging.INFO),
+    ("Предупреждения", logging.WARNING),
+    ("Ошибки", logging.ERROR),
+]
+
+_LEVEL_COLORS = {
+    logging.WARNING: QColor('#B26A00'),
+    logging.ERROR: QColor('#C62828'),
+}
+
+Entry = Tuple[datetime, int, str]
+
+
+class ActivityLogModel(QAbstractListModel):
+    """Журнал действий фиксированной емкости (кольцевой буфер).
+
+    Записи хранятся в списке постоянной длины; при заполнении новая запись
+    замещает самую старую, поэтому память и стоимость добавления не зависят
+    от времени работы приложения.
+    """
+
+    def __init__(self, capacity: int = 5000, parent=None):
+        super().__init__(parent)
+        self.capacity = max(1, capacity)
+        self._items: List[Optional[Entry]] = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._count
+
+    def entry(self, row: int) -> Entry:
+        return self._items[(self._start + row) % self.capacity]
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole) -> Any:
+        if not index.isValid() or not 0 <= index.row() < self._count:
+            return None
+        timestamp, level, message = self.entry(index.row())
+        if role == Qt.DisplayRole:
+            return f"{timestamp:%H:%M:%S}  {message}"
+        if role == Qt.ToolTipRole:
+            return f"{timestamp:%Y-%m-%d %H:%M:%S} [{logging.getLevelName(level)}] {message}"
+        if role == Qt.ForegroundRole and level in _LEVEL_COLORS:
+            return QBrush(_LEVEL_COLORS[level])
+        if role == LevelRole:
+            return level
+        return None
+
+    def append(self, message: str, level: int = logging.INFO):
+        if self._count == self.capacity:
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            self._items[self._start] = None
+            self._start = (self._start + 1) % self.capacity
+            self._count -= 1
+            self.endRemoveRows()
+        row = self._count
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._items[(self._start + row) % self.capacity] = (datetime.now(), level, message)
+        self._count += 1
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self._items = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+        self.endResetModel()
+
+
+class ActivityLogFilter(QSortFilterProxyModel):
+    """Отбор записей по минимальной важности и подстроке"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.min_level = logging.DEBUG
+        self.search_text = ''
+
+    def set_min_level(self, level: int):
+        self.min_level = level
+        self.invalidateFilter()
+
+    def set_search_text(self, text: str):
+        self.search_text = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row: int, source_parent: QModelIndex) -> bool:
+        timestamp, level, message = self.sourceModel().entry(source_row)
+        if level < self.min_level:
+            return False
+        return not self.search_text or self.search_text in message.lower()
+
+
+class ActivityLogPanel(QWidget):
+    """Панель последних действий: список с фильтром важности и поиском"""
+
+    def __init__(self, capacity: int = 5000, parent=None):
+        super().__init__(parent)
+        self.model = ActivityLogModel(capacity, self)
+        self.proxy = ActivityLogFilter(self)
+        self.proxy.setSourceModel(self.model)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Показать:"))
+        self.level_combo = QComboBox()
+        for title, level in LEVELS:
+            self.level_combo.addItem(title, level)
+        self.level_combo.currentIndexChanged.connect(
+            lambda: self.proxy.set_min_level(self.level_combo.currentData())
+        )
+        filter_layout.addWidget(self.level_combo)
+
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Поиск по журналу...")
+        self.search_edit.setClearButtonEnabled(True)
+        self.search_edit.textChanged.connect(self.proxy.set_search_text)
+        filter_layout.addWidget(self.search_edit, 1)
+
+        clear_btn = QPushButton("Очистить")
+        clear_btn.clicked.connect(self.model.clear)
+        filter_layout.addWidget(clear_btn)
+        layout.addLayout(filter_layout)
+
+        self.view = QListView()
+        self.view.setModel(self.proxy)
+        # Одинаковая высота строк: вид отрисовывает только видимые записи без измерения каждой
+        self.view.setUniformItemSizes(True)
+        self.view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.view.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.view.setVerticalScrollMode(QAbstractItemView.ScrollPerPixel)
+        layout.addWidget(self.view)
+
+    def add(self, message: str, level: int = logging.INFO):
+        scrollbar = self.view.verticalScrollBar()
+        follow = scrollbar.value() >= scrollbar.maximum()
+        self.model.append(message, level)
+        if follow:
+            self.view.scrollToBottom()
@@ -0,0 +1,441 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Set
+
+import psycopg2
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+# Столбцы таблицы load(): сначала в порядке TransactionCube.LOAD_QUERY, затем ключи клиента и счета
+REPLICA_COLUMNS = ['transaction_id', 'transaction_type', 'currency_code', 'employee_name', 'month',
+                   'full_name', 'is_vip', 'account_id', 'amount', 'commission', 'exchange_rate',
+                   'transaction_date', 'description', 'client_id', 'account_number']
+
+# Масштаб десятичных столбцов: хранятся целыми (amount * 10**scale), как decimal в ColumnarResult
+DECIMAL_SCALES = {'amount': 2, 'commission': 2, 'exchange_rate': 6}
+
+
+def fact_schema():
+    def scaled(name):
+        return pa.field(name, pa.int64(), metadata={'scale': str(DECIMAL_SCALES[name])})
+
+    return pa.schema([
+        pa.field('transaction_id', pa.int64()),
+        pa.field('account_id', pa.int64()),
+        pa.field('transaction_type', pa.string()),
+        pa.field('currency_code', pa.string()),
+        pa.field('employee_name', pa.string()),
+        pa.field('month', pa.string()),
+        scaled('amount'),
+        scaled('commission'),
+        scaled('exchange_rate'),
+        pa.field('transaction_date', pa.timestamp('us')),
+        pa.field('description', pa.string()),
+    ])
+
+
+def account_schema():
+    return pa.schema([
+        pa.field('account_id', pa.int64()),
+        pa.field('client_id', pa.int64()),
+        pa.field('account_number', pa.string()),
+        pa.field('full_name', pa.string()),
+        pa.field('is_vip', pa.bool_()),
+    ])
+
+
+def _scaled(value: Optional[Decimal], scale: int) -> Optional[int]:
+    return None if value is None else int(Decimal(value).scaleb(scale).to_integral_value())
+
+
+class TransactionReplica:
+    """Локальная столбцовая копия транзакций для анализа без обращения к серверу.
+
+    Транзакции хранятся в файлах Arrow IPC без сжатия и открываются через
+    memory map, поэтому load() не читает данные целиком и ничего не
+    запрашивает у сервера. Первая синхронизация загружает все транзакции,
+    следующие - только новые, и дописывают их новым сегментом; сегменты
+    периодически объединяются. Справочник счетов и клиентов (client_id,
+    номер счета, ФИО, VIP) небольшой и перезаписывается при каждой
+    синхронизации, так что изменения клиентов видны после sync().
+
+    Новые транзакции читаются из outbox transaction_events по курсору
+    (tx_id, event_id), как в OutboxConsumer: берутся только события
+    транзакций ниже xmin текущего снимка, поэтому транзакция, которая
+    зафиксируется позже, не будет пропущена. Копия регистрируется
+    потребителем outbox, чтобы purge_consumed_events не удалил еще не
+    прочитанные события. Изменения и удаления уже загруженных транзакций
+    (в том числе перенос в архив) не отслеживаются; для полной перезагрузки
+    служит rebuild(). Требуется pyarrow.
+    """
+
+    META_FILE = 'replica.json'
+    MAX_SEGMENTS = 16
+
+    FACT_COLUMNS = """
+        t.transaction_id, t.account_id, t.transaction_type::text, t.currency_code, t.employee_name,
+        to_char(t.transaction_date, 'YYYY-MM'), t.amount, COALESCE(t.commission, 0),
+        t.exchange_rate, t.transaction_date, t.description
+    """
+
+    FULL_QUERY = f"""
+        SELECT {FACT_COLUMNS}
+        FROM bank_system.transactions t
+        ORDER BY t.transaction_id
+    """
+
+    # Транзакции событий outbox после курсора до конца прочитанного диапазона
+    EVENTS_QUERY = f"""
+        SELECT e.tx_id::text, {FACT_COLUMNS}
+        FROM bank_system.transaction_events e
+        JOIN bank_system.transactions t ON t.transaction_id = e.transaction_id
+        WHERE (e.tx_id, e.event_id) > (%s::xid8, %s)
+          AND (e.tx_id, e.event_id) <= (%s::xid8, %s)
+          AND e.event_type = 'transaction_created'
+        ORDER BY e.tx_id, e.event_id
+    """
+
+    # Последнее событие после курсора, транзакция которого уже видна всем снимкам
+    END_QUERY = """
+        SELECT e.tx_id::text, e.event_id
+        FROM bank_system.transaction_events e
+        WHERE (e.tx_id, e.event_id) > (%s::xid8, %s)
+          AND e.tx_id < pg_snapshot_xmin(pg_current_snapshot())
+        ORDER BY e.tx_id DESC, e.event_id DESC
+        LIMIT 1
+    """
+
+    SNAPSHOT_QUERY = """
+        SELECT pg_snapshot_xmin(pg_current_snapshot())::text, pg_snapshot_xmax(pg_current_snapshot())::text
+    """
+
+    ACCOUNTS_QUERY = """
+        SELECT a.account_id, a.client_id, a.account_number, c.full_name, c.is_vip
+        FROM bank_system.currency_accounts a
+        JOIN bank_system.clients c ON a.client_id = c.client_id
+        ORDER BY a.account_id
+    """
+
+    def __init__(self, db_manager, replica_dir: str = 'analytics', batch_size: int = 50000):
+        self.db_manager = db_manager
+        self.replica_dir = replica_dir
+        self.batch_size = max(1, batch_size)
+        self.logger = logging.getLogger('TransactionReplica')
+        self._lock = threading.Lock()
+        self._table = None
+        self._table_generation: Optional[int] = None
+
+    @property
+    def available(self) -> bool:
+        return pa is not None
+
+    def _require_pyarrow(self):
+        if pa is None:
+            raise ValueError("Для локальной копии транзакций требуется пакет pyarrow")
+
+    def reset(self):
+        """Сброс загруженной таблицы (при смене базы данных)"""
+        with self._lock:
+            self._table = None
+            self._table_generation = None
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.replica_dir, file_name)
+
+    def _source(self) -> str:
+        params = self.db_manager.connection_params
+        return f"{params['host']}:{params['port']}/{params['database']}"
+
+    def _empty_meta(self) -> Dict[str, Any]:
+        return {'source': self._source(), 'generation': 0, 'consumer': None, 'cursor': None,
+                'recheck_below': None, 'rows': 0, 'segments': [], 'accounts': None, 'synced_at': None}
+
+    def _read_meta(self) -> Dict[str, Any]:
+        try:
+            with open(self._path(self.META_FILE), encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return self._empty_meta()
+        if meta.get('source') != self._source():
+            # Копия сделана с другой базы данных
+            return self._empty_meta()
+        if 'cursor' not in meta:
+            # Копия прежнего формата без курсора outbox загружается заново
+            return dict(self._empty_meta(), generation=meta.get('generation', 0))
+        return meta
+
+    def _write_meta(self, meta: Dict[str, Any]):
+        temp_path = self._path(f".{self.META_FILE}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self._path(self.META_FILE))
+
+    def exists(self) -> bool:
+        return self._read_meta()['accounts'] is not None
+
+    def info(self) -> Dict[str, Any]:
+        """Курсор outbox, число строк, сегментов и время последней синхронизации"""
+        meta = self._read_meta()
+        return {'cursor': meta['cursor'], 'rows': meta['rows'],
+                'segments': len(meta['segments']), 'synced_at': meta['synced_at']}
+
+    # ---- синхронизация ----
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.db_manager.connection_params, options="-c client_encoding=UTF8")
+        # Справочник счетов и новые транзакции читаются из одного снимка;
+        # позиция потребителя outbox записывается в конце той же транзакции
+        conn.set_session(isolation_level='REPEATABLE READ')
+        return conn
+
+    def _register_consumer(self, conn, consumer: str):
+        """Регистрация копии потребителем outbox отдельной транзакцией до чтения снимка"""
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO bank_system.outbox_consumers (consumer_name)
+                VALUES (%s)
+                ON CONFLICT (consumer_name) DO NOTHING
+            """, (consumer,))
+        conn.commit()
+
+    def _write_file(self, file_name: str, schema, batches, keep_empty: bool = False) -> int:
+        """Запись пачек строк в файл Arrow IPC; возвращает число строк.
+
+        Если строк нет, файл создается только при keep_empty.
+        """
+        temp_path = self._path(f".{file_name}.tmp")
+        count = 0
+        try:
+            with pa.OSFile(temp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, schema) as writer:
+                    for rows in batches:
+                        columns = list(zip(*rows))
+                        writer.write_batch(pa.RecordBatch.from_arrays(
+                            [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                            schema=schema
+                        ))
+                        count += len(rows)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        if not (count or keep_empty):
+            os.remove(temp_path)
+            return count
+        os.replace(temp_path, self._path(file_name))
+        return count
+
+    def _fact_batches(self, cursor, events: bool = False, recheck_below: int = 0,
+                      loaded: Optional[Set[int]] = None):
+        """Пачки строк транзакций для записи.
+
+        Строки запроса событий (events) начинаются с tx_id; транзакции с tx_id
+        ниже recheck_below могли попасть в снимок полной загрузки и
+        пропускаются, если их номер уже есть в loaded.
+        """
+        while True:
+            rows = cursor.fetchmany(self.batch_size)
+            if not rows:
+                break
+            batch = []
+            for row in rows:
+                if events:
+                    tx_id, row = row[0], row[1:]
+                    if int(tx_id) < recheck_below and row[0] in loaded:
+                        continue
+                (transaction_id, account_id, trans_type, currency, employee, month,
+                 amount, commission, rate, transaction_date, description) = row
+                batch.append((transaction_id, account_id, trans_type, currency, employee, month,
+                              _scaled(amount, 2), _scaled(commission, 2), _scaled(rate, 6),
+                              transaction_date, description))
+            if batch:
+                yield batch
+
+    def _map(self, file_name: str):
+        return pa.ipc.open_file(pa.memory_map(self._path(file_name), 'r')).read_all()
+
+    def _loaded_ids(self, meta: Dict[str, Any]) -> Set[int]:
+        ids = set()
+        for name in meta['segments']:
+            ids.update(self._map(name)['transaction_id'].to_pylist())
+        return ids
+
+    def _compact(self, meta: Dict[str, Any]):
+        """Объединение сегментов в один файл"""
+        file_name = f"transactions_{meta['generation']:06d}_all.arrow"
+        table = pa.concat_tables([self._map(name) for name in meta['segments']])
+        temp_path = self._path(f".{file_name}.tmp")
+        with pa.OSFile(temp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=self.batch_size)
+        os.replace(temp_path, self._path(file_name))
+        self.logger.info("Compacted %d replica segments into %s", len(meta['segments']), file_name)
+        meta['segments'] = [file_name]
+
+    def _remove_unused(self, meta: Dict[str, Any]):
+        used = set(meta['segments']) | {meta['accounts'], self.META_FILE}
+        for file_name in os.listdir(self.replica_dir):
+            if file_name in used or not file_name.endswith('.arrow'):
+                continue
+            try:
+                os.remove(self._path(file_name))
+            except OSError as e:
+                # Файл еще отображен в память (Windows); будет удален при следующей синхронизации
+                self.logger.debug("Could not remove replica file %s: %s", file_name, e)
+
+    def sync(self, progress: Optional[Callable[[int], None]] = None) -> int:
+        """Догрузка новых транзакций и справочника счетов; возвращает число добавленных строк.
+
+        progress(загружено строк) вызывается после каждой пачки.
+        """
+        self._require_pyarrow()
+        with self._lock:
+            os.makedirs(self.replica_dir, exist_ok=True)
+            meta = self._read_meta()
+            consumer = meta['consumer'] or f"analytics_replica_{uuid.uuid4().hex[:12]}"
+            generation = meta['generation'] + 1
+            accounts_file = f"accounts_{generation:06d}.arrow"
+            segment_file = f"transactions_{generation:06d}.arrow"
+            cursor_position = meta['cursor']
+            recheck_below = meta['recheck_below']
+            started = time.perf_counter()
+
+            conn = self._connect()
+            try:
+                self._register_consumer(conn, consumer)
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(self.ACCOUNTS_QUERY)
+                    accounts = cursor.fetchall()
+                    if cursor_position is None:
+                        # Полная загрузка: события транзакций ниже xmin снимка в нем уже видны,
+                        # события до xmax могут дублировать загруженные строки
+                        cursor.execute(self.SNAPSHOT_QUERY)
+                        xmin, xmax = cursor.fetchone()
+                        end_position = [xmin, 0]
+                        recheck_below = xmax
+                        query, params = self.FULL_QUERY, None
+                    else:
+                        cursor.execute(self.END_QUERY, cursor_position)
+                        end = cursor.fetchone()
+                        end_position = list(end) if end else cursor_position
+                        query, params = self.EVENTS_QUERY, (*cursor_position, *end_position)
+                finally:
+                    cursor.close()
+                # Пустой справочник тоже должен открываться в load()
+                self._write_file(accounts_file, account_schema(), [accounts] if accounts else [], keep_empty=True)
+
+                added = 0
+                if end_position != cursor_position:
+                    events = params is not None
+                    recheck = int(recheck_below) if events and recheck_below else 0
+                    loaded_ids = self._loaded_ids(meta) if recheck and recheck > int(cursor_position[0]) else None
+                    cursor = conn.cursor(name=f"replica_sync_{generation}")
+                    cursor.itersize = self.batch_size
+                    try:
+                        cursor.execute(query, params)
+                        loaded = [0]
+
+                        def batches():
+                            for batch in self._fact_batches(cursor, events, recheck, loaded_ids):
+                                loaded[0] += len(batch)
+                                if progress:
+                                    progress(loaded[0])
+                                yield batch
+
+                        added = self._write_file(segment_file, fact_schema(), batches())
+                    finally:
+                        cursor.close()
+
+                if params is not None and recheck_below is not None and int(end_position[0]) >= int(recheck_below):
+                    recheck_below = None
+                meta.update({
+                    'generation': generation,
+                    'consumer': consumer,
+                    'cursor': end_position,
+                    'recheck_below': recheck_below,
+                    'rows': meta['rows'] + added,
+                    'accounts': accounts_file,
+                    'synced_at': datetime.now().isoformat(timespec='seconds'),
+                })
+                if added:
+                    meta['segments'] = meta['segments'] + [segment_file]
+                if len(meta['segments']) > self.MAX_SEGMENTS:
+                    self._compact(meta)
+                self._write_meta(meta)
+
+                # Позиция на сервере сдвигается только после записи копии,
+                # чтобы не сохраненные локально события не были удалены
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        UPDATE bank_system.outbox_consumers
+                        SET last_tx_id = %s::xid8, last_event_id = %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE consumer_name = %s
+                    """, (*end_position, consumer))
+                conn.commit()
+            finally:
+                conn.close()
+            self._remove_unused(meta)
+        self.logger.info("Replica synced: %d new transactions in %.2fs, outbox cursor %s/%s",
+                         added, time.perf_counter() - started, *end_position)
+        return added
+
+    def rebuild(self, progress: Optional[Callable[[int], None]] = None) -> int:
+        """Полная перезагрузка копии с сервера"""
+        self._require_pyarrow()
+        with self._lock:
+            os.makedirs(self.replica_dir, exist_ok=True)
+            previous = self._read_meta()
+            meta = self._empty_meta()
+            # Позиция потребителя outbox на сервере переиспользуется и сдвинется после загрузки
+            meta.update(generation=previous['generation'], consumer=previous['consumer'])
+            self._write_meta(meta)
+        return self.sync(progress)
+
+    # ---- чтение ----
+
+    def load(self):
+        """Таблица pyarrow со столбцами REPLICA_COLUMNS из локальных файлов, без обращения к серверу.
+
+        Транзакции отображаются в память без копирования; из справочника
+        счетов по account_id подставляются ФИО, VIP, client_id и номер счета.
+        """
+        self._require_pyarrow()
+        with self._lock:
+            meta = self._read_meta()
+            if meta['accounts'] is None:
+                raise ValueError("Локальная копия транзакций еще не создана, выполните синхронизацию")
+            if self._table is not None and self._table_generation == meta['generation']:
+                return self._table
+
+            schema = fact_schema()
+            facts = (pa.concat_tables([self._map(name) for name in meta['segments']])
+                     if meta['segments'] else schema.empty_table())
+            accounts = self._map(meta['accounts'])
+            index = pc.index_in(facts['account_id'], value_set=accounts['account_id'])
+            if index.null_count:
+                # Транзакции удаленных счетов, как и при JOIN в TransactionCube.LOAD_QUERY, не показываются
+                valid = pc.is_valid(index)
+                facts = facts.filter(valid)
+                index = index.filter(valid)
+            looked_up = accounts.take(index)
+
+            fields, arrays = [], []
+            for name in REPLICA_COLUMNS:
+                source = facts if name in schema.names else looked_up
+                fields.append(source.schema.field(name))
+                arrays.append(source[name])
+            self._table = pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+            self._table_generation = meta['generation']
+        self.logger.info("Replica loaded: %d transactions, %d bytes", self._table.num_rows, self._table.nbytes)
+        return self._table
@@ -0,0 +1,383 @@
+import sys
+from array import array
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+    pc = None
+
+_EPOCH = datetime(1970, 1, 1)
+_MAX_CATEGORIES = 4096
+_INT64_MAX = 2 ** 63 - 1
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+
+
+def _arrow_values(values, typecode: str) -> array:
+    """Значения числового массива Arrow (NULL -> 0) в array(typecode) одним копированием буфера"""
+    if values.null_count:
+        values = pc.fill_null(values, 0)
+    result = array(typecode)
+    buffer = values.buffers()[1]
+    if buffer is not None:
+        itemsize = result.itemsize
+        result.frombytes(memoryview(buffer)[values.offset * itemsize:(values.offset + len(values)) * itemsize])
+    return result
+
+
+class _Column:
+    """Один столбец результата: типизированный массив значений и маска NULL.
+
+    Виды хранения:
+    int       - array('q')
+    float     - array('d')
+    decimal   - array('q') целых, масштабированных на 10**scale
+    bool      - array('b')
+    timestamp - array('q') микросекунд от 1970-01-01 (без часового пояса)
+    date      - array('i') порядковых номеров дней
+    category  - array('i') кодов + список уникальных значений (ENUM, коды валют)
+    object    - обычный список значений
+    """
+
+    __slots__ = ('kind', 'values', 'nulls', 'scale', 'categories', '_index', 'size')
+
+    def __init__(self, scale: Optional[int] = None):
+        self.kind: Optional[str] = None
+        self.values: Union[array, list, None] = None
+        self.nulls = bytearray()
+        self.scale = scale or 0
+        self.categories: List[Any] = []
+        self._index: Dict[Any, int] = {}
+        self.size = 0
+
+    @classmethod
+    def from_arrow(cls, values, scale: Optional[int] = None) -> '_Column':
+        """Столбец из массива pyarrow без построчного разбора.
+
+        Целые с заданным scale считаются десятичными (значение * 10**scale),
+        строки кодируются словарем средствами Arrow.
+        """
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        column = cls(scale)
+        column.size = len(values)
+        column.nulls = (bytearray(_arrow_values(pc.is_null(values).cast(pa.int8()), 'b').tobytes())
+                        if values.null_count else bytearray(len(values)))
+        arrow_type = values.type
+        types = pa.types
+        if types.is_integer(arrow_type):
+            column.kind = 'decimal' if scale is not None else 'int'
+            column.values = _arrow_values(values.cast(pa.int64()), 'q')
+        elif types.is_boolean(arrow_type):
+            column.kind = 'bool'
+            column.values = _arrow_values(values.cast(pa.int8()), 'b')
+        elif types.is_floating(arrow_type):
+            column.kind = 'float'
+            column.values = _arrow_values(values.cast(pa.float64()), 'd')
+        elif types.is_timestamp(arrow_type) and arrow_type.tz is None:
+            column.kind = 'timestamp'
+            column.values = _arrow_values(values.cast(pa.timestamp('us')).cast(pa.int64()), 'q')
+        elif types.is_date32(arrow_type):
+            column.kind = 'date'
+            column.values = array('i', (raw + _EPOCH_ORDINAL for raw in _arrow_values(values.cast(pa.int32()), 'i')))
+        elif types.is_string(arrow_type) or types.is_large_string(arrow_type) or types.is_dictionary(arrow_type):
+            encoded = values if types.is_dictionary(arrow_type) else values.dictionary_encode()
+            column.kind = 'category'
+            column.values = _arrow_values(encoded.indices.cast(pa.int32()), 'i')
+            column.categories = [sys.intern(value) if type(value) is str else value
+                                 for value in encoded.dictionary.to_pylist()]
+            column._index = {value: code for code, value in enumerate(column.categories)}
+        else:
+            column.kind = 'object'
+            column.values = values.to_pylist()
+        return column
+
+    @staticmethod
+    def _kind_of(value: Any) -> str:
+        if isinstance(value, bool):
+            return 'bool'
+        if isinstance(value, int):
+            return 'int'
+        if isinstance(value, float):
+            return 'float'
+        if isinstance(value, Decimal):
+            return 'decimal'
+        if isinstance(value, datetime):
+            return 'object' if value.tzinfo is not None else 'timestamp'
+        if isinstance(value, date):
+            return 'date'
+        if isinstance(value, (str, Enum)):
+            return 'category'
+        return 'object'
+
+    def _start(self, kind: str):
+        self.kind = kind
+        typecode = {'int': 'q', 'float': 'd', 'decimal': 'q', 'bool': 'b',
+                    'timestamp': 'q', 'date': 'i', 'category': 'i'}.get(kind)
+        self.values = array(typecode, bytes(array(typecode).itemsize * self.size)) if typecode else [None] * self.size
+
+    def _encode(self, value: Any) -> Any:
+        kind = self.kind
+        if kind == 'int':
+            if type(value) is not int or not -_INT64_MAX <= value <= _INT64_MAX:
+                raise TypeError
+            return value
+        if kind == 'float':
+            if type(value) is not float:
+                raise TypeError
+            return value
+        if kind == 'decimal':
+            if not isinstance(value, Decimal) or not value.is_finite():
+                raise TypeError
+            exponent = -value.normalize().as_tuple().exponent
+            if exponent > self.scale:
+                self._rescale(exponent)
+            scaled = int(value.scaleb(self.scale))
+            if not -_INT64_MAX <= scaled <= _INT64_MAX:
+                raise TypeError
+            return scaled
+        if kind == 'bool':
+            if type(value) is not bool:
+                raise TypeError
+            return int(value)
+        if kind == 'timestamp':
+            if type(value) is not datetime or value.tzinfo is not None:
+                raise TypeError
+            delta = value - _EPOCH
+            return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+        if kind == 'date':
+            if type(value) is not date:
+                raise TypeError
+            return value.toordinal()
+        if kind == 'category':
+            code = self._index.get(value)
+            if code is None:
+                if len(self.categories) >= _MAX_CATEGORIES or self._kind_of(value) != 'category':
+                    raise TypeError
+                if type(value) is str:
+                    value = sys.intern(value)
+                code = len(self.categories)
+                self.categories.append(value)
+                self._index[value] = code
+            return code
+        return value
+
+    def _decode(self, raw: Any) -> Any:
+        kind = self.kind
+        if kind == 'decimal':
+            return Decimal(raw).scaleb(-self.scale)
+        if kind == 'bool':
+            return bool(raw)
+        if kind == 'timestamp':
+            return _EPOCH + timedelta(microseconds=raw)
+        if kind == 'date':
+            return date.fromordinal(raw)
+        if kind == 'category':
+            return self.categories[raw]
+        return raw
+
+    def _rescale(self, scale: int):
+        factor = 10 ** (scale - self.scale)
+        limit = _INT64_MAX // factor
+        if any(not -limit <= raw <= limit for raw in self.values):
+            raise TypeError
+        self.values = array('q', (raw * factor for raw in self.values))
+        self.scale = scale
+
+    def _promote_to_object(self):
+        decoded = [None if self.nulls[i] else self._decode(raw) for i, raw in enumerate(self.values)]
+        self.kind = 'object'
+        self.values = decoded
+        self.categories = []
+        self._index = {}
+
+    def append(self, value: Any):
+        if value is None:
+            self.nulls.append(1)
+            if self.kind is not None:
+                self.values.append(None if self.kind == 'object' else 0)
+            self.size += 1
+            return
+        if self.kind is None:
+            self._start(self._kind_of(value))
+        try:
+            encoded = self._encode(value)
+        except (TypeError, ValueError, OverflowError):
+            self._promote_to_object()
+            encoded = value
+        self.values.append(encoded)
+        self.nulls.append(0)
+        self.size += 1
+
+    def finish(self):
+        if self.kind is None:
+            self._start('object')
+
+    def get(self, row: int) -> Any:
+        if self.nulls[row]:
+            return None
+        return self._decode(self.values[row])
+
+    def nbytes(self) -> int:
+        if isinstance(self.values, array):
+            return self.values.itemsize * len(self.values) + len(self.nulls)
+        return sys.getsizeof(self.values) + len(self.nulls)
+
+
+class ColumnarResult:
+    """Результат запроса, хранящийся по столбцам в типизированных массивах.
+
+    Поддерживает доступ по строкам (``len``, индексация, итерация кортежами),
+    поэтому может использоваться вместо списка кортежей, а также доступ по
+    столбцам для векторной обработки на клиенте.
+    """
+
+    def __init__(self, column_names: Sequence[str], columns: List[_Column]):
+        self.column_names = list(column_names)
+        self._columns = columns
+        self._positions = {name: i for i, name in enumerate(self.column_names)}
+        self._size = columns[0].size if columns else 0
+
+    @classmethod
+    def from_cursor(cls, cursor, chunk_size: int = 10000) -> 'ColumnarResult':
+        description = cursor.description or []
+        names = [desc[0] for desc in description]
+        columns = [_Column(getattr(desc, 'scale', None)) for desc in description]
+        while True:
+            chunk = cursor.fetchmany(chunk_size)
+            if not chunk:
+                break
+            for row in chunk:
+                for column, value in zip(columns, row):
+                    column.append(value)
+        for column in columns:
+            column.finish()
+        return cls(names, columns)
+
+    @classmethod
+    def from_rows(cls, rows, column_names: Sequence[str]) -> 'ColumnarResult':
+        columns = [_Column() for _ in column_names]
+        for row in rows:
+            for column, value in zip(columns, row):
+                column.append(value)
+        for column in columns:
+            column.finish()
+        return cls(column_names, columns)
+
+    @classmethod
+    def from_arrow(cls, table) -> 'ColumnarResult':
+        """Результат из таблицы pyarrow; у десятичных столбцов в метаданных поля указан scale"""
+        columns = []
+        for field, values in zip(table.schema, table.columns):
+            scale = (field.metadata or {}).get(b'scale')
+            columns.append(_Column.from_arrow(values, int(scale) if scale is not None else None))
+        return cls(table.column_names, columns)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __getitem__(self, row: int) -> Tuple:
+        if row < 0:
+            row += self._size
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        return tuple(column.get(row) for column in self._columns)
+
+    def __iter__(self) -> Iterator[Tuple]:
+        getters = [column.get for column in self._columns]
+        for row in range(self._size):
+            yield tuple(get(row) for get in getters)
+
+    def _column(self, key: Union[int, str]) -> _Column:
+        if isinstance(key, str):
+            key = self._positions[key]
+        return self._columns[key]
+
+    def value(self, row: int, column: Union[int, str]) -> Any:
+        return self._column(column).get(row)
+
+    def column(self, key: Union[int, str]) -> List[Any]:
+        """Значения столбца в виде списка Python-объектов"""
+        column = self._column(key)
+        return [column.get(row) for row in range(self._size)]
+
+    def kind(self, key: Union[int, str]) -> str:
+        return self._column(key).kind
+
+    def nulls(self, key: Union[int, str]) -> bytearray:
+        return self._column(key).nulls
+
+    def codes(self, key: Union[int, str]) -> Tuple[array, List[Any]]:
+        """Коды и словарь значений категориального столбца"""
+        column = self._column(key)
+        if column.kind != 'category':
+            raise ValueError(f"Столбец {key} не является категориальным")
+        return column.values, column.categories
+
+    def numeric(self, key: Union[int, str]):
+        """Числовой столбец как массив float64 (NULL -> 0); numpy, если установлен"""
+        column = self._column(key)
+        if column.kind in ('int', 'float', 'bool'):
+            data = column.values
+            if np is not None:
+                return np.frombuffer(data, dtype={'q': np.int64, 'd': np.float64, 'b': np.int8}[data.typecode]).astype(np.float64)
+            return array('d', (float(v) for v in data))
+        if column.kind == 'decimal':
+            divisor = 10 ** column.scale
+            if np is not None:
+                return np.frombuffer(column.values, dtype=np.int64) / divisor
+            return array('d', (v / divisor for v in column.values))
+        if column.kind == 'object' and all(isinstance(v, (int, float, Decimal)) or v is None for v in column.values):
+            data = [0.0 if v is None else float(v) for v in column.values]
+            return np.array(data, dtype=np.float64) if np is not None else array('d', data)
+        raise ValueError(f"Столбец {key} не является числовым")
+
+    def scaled(self, key: Union[int, str]) -> Tuple[Any, int]:
+        """Точные значения числового столбца: (целые, scale), значение = целое / 10**scale, NULL -> 0.
+
+        Для сумм денег без ошибок округления float; массив int64 numpy, если он установлен.
+        """
+        column = self._column(key)
+        if column.kind in ('int', 'decimal'):
+            values, scale = column.values, column.scale if column.kind == 'decimal' else 0
+        elif column.kind == 'bool':
+            values, scale = array('q', column.values), 0
+        elif column.kind == 'object' and all(
+                v is None or (isinstance(v, (int, Decimal)) and not isinstance(v, bool) and Decimal(v).is_finite())
+                for v in column.values):
+            scale = max([-v.as_tuple().exponent for v in column.values if isinstance(v, Decimal)] + [0])
+            try:
+                values = array('q', (0 if v is None else int(Decimal(v).scaleb(scale)) for v in column.values))
+            except OverflowError:
+                raise ValueError(f"Значения столбца {key} не помещаются в 64 бита")
+        else:
+            raise ValueError(f"Столбец {key} не является точным числовым")
+        if np is not None:
+            return np.frombuffer(values, dtype=np.int64), scale
+        return values, scale
+
+    def sum(self, key: Union[int, str]) -> Union[int, Decimal, float]:
+        column = self._column(key)
+        if column.kind in ('int', 'bool'):
+            return sum(column.values)
+        if column.kind == 'decimal':
+            return Decimal(sum(column.values)).scaleb(-column.scale)
+        if column.kind in ('float', 'object'):
+            return sum(v for v, null in zip(column.values, column.nulls) if not null)
+        raise ValueError(f"Столбец {key} не является числовым")
+
+    def nbytes(self) -> int:
+        return sum(column.nbytes() for column in self._columns)
@@ -41,6 +41,7 @@ class CustomTypesManager:
         try:
             cursor.execute(query)
             self.db_manager.connection.commit()
+            self.db_manager.register_types()
             self.logger.info(f"Composite type {type_name} created")
             return True
         except Exception as e:
@@ -57,6 +58,8 @@ class CustomTypesManager:
         try:
             cursor.execute(query)
             self.db_manager.connection.commit()
+            # CASCADE мог удалить столбцы этого типа
+            self.db_manager.invalidate_prepared()
             self.logger.info(f"Type {type_name} dropped")
             return True
         except Exception as e:
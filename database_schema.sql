@@ -27,6 +27,27 @@ CREATE TABLE exchange_rates (
     CHECK (base_currency != target_currency)
 );
 
+CREATE TABLE exchange_rate_ohlc (
+    base_currency VARCHAR(3) NOT NULL,
+    target_currency VARCHAR(3) NOT NULL,
+    bucket VARCHAR(6) NOT NULL CHECK (bucket IN ('minute', 'hour', 'day')),
+    bucket_start TIMESTAMP NOT NULL,
+    buy_open NUMERIC(12, 6) NOT NULL,
+    buy_high NUMERIC(12, 6) NOT NULL,
+    buy_low NUMERIC(12, 6) NOT NULL,
+    buy_close NUMERIC(12, 6) NOT NULL,
+    sell_open NUMERIC(12, 6) NOT NULL,
+    sell_high NUMERIC(12, 6) NOT NULL,
+    sell_low NUMERIC(12, 6) NOT NULL,
+    sell_close NUMERIC(12, 6) NOT NULL,
+    first_rate_date TIMESTAMP NOT NULL,
+    last_rate_date TIMESTAMP NOT NULL,
+    tick_count INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (base_currency, target_currency, bucket, bucket_start),
+    FOREIGN KEY (base_currency) REFERENCES currencies(currency_code) ON DELETE RESTRICT ON UPDATE CASCADE,
+    FOREIGN KEY (target_currency) REFERENCES currencies(currency_code) ON DELETE RESTRICT ON UPDATE CASCADE
+);
+
 CREATE TABLE clients (
     client_id SERIAL PRIMARY KEY,
     full_name VARCHAR(150) NOT NULL,
@@ -53,6 +74,9 @@ CREATE TABLE currency_accounts (
     FOREIGN KEY (currency_code) REFERENCES currencies(currency_code) ON DELETE RESTRICT ON UPDATE CASCADE
 );
 
+-- Порядковые номера (последние 11 цифр) новых номеров счетов
+CREATE SEQUENCE account_number_seq START WITH 1000 MAXVALUE 99999999999;
+
 CREATE TABLE transactions (
     transaction_id SERIAL PRIMARY KEY,
     account_id INTEGER NOT NULL,
@@ -65,17 +89,170 @@ CREATE TABLE transactions (
     description TEXT,
     employee_name VARCHAR(100) NOT NULL,
     is_completed BOOLEAN NOT NULL DEFAULT TRUE,
+    request_key VARCHAR(64),
     FOREIGN KEY (account_id) REFERENCES currency_accounts(account_id) ON DELETE CASCADE ON UPDATE CASCADE,
     FOREIGN KEY (currency_code) REFERENCES currencies(currency_code) ON DELETE RESTRICT ON UPDATE CASCADE
 );
 
-CREATE INDEX idx_exchange_rates_currencies ON exchange_rates(base_currency, target_currency);
+CREATE TABLE transaction_events (
+    event_id BIGSERIAL PRIMARY KEY,
+    tx_id XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    transaction_id INTEGER NOT NULL,
+    event_type VARCHAR(30) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE outbox_consumers (
+    consumer_name VARCHAR(100) PRIMARY KEY,
+    last_tx_id XID8 NOT NULL DEFAULT '0',
+    last_event_id BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Файлы архива транзакций (Parquet, по месяцам); pending - строки файла еще удаляются из transactions
+CREATE TABLE transaction_archive_manifest (
+    file_name VARCHAR(200) PRIMARY KEY,
+    month DATE NOT NULL,
+    row_count INTEGER NOT NULL,
+    min_transaction_id INTEGER NOT NULL,
+    max_transaction_id INTEGER NOT NULL,
+    status VARCHAR(10) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'archived')),
+    archived_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Суммы архивированных проведенных транзакций по счетам (для сверки остатков)
+CREATE TABLE account_archived_balances (
+    account_id INTEGER PRIMARY KEY,
+    archived_total NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    archived_count INTEGER NOT NULL DEFAULT 0,
+    FOREIGN KEY (account_id) REFERENCES currency_accounts(account_id) ON DELETE CASCADE ON UPDATE CASCADE
+);
+
+CREATE TABLE pnl_daily_snapshots (
+    snapshot_date DATE NOT NULL,
+    currency_code VARCHAR(3) NOT NULL,
+    employee_name VARCHAR(100) NOT NULL,
+    net_position NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    bought_amount NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    sold_amount NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    spread_income NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    commission_income NUMERIC(18, 2) NOT NULL DEFAULT 0,
+    transactions_count INTEGER NOT NULL DEFAULT 0,
+    unpriced_count INTEGER NOT NULL DEFAULT 0,
+    formula_version SMALLINT NOT NULL DEFAULT 1,
+    computed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (snapshot_date, currency_code, employee_name),
+    FOREIGN KEY (currency_code) REFERENCES currencies(currency_code) ON DELETE RESTRICT ON UPDATE CASCADE
+);
+
+CREATE INDEX idx_exchange_rates_pair_date ON exchange_rates(base_currency, target_currency, rate_date DESC);
 CREATE INDEX idx_exchange_rates_date ON exchange_rates(rate_date);
 CREATE INDEX idx_accounts_client ON currency_accounts(client_id);
 CREATE INDEX idx_accounts_currency ON currency_accounts(currency_code);
 CREATE INDEX idx_transactions_account ON transactions(account_id);
 CREATE INDEX idx_transactions_date ON transactions(transaction_date);
 CREATE INDEX idx_transactions_type ON transactions(transaction_type);
+CREATE INDEX idx_archive_manifest_month ON transaction_archive_manifest(month);
+CREATE UNIQUE INDEX idx_transactions_request_key ON transactions(request_key) WHERE request_key IS NOT NULL;
+CREATE INDEX idx_transaction_events_order ON transaction_events(tx_id, event_id);
+
+-- Свертка курсов в OHLC по минутам, часам и дням при каждой вставке курса
+CREATE OR REPLACE FUNCTION rollup_exchange_rate() RETURNS TRIGGER AS $$
+DECLARE
+    bucket_name TEXT;
+BEGIN
+    FOREACH bucket_name IN ARRAY ARRAY['minute', 'hour', 'day'] LOOP
+        INSERT INTO exchange_rate_ohlc AS o (base_currency, target_currency, bucket, bucket_start,
+                                             buy_open, buy_high, buy_low, buy_close,
+                                             sell_open, sell_high, sell_low, sell_close,
+                                             first_rate_date, last_rate_date, tick_count)
+        VALUES (NEW.base_currency, NEW.target_currency, bucket_name, date_trunc(bucket_name, NEW.rate_date),
+                NEW.buy_rate, NEW.buy_rate, NEW.buy_rate, NEW.buy_rate,
+                NEW.sell_rate, NEW.sell_rate, NEW.sell_rate, NEW.sell_rate,
+                NEW.rate_date, NEW.rate_date, 1)
+        ON CONFLICT (base_currency, target_currency, bucket, bucket_start) DO UPDATE SET
+            buy_open = CASE WHEN EXCLUDED.first_rate_date < o.first_rate_date THEN EXCLUDED.buy_open ELSE o.buy_open END,
+            buy_high = GREATEST(o.buy_high, EXCLUDED.buy_high),
+            buy_low = LEAST(o.buy_low, EXCLUDED.buy_low),
+            buy_close = CASE WHEN EXCLUDED.last_rate_date >= o.last_rate_date THEN EXCLUDED.buy_close ELSE o.buy_close END,
+            sell_open = CASE WHEN EXCLUDED.first_rate_date < o.first_rate_date THEN EXCLUDED.sell_open ELSE o.sell_open END,
+            sell_high = GREATEST(o.sell_high, EXCLUDED.sell_high),
+            sell_low = LEAST(o.sell_low, EXCLUDED.sell_low),
+            sell_close = CASE WHEN EXCLUDED.last_rate_date >= o.last_rate_date THEN EXCLUDED.sell_close ELSE o.sell_close END,
+            first_rate_date = LEAST(o.first_rate_date, EXCLUDED.first_rate_date),
+            last_rate_date = GREATEST(o.last_rate_date, EXCLUDED.last_rate_date),
+            tick_count = o.tick_count + 1;
+    END LOOP;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_exchange_rates_ohlc
+AFTER INSERT ON exchange_rates
+FOR EACH ROW EXECUTE FUNCTION rollup_exchange_rate();
+
+-- Запись события в outbox в той же транзакции, что и вставка транзакции
+CREATE OR REPLACE FUNCTION record_transaction_event() RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO transaction_events (transaction_id, event_type, payload)
+    VALUES (NEW.transaction_id, 'transaction_created', to_jsonb(NEW));
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_transactions_outbox
+AFTER INSERT ON transactions
+FOR EACH ROW EXECUTE FUNCTION record_transaction_event();
+
+-- Уведомления об изменениях строк: канал bank_system_changes,
+-- payload {"table", "op", "ids"}; первичный ключ передается аргументом триггера
+CREATE OR REPLACE FUNCTION notify_table_change() RETURNS TRIGGER AS $$
+DECLARE
+    ids BIGINT[];
+    i INTEGER := 1;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        EXECUTE format('SELECT array_agg(%I) FROM old_rows', TG_ARGV[0]) INTO ids;
+    ELSE
+        EXECUTE format('SELECT array_agg(%I) FROM new_rows', TG_ARGV[0]) INTO ids;
+    END IF;
+    -- Пачки по 500 ключей, чтобы не превысить лимит размера NOTIFY
+    WHILE ids IS NOT NULL AND i <= array_length(ids, 1) LOOP
+        PERFORM pg_notify('bank_system_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'ids', ids[i:i + 499])::text);
+        i := i + 500;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    t RECORD;
+BEGIN
+    FOR t IN SELECT * FROM (VALUES
+        ('currencies', 'currency_id'),
+        ('exchange_rates', 'rate_id'),
+        ('clients', 'client_id'),
+        ('currency_accounts', 'account_id'),
+        ('transactions', 'transaction_id')
+    ) AS v(table_name, pk_column) LOOP
+        EXECUTE format('CREATE TRIGGER trg_%1$s_notify_insert AFTER INSERT ON %1$I
+                        REFERENCING NEW TABLE AS new_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change(%2$L)',
+                       t.table_name, t.pk_column);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_notify_update AFTER UPDATE ON %1$I
+                        REFERENCING NEW TABLE AS new_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change(%2$L)',
+                       t.table_name, t.pk_column);
+        EXECUTE format('CREATE TRIGGER trg_%1$s_notify_delete AFTER DELETE ON %1$I
+                        REFERENCING OLD TABLE AS old_rows
+                        FOR EACH STATEMENT EXECUTE FUNCTION notify_table_change(%2$L)',
+                       t.table_name, t.pk_column);
+    END LOOP;
+END;
+$$;
 
 INSERT INTO currencies (currency_code, currency_name, symbol, is_active) VALUES
 ('RUB', 'Российский рубль', '₽', TRUE),
@@ -106,22 +283,22 @@ INSERT INTO clients (full_name, passport_number, phone, email, birth_date, is_vi
 ('Новикова Ольга Александровна', '4517 567890', '+7-905-345-6789', 'novikova@yandex.ru', '1983-12-08', TRUE, ARRAY['BUY','SELL','TRANSFER','DEPOSIT']::transaction_type[]);
 
 INSERT INTO currency_accounts (client_id, currency_code, account_number, balance, account_status) VALUES
-(1, 'RUB', '40817810100000000001', 250000.00, 'ACTIVE'),
-(1, 'USD', '40817840100000000001', 5000.00, 'ACTIVE'),
-(1, 'EUR', '40817978100000000001', 3000.00, 'ACTIVE'),
-(2, 'RUB', '40817810200000000002', 180000.00, 'ACTIVE'),
-(2, 'USD', '40817840200000000002', 2000.00, 'ACTIVE'),
-(3, 'RUB', '40817810300000000003', 520000.00, 'ACTIVE'),
+(1, 'RUB', '40817810400000000001', 250000.00, 'ACTIVE'),
+(1, 'USD', '40817840700000000001', 5000.00, 'ACTIVE'),
+(1, 'EUR', '40817978300000000001', 3000.00, 'ACTIVE'),
+(2, 'RUB', '40817810700000000002', 180000.00, 'ACTIVE'),
+(2, 'USD', '40817840000000000002', 2000.00, 'ACTIVE'),
+(3, 'RUB', '40817810000000000003', 520000.00, 'ACTIVE'),
 (3, 'USD', '40817840300000000003', 10000.00, 'ACTIVE'),
-(3, 'EUR', '40817978300000000003', 8000.00, 'ACTIVE'),
-(3, 'GBP', '40817826300000000003', 2500.00, 'ACTIVE'),
-(4, 'RUB', '40817810400000000004', 95000.00, 'ACTIVE'),
-(4, 'EUR', '40817978400000000004', 1500.00, 'ACTIVE'),
-(5, 'RUB', '40817810500000000005', 75000.00, 'ACTIVE'),
-(5, 'USD', '40817840500000000005', 800.00, 'ACTIVE'),
-(6, 'RUB', '40817810600000000006', 420000.00, 'ACTIVE'),
-(6, 'USD', '40817840600000000006', 7500.00, 'ACTIVE'),
-(6, 'EUR', '40817978600000000006', 5000.00, 'BLOCKED');
+(3, 'EUR', '40817978900000000003', 8000.00, 'ACTIVE'),
+(3, 'GBP', '40817826900000000003', 2500.00, 'ACTIVE'),
+(4, 'RUB', '40817810300000000004', 95000.00, 'ACTIVE'),
+(4, 'EUR', '40817978200000000004', 1500.00, 'ACTIVE'),
+(5, 'RUB', '40817810600000000005', 75000.00, 'ACTIVE'),
+(5, 'USD', '40817840900000000005', 800.00, 'ACTIVE'),
+(6, 'RUB', '40817810900000000006', 420000.00, 'ACTIVE'),
+(6, 'USD', '40817840200000000006', 7500.00, 'ACTIVE'),
+(6, 'EUR', '40817978800000000006', 5000.00, 'BLOCKED');
 
 INSERT INTO transactions (account_id, transaction_type, amount, currency_code, exchange_rate, commission, transaction_date, description, employee_name, is_completed) VALUES
 (1, 'DEPOSIT', 250000.00, 'RUB', NULL, 0.00, '2024-09-01 10:30:00', 'Первоначальное пополнение счета', 'Иванов И.И.', TRUE),
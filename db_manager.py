@@ -1,11 +1,68 @@
 import psycopg2
 from psycopg2 import sql, errors
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INERROR, parse_dsn
+import json
 import logging
+import select
+import threading
+import time
+import copy
+import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Callable
+from columnar_result import ColumnarResult
+from script_runner import ScriptRunner
+from schema_bootstrap import SchemaBootstrap
+from query_builder import Select, DOLLAR, statement_name
+from type_adapters import TypeAdapterRegistry
+from permissions import PermissionCache
+from account_numbers import AccountNumberAllocator
+from report_session import ReportSession, bound_connection
+from transaction_archive import TransactionArchive
+from analytics_replica import TransactionReplica
 
 class DatabaseManager:
-    def __init__(self, host: str, port: int, database: str, user: str, password: str):
+    CHANGES_CHANNEL = 'bank_system_changes'
+
+    # Именованные профили параметров сеанса: {имя параметра: значение для set_config}
+    SESSION_PROFILES = {
+        # Короткие операции операциониста: быстрый отказ вместо долгого ожидания блокировок
+        'oltp': {
+            'statement_timeout': '5s',
+            'lock_timeout': '2s',
+            'synchronous_commit': 'on',
+        },
+        # Аналитические запросы: больше памяти на сортировки и хеши, параллельные планы, только чтение
+        'analytics': {
+            'work_mem': '256MB',
+            'max_parallel_workers_per_gather': '4',
+            'statement_timeout': '10min',
+            'transaction_read_only': 'on',
+        },
+    }
+
+    # Отставание реплики в секундах: 0, если все полученные изменения уже применены
+    REPLICA_LAG_QUERY = """
+        SELECT CASE WHEN NOT pg_is_in_recovery() THEN 0
+                    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+               END
+    """
+    REPLICA_LAG_CHECK_INTERVAL = 10.0
+    REPLICA_RETRY_INTERVAL = 30.0
+    # Сколько подготовленных операторов конструкторов держать на одном соединении
+    PREPARED_STATEMENTS_LIMIT = 200
+    DDL_PREFIXES = ('ALTER', 'CREATE', 'DROP', 'TRUNCATE')
+    # Столбцы database_schema.sql, которых нет в базах, развернутых его прошлыми версиями
+    SCHEMA_UPGRADE_COLUMNS = [
+        ('pnl_daily_snapshots', 'formula_version', 'SMALLINT NOT NULL DEFAULT 1'),
+    ]
+
+    def __init__(self, host: str, port: int, database: str, user: str, password: str,
+                 session_profile: Optional[str] = None, replica_dsns: Optional[List[str]] = None,
+                 max_replica_lag: float = 5.0, read_your_writes_window: float = 5.0,
+                 archive_dir: str = 'archive', replica_dir: str = 'analytics'):
         self.connection_params = {
             'host': host,
             'port': port,
@@ -15,8 +72,36 @@ class DatabaseManager:
         }
         self.connection: Optional[psycopg2.extensions.connection] = None
         self.logger = logging.getLogger('DatabaseManager')
+        self._change_callbacks: List[Callable[[str, str, List[int]], None]] = []
+        self._listener_lock = threading.Lock()
+        self._listener_stop = threading.Event()
+        self._listener_thread: Optional[threading.Thread] = None
+        self.session_profile = session_profile
+        self.active_profile: Optional[str] = None
+        self.max_replica_lag = max_replica_lag
+        self.read_your_writes_window = read_your_writes_window
+        self._replicas: List[Dict[str, Any]] = [
+            {'dsn': dsn, 'connection': None, 'lag': 0.0, 'lag_checked': 0.0, 'down_until': 0.0}
+            for dsn in (replica_dsns or [])
+        ]
+        self._next_replica = 0
+        self._last_write = 0.0
+        self._running_connection = None
+        self._cancel_requested = False
+        self._preview_pool: Dict[str, Any] = {}
+        self._preview_lock = threading.Lock()
+        # Меняется при закрытии пула: соединения прежнего поколения в пул не возвращаются
+        self._preview_generation = 0
+        self._prepared: Dict[int, Tuple[Any, Dict[str, str]]] = {}
+        self._prepared_stale: set = set()
+        self.type_adapters = TypeAdapterRegistry()
+        self.permissions = PermissionCache(self)
+        self.account_numbers = AccountNumberAllocator(self)
+        self.archive = TransactionArchive(self, archive_dir=archive_dir)
+        self.analytics_replica = TransactionReplica(self, replica_dir=replica_dir)
         
     def connect(self) -> bool:
+        self._close_preview_connections()
         try:
             self.connection = psycopg2.connect(**self.connection_params, options="-c client_encoding=UTF8")
             self.connection.autocommit = False
@@ -25,7 +110,7 @@ class DatabaseManager:
                 cursor.execute("SET search_path TO bank_system, public;")
                 cursor.close()
             except Exception as e:
-                self.logger.warning(f"Could not set search_path to bank_system: {e}")
+                self.logger.warning("Could not set search_path to bank_system: %s", e)
 
             try:
                 cursor = self.connection.cursor()
@@ -38,18 +123,12 @@ class DatabaseManager:
                     schema_path = os.path.join(os.path.dirname(__file__), 'database_schema.sql')
                     if os.path.exists(schema_path):
                         try:
+                            self.logger.info("bank_system schema missing — applying %s", schema_path)
                             try:
-                                with open(schema_path, 'r', encoding='utf-8') as f:
-                                    sql_script = f.read()
+                                self.execute_script_file(schema_path)
                             except UnicodeDecodeError:
-                                try:
-                                    with open(schema_path, 'r', encoding='utf-8-sig') as f:
-                                        sql_script = f.read()
-                                except UnicodeDecodeError:
-                                    with open(schema_path, 'r', encoding='latin1') as f:
-                                        sql_script = f.read()
-                            self.logger.info(f"bank_system schema missing — applying {schema_path}")
-                            self.execute_script(sql_script)
+                                # Скрипт применяется в одной транзакции, поэтому его можно повторить
+                                self.execute_script_file(schema_path, encoding='latin1')
                             self.logger.info("Database schema applied successfully")
                             try:
                                 cursor = self.connection.cursor()
@@ -58,40 +137,627 @@ class DatabaseManager:
                             except Exception:
                                 pass
                         except Exception as e:
-                            self.logger.error(f"Failed to apply database schema from {schema_path}: {e}")
+                            self.logger.error("Failed to apply database schema from %s: %s", schema_path, e)
                     else:
-                        self.logger.warning(f"bank_system schema does not exist and schema file not found at {schema_path}")
+                        self.logger.warning("bank_system schema does not exist and schema file not found at %s", schema_path)
             except Exception:
                 self.logger.debug("Could not verify or create bank_system schema after connect")
 
-            self.logger.info(f"Connected to database {self.connection_params['database']}")
+            try:
+                self.upgrade_schema()
+            except Exception as e:
+                self.logger.warning("Schema upgrade skipped: %s", e)
+
+            self.register_types()
+            self.permissions.invalidate()
+            self.account_numbers.reset()
+            self.archive.reset()
+            self.analytics_replica.reset()
+
+            if self.session_profile:
+                self.apply_session_profile(self.session_profile)
+
+            self.logger.info("Connected to database %s", self.connection_params['database'])
             return True
         except psycopg2.OperationalError as e:
-            self.logger.error(f"Connection failed: {e}")
+            self.logger.error("Connection failed: %s", e)
             raise ConnectionError(f"Не удалось подключиться к базе данных: {e}")
         except Exception as e:
-            self.logger.error(f"Unexpected connection error: {e}")
+            self.logger.error("Unexpected connection error: %s", e)
             raise
     
+    def upgrade_schema(self):
+        """Доведение базы, развернутой прошлой версией database_schema.sql, до текущей.
+
+        DDL выполняется здесь, при подключении, а не в рабочих транзакциях.
+        """
+        for table, column, definition in self.SCHEMA_UPGRADE_COLUMNS:
+            exists = self.execute_query(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_schema = 'bank_system' AND table_name = %s AND column_name = %s",
+                (table, column)
+            )
+            if not exists:
+                self.execute_query(f"ALTER TABLE bank_system.{table} ADD COLUMN IF NOT EXISTS {column} {definition}")
+                self.logger.info("Added column %s.%s", table, column)
+        self.account_numbers.ensure_sequence()
+        self.connection.commit()
+
+    def _profile_settings(self, profile: str) -> Dict[str, str]:
+        if profile not in self.SESSION_PROFILES:
+            raise ValueError(f"Неизвестный профиль сеанса: {profile}")
+        return self.SESSION_PROFILES[profile]
+
+    def _set_session_settings(self, cursor, profile: str):
+        for name, value in self._profile_settings(profile).items():
+            # На уровне сеанса режим чтения задается для всех последующих транзакций
+            if name == 'transaction_read_only':
+                name = 'default_transaction_read_only'
+            cursor.execute("SELECT set_config(%s, %s, false)", (name, value))
+
+    def apply_session_profile(self, profile: str):
+        """Установка профиля для всего сеанса (до переподключения)"""
+        cursor = self.connection.cursor()
+        try:
+            self._set_session_settings(cursor, profile)
+            self.connection.commit()
+            self.logger.info("Session profile '%s' applied", profile)
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def session(self, profile: str):
+        """Профиль для одной транзакции (SET LOCAL).
+
+        Открытая транзакция чтения перед входом фиксируется, чтобы параметры
+        (включая режим только для чтения) действовали с начала новой транзакции.
+        Параметры сбрасываются при commit/rollback, в том числе выполненных
+        внутри вызываемых методов; вложенный вызов оставляет внешний профиль.
+        """
+        if not self.connection:
+            raise ConnectionError("Database connection is not established. Call connect() first.")
+        settings = self._profile_settings(profile)
+        if self.active_profile is not None:
+            yield
+            return
+        if self.connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            self.connection.commit()
+        cursor = self.connection.cursor()
+        try:
+            for name, value in settings.items():
+                cursor.execute("SELECT set_config(%s, %s, true)", (name, value))
+        except Exception:
+            self.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.active_profile = profile
+        try:
+            yield
+        except Exception:
+            self.connection.rollback()
+            raise
+        else:
+            if self.connection.get_transaction_status() == TRANSACTION_STATUS_INERROR:
+                self.connection.rollback()
+            else:
+                self.connection.commit()
+        finally:
+            self.active_profile = None
+
+    def _mark_write(self):
+        """Отметка записи: чтения в течение read_your_writes_window идут на основной сервер"""
+        self._last_write = time.monotonic()
+
+    def _replica_connection(self, replica: Dict[str, Any]):
+        conn = replica['connection']
+        if conn is None or conn.closed:
+            params = {'dbname': self.connection_params['database'], 'user': self.connection_params['user'],
+                      'password': self.connection_params['password'], 'port': self.connection_params['port']}
+            params.update(parse_dsn(replica['dsn']))
+            conn = psycopg2.connect(**params, options="-c client_encoding=UTF8")
+            conn.autocommit = True
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SET search_path TO bank_system, public;")
+                self._set_session_settings(cursor, 'analytics')
+            finally:
+                cursor.close()
+            self.type_adapters.register(conn)
+            replica['connection'] = conn
+            replica['lag_checked'] = 0.0
+            self.logger.info("Connected to read replica %s:%s", conn.info.host, conn.info.port)
+        now = time.monotonic()
+        if now - replica['lag_checked'] >= self.REPLICA_LAG_CHECK_INTERVAL:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.REPLICA_LAG_QUERY)
+                replica['lag'] = float(cursor.fetchone()[0])
+            finally:
+                cursor.close()
+            replica['lag_checked'] = now
+        return conn
+
+    def register_types(self):
+        """Преобразователи ENUM и составных типов схемы на основном соединении и открытых репликах.
+
+        Пул соединений предпросмотра закрывается: новые соединения регистрируют
+        типы при открытии, а занятые сейчас не вернутся в пул.
+        """
+        self._close_preview_connections()
+        connections = [self.connection] + [r['connection'] for r in self._replicas
+                                           if r['connection'] is not None and not r['connection'].closed]
+        for conn in connections:
+            try:
+                self.type_adapters.register(conn)
+            except psycopg2.Error as e:
+                if not conn.autocommit:
+                    conn.rollback()
+                self.logger.warning("Could not register type adapters: %s", e)
+
+    def _mark_replica_down(self, replica: Dict[str, Any], error: Exception):
+        conn = replica['connection']
+        replica['connection'] = None
+        self.forget_prepared(conn)
+        replica['down_until'] = time.monotonic() + self.REPLICA_RETRY_INTERVAL
+        if conn is not None and not conn.closed:
+            conn.close()
+        self.logger.warning("Read replica %s unavailable, using primary: %s", replica['dsn'], error)
+
+    def _read_connection(self):
+        """Соединение для чтения: следующая по кругу доступная реплика с допустимым отставанием.
+
+        Основное соединение используется, если реплик нет, все недоступны или
+        отстают, а также сразу после записи (чтение своих изменений).
+        """
+        if not self._replicas or time.monotonic() - self._last_write < self.read_your_writes_window:
+            return self.connection
+        for _ in range(len(self._replicas)):
+            replica = self._replicas[self._next_replica]
+            self._next_replica = (self._next_replica + 1) % len(self._replicas)
+            if replica['down_until'] > time.monotonic():
+                continue
+            try:
+                conn = self._replica_connection(replica)
+            except psycopg2.Error as e:
+                self._mark_replica_down(replica, e)
+                continue
+            if replica['lag'] > self.max_replica_lag:
+                self.logger.warning("Read replica %s lags %.1fs, skipping", replica['dsn'], replica['lag'])
+                continue
+            return conn
+        return self.connection
+
+    def _with_read_connection(self, run: Callable[[Any], Any]):
+        """Вызов run(conn) на реплике с повтором на основном сервере при ее отказе.
+
+        Чтение на основном соединении вне открытой транзакции сразу завершается,
+        чтобы соединение не оставалось idle in transaction со снимком и блокировками.
+        При ошибке откатывается соединение, на котором она произошла; транзакция
+        отчетного снимка не откатывается (иначе следующие чтения прошли бы уже вне
+        снимка) и остается прерванной до закрытия ReportSession.
+        """
+        snapshot = bound_connection(self)
+        if snapshot is not None:
+            return run(snapshot)
+        conn = self._read_connection()
+        if conn is not self.connection:
+            try:
+                return run(conn)
+            except errors.QueryCanceled:
+                raise
+            except (psycopg2.OperationalError, psycopg2.InterfaceError, errors.SerializationFailure) as e:
+                self._mark_replica_down(next(r for r in self._replicas if r['connection'] is conn), e)
+        conn = self.connection
+        finish = not conn.autocommit and conn.get_transaction_status() == TRANSACTION_STATUS_IDLE
+        try:
+            result = run(conn)
+        except psycopg2.Error:
+            if not conn.autocommit:
+                conn.rollback()
+            raise
+        if finish:
+            conn.commit()
+        return result
+
+    def _run_read(self, query: str, params, fetch: Callable[[Any], Any]):
+        """Выполнение читающего запроса на реплике или основном сервере"""
+        def run(conn):
+            cursor = conn.cursor()
+            try:
+                cursor.execute(query, params)
+                return fetch(cursor)
+            finally:
+                cursor.close()
+        return self._with_read_connection(run)
+
+    def _read_columnar(self, query: str, params=None) -> ColumnarResult:
+        return self._run_read(query, params, ColumnarResult.from_cursor)
+
+    def execute_read(self, query: str, params: tuple = None) -> List[Tuple]:
+        """Читающий запрос с маршрутизацией на реплики; результат как у execute_query"""
+        try:
+            results = self._run_read(query, params, lambda cursor: cursor.fetchall())
+            self.logger.info("Read query returned %d rows", len(results))
+            return results
+        except psycopg2.Error as e:
+            self.logger.error("Database error: %s", e)
+            raise ValueError(f"Ошибка выполнения запроса: {e.pgerror}")
+
+    def report_session(self, workers: int = 4) -> ReportSession:
+        """Согласованный снимок для отчета из нескольких запросов: with db.report_session() as report: ..."""
+        if not self.connection:
+            raise ConnectionError("Database connection is not established. Call connect() first.")
+        return ReportSession(self, workers=workers)
+
+    def render_sql(self, query: sql.Composable) -> str:
+        """Текст составного запроса для показа пользователю или DDL"""
+        return query.as_string(self.connection)
+
+    def _execute_prepared(self, conn, cursor, query: Select):
+        """EXECUTE запроса конструктора; PREPARE выполняется один раз на соединение и текст запроса"""
+        composed, params = query.compile(DOLLAR)
+        text = composed.as_string(conn)
+        owner, statements = self._prepared.get(id(conn), (None, None))
+        stale = id(conn) in self._prepared_stale
+        self._prepared_stale.discard(id(conn))
+        if owner is not conn:
+            statements = {}
+            self._prepared[id(conn)] = (conn, statements)
+        elif stale and statements:
+            # После DDL закэшированный план мог поменять тип результата
+            cursor.execute("DEALLOCATE ALL")
+            statements.clear()
+        name = statements.get(text)
+        if name is None:
+            if len(statements) >= self.PREPARED_STATEMENTS_LIMIT:
+                cursor.execute("DEALLOCATE ALL")
+                statements.clear()
+            name = statement_name(text)
+            cursor.execute(f"PREPARE {name} AS {text}")
+            statements[text] = name
+            self.logger.info("Prepared statement %s: %s", name, text)
+        if params:
+            cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def invalidate_prepared(self):
+        """Пересоздание подготовленных операторов всех соединений после DDL.
+
+        DEALLOCATE выполняется при следующем использовании соединения в его потоке.
+        """
+        self._prepared_stale.update(self._prepared)
+
+    def forget_prepared(self, conn):
+        """Удаление учета подготовленных операторов закрываемого соединения"""
+        self._prepared.pop(id(conn), None)
+        self._prepared_stale.discard(id(conn))
+
+    def execute_select(self, query: Select) -> Tuple[ColumnarResult, List[str]]:
+        """Запрос визуального конструктора через подготовленный оператор (чтение может идти с реплики)"""
+        if not self.connection:
+            raise ConnectionError("Database connection is not established. Call connect() first.")
+
+        def run(conn):
+            cursor = conn.cursor()
+            try:
+                self._execute_prepared(conn, cursor, query)
+                return ColumnarResult.from_cursor(cursor)
+            finally:
+                cursor.close()
+
+        try:
+            results = self._with_read_connection(run)
+        except psycopg2.Error as e:
+            self.logger.error("Query builder error: %s", e)
+            raise ValueError(f"Ошибка запроса: {e}")
+        self.logger.info("Query builder returned %d rows", len(results))
+        return results, results.column_names
+
+    def execute_preview(self, query, params: tuple = None, max_rows: Optional[int] = 1000,
+                        timeout_ms: Optional[int] = None) -> Tuple[ColumnarResult, List[str], bool]:
+        """Предпросмотр запроса (текст или Select): не более max_rows строк.
+
+        Текстовый запрос читается именованным курсором, который не дает серверу
+        передать, а клиенту - накопить весь результат; Select выполняется
+        подготовленным оператором с LIMIT. timeout_ms ограничивает время выполнения (SET LOCAL
+        statement_timeout); выполняющийся запрос прерывается из другого потока
+        через cancel_query(). Запрос идет по собственному соединению предпросмотра
+        (см. _run_preview). Возвращает (результат, колонки, обрезан ли результат).
+        """
+        if not self.connection:
+            raise ConnectionError("Database connection is not established. Call connect() first.")
+        self._cancel_requested = False
+        try:
+            results, truncated = self._run_preview(
+                lambda conn: self._fetch_preview(conn, query, params, max_rows, timeout_ms)
+            )
+        except errors.QueryCanceled:
+            if self._cancel_requested:
+                self.logger.info("Preview query cancelled by user")
+                raise ValueError("Запрос отменен пользователем")
+            self.logger.warning("Preview query timed out after %s ms", timeout_ms)
+            raise ValueError(f"Превышено время выполнения запроса ({(timeout_ms or 0) / 1000:g} с)")
+        except psycopg2.Error as e:
+            self.logger.error("Preview query error: %s", e)
+            raise ValueError(f"Ошибка запроса: {e}")
+        self.logger.info("Preview query returned %d rows%s", len(results), ' (truncated)' if truncated else '')
+        return results, results.column_names, truncated
+
+    def _preview_connection(self, dsn: Optional[str]) -> Tuple[Any, int]:
+        """Свободное соединение предпросмотра к реплике dsn или основному серверу (dsn=None)
+        и поколение пула, к которому оно относится"""
+        with self._preview_lock:
+            conn = self._preview_pool.pop(dsn or '', None)
+            generation = self._preview_generation
+        if conn is not None and not conn.closed:
+            return conn, generation
+        params = dict(self.connection_params)
+        if dsn:
+            params = {'dbname': params.pop('database'), **params}
+            params.update(parse_dsn(dsn))
+        conn = psycopg2.connect(**params, options="-c client_encoding=UTF8")
+        try:
+            conn.autocommit = True
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SET search_path TO bank_system, public;")
+                profile = 'analytics' if dsn else self.session_profile
+                if profile:
+                    self._set_session_settings(cursor, profile)
+            finally:
+                cursor.close()
+            self.type_adapters.register(conn)
+        except Exception:
+            conn.close()
+            raise
+        return conn, generation
+
+    def _release_preview_connection(self, dsn: Optional[str], conn, generation: int):
+        if conn.closed or conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            self._discard_preview_connection(conn)
+            return
+        with self._preview_lock:
+            if generation != self._preview_generation:
+                previous = conn
+            else:
+                previous = self._preview_pool.get(dsn or '')
+                self._preview_pool[dsn or ''] = conn
+        if previous is not None:
+            self._discard_preview_connection(previous)
+
+    def _discard_preview_connection(self, conn):
+        self.forget_prepared(conn)
+        if not conn.closed:
+            conn.close()
+
+    def _close_preview_connections(self):
+        with self._preview_lock:
+            connections, self._preview_pool = list(self._preview_pool.values()), {}
+            self._preview_generation += 1
+        for conn in connections:
+            self._discard_preview_connection(conn)
+
+    def _run_preview(self, run: Callable[[Any], Any]):
+        """Вызов run(conn) на отдельном соединении предпросмотра.
+
+        Соединения интерфейса (основное и реплик) не используются: фоновый
+        запрос не блокирует их и не прерывается их commit/rollback, а
+        cancel_query() отменяет только предпросмотр. Реплика выбирается по
+        последней известной проверке отставания, без запросов из фонового потока.
+        """
+        now = time.monotonic()
+        targets: List[Optional[str]] = []
+        if now - self._last_write >= self.read_your_writes_window:
+            targets = [r['dsn'] for r in self._replicas
+                       if r['down_until'] <= now and r['lag'] <= self.max_replica_lag]
+        for dsn in targets + [None]:
+            try:
+                conn, generation = self._preview_connection(dsn)
+            except psycopg2.OperationalError as e:
+                if dsn is None:
+                    raise
+                self.logger.warning("Preview connection to replica %s failed: %s", dsn, e)
+                continue
+            try:
+                result = run(conn)
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                self._discard_preview_connection(conn)
+                if dsn is None:
+                    raise
+                self.logger.warning("Preview on replica %s failed, retrying on primary: %s", dsn, e)
+                continue
+            except Exception:
+                self._release_preview_connection(dsn, conn, generation)
+                raise
+            self._release_preview_connection(dsn, conn, generation)
+            return result
+
+    def _fetch_preview(self, conn, query: str, params, max_rows: Optional[int],
+                       timeout_ms: Optional[int]) -> Tuple[ColumnarResult, bool]:
+        # Именованный курсор существует только внутри транзакции
+        autocommit = conn.autocommit
+        if autocommit:
+            conn.autocommit = False
+        self._running_connection = conn
+        try:
+            if timeout_ms:
+                cursor = conn.cursor()
+                cursor.execute("SELECT set_config('statement_timeout', %s, true)", (f"{int(timeout_ms)}ms",))
+                cursor.close()
+            if isinstance(query, Select):
+                # Запрос конструктора: лимит передается параметром LIMIT подготовленного оператора
+                query = copy.copy(query)
+                query.limit = max_rows + 1 if max_rows else None
+                cursor = conn.cursor()
+                try:
+                    self._execute_prepared(conn, cursor, query)
+                    rows = cursor.fetchall()
+                    names = [desc[0] for desc in cursor.description or []]
+                finally:
+                    cursor.close()
+            else:
+                cursor = conn.cursor(name=f"preview_{uuid.uuid4().hex}")
+                try:
+                    cursor.execute(query, params)
+                    rows = cursor.fetchmany(max_rows + 1) if max_rows else cursor.fetchall()
+                    names = [desc[0] for desc in cursor.description or []]
+                finally:
+                    cursor.close()
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._running_connection = None
+            if autocommit:
+                conn.autocommit = True
+        truncated = bool(max_rows) and len(rows) > max_rows
+        if truncated:
+            rows = rows[:max_rows]
+        return ColumnarResult.from_rows(rows, names), truncated
+
+    def cancel_query(self):
+        """Отмена выполняющегося предпросмотра; вызывается из потока интерфейса"""
+        conn = self._running_connection
+        if conn is not None:
+            self._cancel_requested = True
+            conn.cancel()
+
     def disconnect(self):
+        self.stop_listener()
+        self._close_preview_connections()
+        for replica in self._replicas:
+            if replica['connection'] is not None:
+                replica['connection'].close()
+                replica['connection'] = None
+        self._prepared.clear()
+        self._prepared_stale.clear()
         if self.connection:
             self.connection.close()
             self.logger.info("Database connection closed")
             self.connection = None
     
+    def add_change_listener(self, callback: Callable[[str, str, List[int]], None]):
+        """Подписка на изменения строк: callback(table, op, ids) вызывается из потока слушателя"""
+        with self._listener_lock:
+            if callback not in self._change_callbacks:
+                self._change_callbacks.append(callback)
+        self.start_listener()
+
+    def remove_change_listener(self, callback: Callable[[str, str, List[int]], None]):
+        with self._listener_lock:
+            if callback in self._change_callbacks:
+                self._change_callbacks.remove(callback)
+            idle = not self._change_callbacks
+        if idle:
+            self.stop_listener()
+
+    def start_listener(self):
+        """Запуск потока LISTEN на отдельном соединении (основное соединение не блокируется)"""
+        if self._listener_thread and self._listener_thread.is_alive():
+            return
+        listen_conn = psycopg2.connect(**self.connection_params, options="-c client_encoding=UTF8")
+        listen_conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        cursor = listen_conn.cursor()
+        cursor.execute(f"LISTEN {self.CHANGES_CHANNEL};")
+        cursor.close()
+        self._listener_stop.clear()
+        self._listener_thread = threading.Thread(
+            target=self._listen, args=(listen_conn,), name='db-change-listener', daemon=True
+        )
+        self._listener_thread.start()
+        self.logger.info("Listening for changes on channel %s", self.CHANGES_CHANNEL)
+
+    def is_listening(self) -> bool:
+        return self._listener_thread is not None and self._listener_thread.is_alive()
+
+    def stop_listener(self):
+        if not self._listener_thread:
+            return
+        self._listener_stop.set()
+        self._listener_thread.join(timeout=2)
+        self._listener_thread = None
+        self.logger.info("Change listener stopped")
+
+    def _listen(self, listen_conn):
+        try:
+            while not self._listener_stop.is_set():
+                if select.select([listen_conn], [], [], 1.0) == ([], [], []):
+                    continue
+                listen_conn.poll()
+                # Подряд идущие уведомления об одной операции над таблицей объединяются
+                changes: List[Tuple[str, str, List[int]]] = []
+                while listen_conn.notifies:
+                    notify = listen_conn.notifies.pop(0)
+                    try:
+                        change = json.loads(notify.payload)
+                    except ValueError:
+                        self.logger.warning("Malformed change notification: %s", notify.payload)
+                        continue
+                    if changes and changes[-1][:2] == (change['table'], change['op']):
+                        changes[-1][2].extend(change['ids'])
+                    else:
+                        changes.append((change['table'], change['op'], list(change['ids'])))
+                with self._listener_lock:
+                    callbacks = list(self._change_callbacks)
+                for table, op, ids in changes:
+                    for callback in callbacks:
+                        try:
+                            callback(table, op, ids)
+                        except Exception as e:
+                            self.logger.error("Change listener callback error: %s", e)
+        except Exception as e:
+            self.logger.error("Change listener stopped with error: %s", e)
+        finally:
+            listen_conn.close()
+
     def execute_script(self, sql_script: str) -> bool:
         cursor = None
         try:
             cursor = self.connection.cursor()
             cursor.execute(sql_script)
             self.connection.commit()
+            self.invalidate_prepared()
             self.logger.info("SQL script executed successfully")
             return True
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Failed to execute SQL script: {e}")
+            self.logger.error("Failed to execute SQL script: %s", e)
             raise
             
+    def execute_script_file(self, path: str, encoding: str = 'utf-8-sig',
+                            progress: Optional[Callable[[int, int, int], None]] = None,
+                            commit_every: Optional[int] = None, parallel_indexes: int = 0) -> int:
+        """Потоковое применение SQL-файла любого размера; возвращает число операторов"""
+        if not self.connection:
+            raise ConnectionError("Database connection is not established. Call connect() first.")
+        try:
+            return ScriptRunner(self).run_file(
+                path, encoding, progress=progress, commit_every=commit_every, parallel_indexes=parallel_indexes
+            )
+        finally:
+            # Часть операторов могла примениться и при ошибке
+            self.invalidate_prepared()
+
+    def bootstrap_schema(self, path: str, workers: int = 4,
+                         progress: Optional[Callable[[int, int, int], None]] = None) -> List[Tuple[str, float]]:
+        """Развертывание схемы с данными: загрузка, параллельные индексы, ANALYZE; возвращает время шагов"""
+        if not self.connection:
+            raise ConnectionError("Database connection is not established. Call connect() first.")
+        timings = SchemaBootstrap(self, workers=workers).run(path, progress=progress)
+        self.invalidate_prepared()
+        self.register_types()
+        self.permissions.invalidate()
+        self.account_numbers.reset()
+        self.archive.reset()
+        self.analytics_replica.reset()
+        return timings
+
     def drop_schema(self) -> bool:
         if not self.connection:
             raise ConnectionError("Database connection is not established. Call connect() first.")
@@ -100,31 +766,36 @@ class DatabaseManager:
             cursor = self.connection.cursor()
             cursor.execute("DROP SCHEMA IF EXISTS bank_system CASCADE;")
             self.connection.commit()
+            self.invalidate_prepared()
+            self.permissions.invalidate()
+            self.account_numbers.reset()
+            self.archive.reset()
+            self.analytics_replica.reset()
             self.logger.info("bank_system schema dropped successfully")
             return True
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Failed to drop bank_system schema: {e}")
+            self.logger.error("Failed to drop bank_system schema: %s", e)
             raise
         except errors.UniqueViolation as e:
             self.connection.rollback()
-            self.logger.error(f"UNIQUE constraint violation: {e}")
+            self.logger.error("UNIQUE constraint violation: %s", e)
             raise ValueError(f"Нарушение уникальности: {e.diag.message_detail or e.pgerror}")
         except errors.NotNullViolation as e:
             self.connection.rollback()
-            self.logger.error(f"NOT NULL constraint violation: {e}")
+            self.logger.error("NOT NULL constraint violation: %s", e)
             raise ValueError(f"Обязательное поле не заполнено: {e.diag.column_name}")
         except errors.CheckViolation as e:
             self.connection.rollback()
-            self.logger.error(f"CHECK constraint violation: {e}")
+            self.logger.error("CHECK constraint violation: %s", e)
             raise ValueError(f"Нарушение ограничения CHECK: {e.diag.message_primary}")
         except errors.ForeignKeyViolation as e:
             self.connection.rollback()
-            self.logger.error(f"FOREIGN KEY constraint violation: {e}")
+            self.logger.error("FOREIGN KEY constraint violation: %s", e)
             raise ValueError(f"Нарушение внешнего ключа: {e.diag.message_detail or e.pgerror}")
         except psycopg2.Error as e:
             self.connection.rollback()
-            self.logger.error(f"Database error: {e}")
+            self.logger.error("Database error: %s", e)
             raise ValueError(f"Ошибка базы данных: {e.pgerror}")
         finally:
             if cursor:
@@ -138,10 +809,15 @@ class DatabaseManager:
                 cursor.execute(query, params)
             else:
                 cursor.execute(query)
+            statement = query.lstrip().upper()
+            if not statement.startswith(('SELECT', 'SHOW')):
+                self._mark_write()
+            if statement.startswith(self.DDL_PREFIXES):
+                self.invalidate_prepared()
             
             if cursor.description:
                 results = cursor.fetchall()
-                self.logger.info(f"Query returned {len(results)} rows")
+                self.logger.info("Query returned %d rows", len(results))
                 return results
             
             self.connection.commit()
@@ -149,30 +825,30 @@ class DatabaseManager:
             return []
         except errors.UniqueViolation as e:
             self.connection.rollback()
-            self.logger.error(f"UNIQUE constraint violation: {e}")
+            self.logger.error("UNIQUE constraint violation: %s", e)
             raise ValueError(f"Запись с таким значением уже существует")
         except errors.NotNullViolation as e:
             self.connection.rollback()
-            self.logger.error(f"NOT NULL constraint violation: {e}")
+            self.logger.error("NOT NULL constraint violation: %s", e)
             raise ValueError(f"Поле '{e.diag.column_name}' обязательно для заполнения")
         except errors.CheckViolation as e:
             self.connection.rollback()
-            self.logger.error(f"CHECK constraint violation: {e}")
+            self.logger.error("CHECK constraint violation: %s", e)
             raise ValueError(f"Значение не соответствует ограничению: {e.diag.constraint_name}")
         except errors.ForeignKeyViolation as e:
             self.connection.rollback()
-            self.logger.error(f"FOREIGN KEY constraint violation: {e}")
+            self.logger.error("FOREIGN KEY constraint violation: %s", e)
             if 'is still referenced' in str(e):
                 raise ValueError(f"Невозможно удалить: на эту запись ссылаются другие данные")
             else:
                 raise ValueError(f"Ссылка на несуществующую запись")
         except errors.InvalidTextRepresentation as e:
             self.connection.rollback()
-            self.logger.error(f"Invalid data type: {e}")
+            self.logger.error("Invalid data type: %s", e)
             raise ValueError(f"Неверный тип данных: проверьте формат введенных значений")
         except psycopg2.Error as e:
             self.connection.rollback()
-            self.logger.error(f"Database error: {e}")
+            self.logger.error("Database error: %s", e)
             raise ValueError(f"Ошибка выполнения запроса: {e.pgerror}")
         finally:
             if cursor:
@@ -192,7 +868,8 @@ class DatabaseManager:
             cursor.execute(query, (code, name, symbol, is_active))
             currency_id = cursor.fetchone()[0]
             self.connection.commit()
-            self.logger.info(f"Currency inserted with ID: {currency_id}")
+            self._mark_write()
+            self.logger.info("Currency inserted with ID: %s", currency_id)
             return currency_id
         except Exception as e:
             self.connection.rollback()
@@ -213,7 +890,8 @@ class DatabaseManager:
             cursor.execute(query, (base_currency, target_currency, buy_rate, sell_rate, updated_by))
             rate_id = cursor.fetchone()[0]
             self.connection.commit()
-            self.logger.info(f"Exchange rate inserted with ID: {rate_id}")
+            self._mark_write()
+            self.logger.info("Exchange rate inserted with ID: %s", rate_id)
             return rate_id
         except Exception as e:
             self.connection.rollback()
@@ -234,7 +912,8 @@ class DatabaseManager:
             cursor.execute(query, (full_name, passport, phone, email, birth_date, is_vip, allowed_ops))
             client_id = cursor.fetchone()[0]
             self.connection.commit()
-            self.logger.info(f"Client inserted with ID: {client_id}")
+            self._mark_write()
+            self.logger.info("Client inserted with ID: %s", client_id)
             return client_id
         except Exception as e:
             self.connection.rollback()
@@ -242,8 +921,11 @@ class DatabaseManager:
         finally:
             cursor.close()
     
-    def insert_account(self, client_id: int, currency_code: str, account_number: str,
+    def insert_account(self, client_id: int, currency_code: str, account_number: Optional[str],
                       balance: float, status: str) -> int:
+        """Открытие счета; без номера счета номер выдается из последовательности"""
+        if not account_number:
+            account_number = self.account_numbers.allocate(currency_code)
         query = """
             INSERT INTO bank_system.currency_accounts 
             (client_id, currency_code, account_number, balance, account_status)
@@ -255,7 +937,8 @@ class DatabaseManager:
             cursor.execute(query, (client_id, currency_code, account_number, balance, status))
             account_id = cursor.fetchone()[0]
             self.connection.commit()
-            self.logger.info(f"Account inserted with ID: {account_id}")
+            self._mark_write()
+            self.logger.info("Account inserted with ID: %s", account_id)
             return account_id
         except Exception as e:
             self.connection.rollback()
@@ -263,63 +946,188 @@ class DatabaseManager:
         finally:
             cursor.close()
     
+    def insert_accounts_batch(self, accounts: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        """Массовое открытие счетов одним запросом.
+
+        Каждый элемент - словарь с ключами client_id, currency_code и необязательными
+        account_number, balance, status. Недостающие номера выдаются из блока,
+        зарезервированного заранее на всю пачку. Возвращает [(account_id, номер счета)]
+        в порядке входных строк.
+        """
+        query = """
+            INSERT INTO bank_system.currency_accounts
+            (client_id, currency_code, account_number, balance, account_status)
+            SELECT client_id, currency_code, account_number, balance, account_status
+            FROM unnest(%s::integer[], %s::varchar[], %s::varchar[], %s::numeric[],
+                        %s::bank_system.account_status[])
+                 WITH ORDINALITY AS i(client_id, currency_code, account_number, balance, account_status, ord)
+            ORDER BY ord
+            RETURNING account_id, account_number
+        """
+        self.account_numbers.reserve(sum(1 for row in accounts if not row.get('account_number')))
+        numbers = [row.get('account_number') or self.account_numbers.allocate(row['currency_code'])
+                   for row in accounts]
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(query, (
+                [row['client_id'] for row in accounts],
+                [row['currency_code'] for row in accounts],
+                numbers,
+                [row.get('balance', 0) for row in accounts],
+                [row.get('status', 'ACTIVE') for row in accounts],
+            ))
+            ids = dict((number, account_id) for account_id, number in cursor.fetchall())
+            self.connection.commit()
+            self._mark_write()
+            self.logger.info("Account batch opened: %d rows", len(ids))
+            return [(ids[number], number) for number in numbers]
+        except Exception as e:
+            self.connection.rollback()
+            self.logger.error("Account batch error: %s", e)
+            raise
+        finally:
+            cursor.close()
+
     def insert_transaction(self, account_id: int, trans_type: str, amount: float,
                           currency_code: str, exchange_rate: Optional[float],
-                          commission: float, description: str, employee: str) -> int:
+                          commission: float, description: str, employee: str,
+                          request_key: Optional[str] = None) -> int:
+        """Проведение транзакции; повтор с тем же request_key возвращает ID исходной транзакции"""
         query = """
             INSERT INTO bank_system.transactions 
             (account_id, transaction_type, amount, currency_code, exchange_rate, 
-             commission, description, employee_name)
-            VALUES (%s, %s::bank_system.transaction_type, %s, %s, %s, %s, %s, %s)
+             commission, description, employee_name, request_key)
+            VALUES (%s, %s::bank_system.transaction_type, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (request_key) WHERE request_key IS NOT NULL DO NOTHING
             RETURNING transaction_id
         """
         cursor = self.connection.cursor()
         try:
+            self.permissions.check(account_id, trans_type)
             cursor.execute(query, (account_id, trans_type, amount, currency_code, 
-                                  exchange_rate, commission, description, employee))
-            trans_id = cursor.fetchone()[0]
+                                  exchange_rate, commission, description, employee, request_key))
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "SELECT transaction_id FROM bank_system.transactions WHERE request_key = %s",
+                    (request_key,)
+                )
+                trans_id = cursor.fetchone()[0]
+                self.connection.commit()
+                self.logger.info("Duplicate request key %s, returning transaction ID: %s", request_key, trans_id)
+                return trans_id
+            trans_id = row[0]
             self.connection.commit()
-            self.logger.info(f"Transaction inserted with ID: {trans_id}")
+            self._mark_write()
+            self.logger.info("Transaction inserted with ID: %s", trans_id)
             return trans_id
         except Exception as e:
             self.connection.rollback()
             raise
         finally:
             cursor.close()
+
+    def insert_transactions_batch(self, transactions: List[Dict[str, Any]], chunk_size: int = 5000) -> List[int]:
+        """Пакетное проведение транзакций одним запросом на пачку.
+
+        Каждый элемент - словарь с ключами account_id, trans_type, amount, currency_code,
+        exchange_rate, commission, description, employee и необязательным request_key.
+        Строки без ключа получают новый; строки с уже проведенным ключом не вставляются
+        повторно. Возвращает ID транзакций в порядке входных строк.
+        """
+        query = """
+            WITH input AS (
+                SELECT *
+                FROM unnest(%s::integer[], %s::bank_system.transaction_type[], %s::numeric[],
+                            %s::varchar[], %s::numeric[], %s::numeric[], %s::text[],
+                            %s::varchar[], %s::varchar[])
+                     WITH ORDINALITY AS i(account_id, transaction_type, amount, currency_code,
+                                          exchange_rate, commission, description,
+                                          employee_name, request_key, ord)
+            ),
+            inserted AS (
+                INSERT INTO bank_system.transactions
+                (account_id, transaction_type, amount, currency_code, exchange_rate,
+                 commission, description, employee_name, request_key)
+                SELECT account_id, transaction_type, amount, currency_code, exchange_rate,
+                       commission, description, employee_name, request_key
+                FROM input
+                ORDER BY ord
+                ON CONFLICT (request_key) WHERE request_key IS NOT NULL DO NOTHING
+                RETURNING transaction_id, request_key
+            )
+            SELECT i.ord, COALESCE(ins.transaction_id, t.transaction_id)
+            FROM input i
+            LEFT JOIN inserted ins ON ins.request_key = i.request_key
+            LEFT JOIN bank_system.transactions t ON t.request_key = i.request_key
+            ORDER BY i.ord
+        """
+        fields = ['account_id', 'trans_type', 'amount', 'currency_code', 'exchange_rate',
+                  'commission', 'description', 'employee', 'request_key']
+        ids: List[int] = []
+        cursor = self.connection.cursor()
+        try:
+            self.permissions.check_many((row['account_id'], row['trans_type']) for row in transactions)
+            for start in range(0, len(transactions), chunk_size):
+                chunk = transactions[start:start + chunk_size]
+                columns = [[row.get(field) for row in chunk] for field in fields]
+                columns[-1] = [key or str(uuid.uuid4()) for key in columns[-1]]
+                cursor.execute(query, tuple(columns))
+                ids.extend(row[1] for row in cursor.fetchall())
+            self.connection.commit()
+            self._mark_write()
+            self.logger.info("Transaction batch posted: %d rows", len(ids))
+            return ids
+        except Exception as e:
+            self.connection.rollback()
+            self.logger.error("Transaction batch error: %s", e)
+            raise
+        finally:
+            cursor.close()
     
-    def get_currencies(self) -> List[Tuple]:
+    def get_currencies(self, ids: List[int] = None) -> List[Tuple]:
+        if ids is not None:
+            query = "SELECT * FROM bank_system.currencies WHERE currency_id = ANY(%s) ORDER BY currency_code"
+            return self.execute_query(query, (list(ids),))
         query = "SELECT * FROM bank_system.currencies ORDER BY currency_code"
-        return self.execute_query(query)
+        return self.execute_read(query)
     
-    def get_exchange_rates(self, base_currency: str = None) -> List[Tuple]:
+    def get_exchange_rates(self, base_currency: str = None, ids: List[int] = None) -> List[Tuple]:
+        query = """
+            SELECT r.rate_id, r.base_currency, r.target_currency, 
+                   r.buy_rate, r.sell_rate, r.rate_date, r.updated_by
+            FROM bank_system.exchange_rates r
+            WHERE 1=1
+        """
+        params = []
+
         if base_currency and base_currency != "ALL":
-            query = """
-                SELECT r.rate_id, r.base_currency, r.target_currency, 
-                       r.buy_rate, r.sell_rate, r.rate_date, r.updated_by
-                FROM bank_system.exchange_rates r
-                WHERE r.base_currency = %s
-                ORDER BY r.rate_date DESC
-            """
-            return self.execute_query(query, (base_currency,))
-        else:
-            query = """
-                SELECT r.rate_id, r.base_currency, r.target_currency, 
-                       r.buy_rate, r.sell_rate, r.rate_date, r.updated_by
-                FROM bank_system.exchange_rates r
-                ORDER BY r.rate_date DESC
-            """
-            return self.execute_query(query)
-    
-    def get_clients(self) -> List[Tuple]:
+            query += " AND r.base_currency = %s"
+            params.append(base_currency)
+
+        if ids is not None:
+            query += " AND r.rate_id = ANY(%s)"
+            params.append(list(ids))
+
+        query += " ORDER BY r.rate_date DESC"
+
+        # Выборка по ids идет по уведомлению об изменении и должна видеть основной сервер
+        reader = self.execute_query if ids is not None else self.execute_read
+        return reader(query, tuple(params) if params else None)
+    
+    def get_clients(self, ids: List[int] = None) -> List[Tuple]:
         query = """
             SELECT client_id, full_name, passport_number, phone, email, 
                    registration_date, birth_date, is_vip, allowed_operations
             FROM bank_system.clients
-            ORDER BY full_name
         """
-        return self.execute_query(query)
+        if ids is not None:
+            query += " WHERE client_id = ANY(%s) ORDER BY full_name"
+            return self.execute_query(query, (list(ids),))
+        query += " ORDER BY full_name"
+        return self.execute_read(query)
     
-    def get_accounts(self, client_id: int = None, currency: str = None) -> List[Tuple]:
+    def get_accounts(self, client_id: int = None, currency: str = None, ids: List[int] = None) -> List[Tuple]:
         query = """
             SELECT a.account_id, c.full_name, a.currency_code, a.account_number,
                    a.balance, a.account_status, a.opened_date, a.last_transaction_date
@@ -336,13 +1144,19 @@ class DatabaseManager:
         if currency and currency != "ALL":
             query += " AND a.currency_code = %s"
             params.append(currency)
+
+        if ids is not None:
+            query += " AND a.account_id = ANY(%s)"
+            params.append(list(ids))
         
         query += " ORDER BY c.full_name, a.currency_code"
         
-        return self.execute_query(query, tuple(params) if params else None)
+        # Выборка по ids идет по уведомлению об изменении и должна видеть основной сервер
+        reader = self.execute_query if ids is not None else self.execute_read
+        return reader(query, tuple(params) if params else None)
     
     def get_transactions(self, account_id: int = None, trans_type: str = None,
-                        from_date: str = None, to_date: str = None) -> List[Tuple]:
+                        from_date: str = None, to_date: str = None, ids: List[int] = None) -> List[Tuple]:
         query = """
             SELECT t.transaction_id, c.full_name, a.account_number, 
                    t.transaction_type, t.amount, t.currency_code, t.exchange_rate,
@@ -369,10 +1183,19 @@ class DatabaseManager:
         if to_date:
             query += " AND t.transaction_date <= %s"
             params.append(to_date)
+
+        if ids is not None:
+            query += " AND t.transaction_id = ANY(%s)"
+            params.append(list(ids))
         
         query += " ORDER BY t.transaction_date DESC LIMIT 1000"
         
-        return self.execute_query(query, tuple(params) if params else None)
+        # Выборка по ids идет по уведомлению об изменении и должна видеть основной сервер
+        if ids is not None:
+            return self.execute_query(query, tuple(params))
+        results = self.execute_read(query, tuple(params) if params else None)
+        # Период может захватывать месяцы, перенесенные в архив
+        return self.archive.merge(results, account_id, trans_type, from_date, to_date, limit=1000)
     
     def get_client_balance_summary(self, client_id: int) -> List[Tuple]:
         query = """
@@ -383,7 +1206,7 @@ class DatabaseManager:
             GROUP BY a.currency_code
             ORDER BY a.currency_code
         """
-        return self.execute_query(query, (client_id,))
+        return self.execute_read(query, (client_id,))
         
     def drop_schema(self) -> bool:
         if not self.connection:
@@ -393,11 +1216,16 @@ class DatabaseManager:
             cursor = self.connection.cursor()
             cursor.execute("DROP SCHEMA IF EXISTS bank_system CASCADE;")
             self.connection.commit()
+            self.invalidate_prepared()
+            self.permissions.invalidate()
+            self.account_numbers.reset()
+            self.archive.reset()
+            self.analytics_replica.reset()
             self.logger.info("bank_system schema dropped successfully")
             return True
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Failed to drop bank_system schema: {e}")
+            self.logger.error("Failed to drop bank_system schema: %s", e)
             raise
     
     def get_tables_list(self) -> List[str]:
@@ -481,7 +1309,7 @@ class DatabaseManager:
     
     def execute_advanced_select(self, table_name: str, columns: List[str] = None,
                                where_clause: str = "", order_by: str = "",
-                               group_by: str = "", having: str = "") -> Tuple[List[Tuple], List[str]]:
+                               group_by: str = "", having: str = "") -> Tuple[ColumnarResult, List[str]]:
         select_cols = ", ".join(columns) if columns else "*"
         query = f"SELECT {select_cols} FROM bank_system.{table_name}"
         
@@ -497,21 +1325,16 @@ class DatabaseManager:
         if order_by:
             query += f" ORDER BY {order_by}"
         
-        cursor = self.connection.cursor()
         try:
-            cursor.execute(query)
-            results = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
+            results = self._read_columnar(query)
+            column_names = results.column_names
             return results, column_names
         except psycopg2.Error as e:
-            self.connection.rollback()
-            self.logger.error(f"Advanced select error: {e}")
+            self.logger.error("Advanced select error: %s", e)
             raise ValueError(f"Ошибка запроса: {e}")
-        finally:
-            cursor.close()
     
     def execute_text_search(self, table_name: str, column_name: str, 
-                           search_pattern: str, search_type: str = "LIKE") -> Tuple[List[Tuple], List[str]]:
+                           search_pattern: str, search_type: str = "LIKE") -> Tuple[ColumnarResult, List[str]]:
         if search_type == "LIKE":
             query = f"SELECT * FROM bank_system.{table_name} WHERE {column_name} LIKE %s"
             params = (search_pattern,)
@@ -539,21 +1362,16 @@ class DatabaseManager:
         else:
             raise ValueError(f"Неподдерживаемый тип поиска: {search_type}")
         
-        cursor = self.connection.cursor()
         try:
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
+            results = self._read_columnar(query, params)
+            column_names = results.column_names
             return results, column_names
         except psycopg2.Error as e:
-            self.connection.rollback()
-            self.logger.error(f"Search error: {e}")
+            self.logger.error("Search error: %s", e)
             raise ValueError(f"Ошибка поиска: {e}")
-        finally:
-            cursor.close()
     
     def execute_string_function(self, table_name: str, column_name: str, 
-                                function_type: str, params: Dict[str, Any] = None) -> Tuple[List[Tuple], List[str]]:
+                                function_type: str, params: Dict[str, Any] = None) -> Tuple[ColumnarResult, List[str]]:
         if function_type == "UPPER":
             select_expr = f"UPPER({column_name}) as upper_result"
         elif function_type == "LOWER":
@@ -589,22 +1407,17 @@ class DatabaseManager:
         
         query = f"SELECT {column_name}, {select_expr} FROM bank_system.{table_name}"
         
-        cursor = self.connection.cursor()
         try:
-            cursor.execute(query)
-            results = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
+            results = self._read_columnar(query)
+            column_names = results.column_names
             return results, column_names
         except psycopg2.Error as e:
-            self.connection.rollback()
-            self.logger.error(f"String function error: {e}")
+            self.logger.error("String function error: %s", e)
             raise ValueError(f"Ошибка функции: {e}")
-        finally:
-            cursor.close()
     
     def execute_join(self, table1: str, table2: str, join_column1: str, 
                     join_column2: str, join_type: str = "INNER",
-                    columns: List[str] = None) -> Tuple[List[Tuple], List[str]]:
+                    columns: List[str] = None) -> Tuple[ColumnarResult, List[str]]:
         select_cols = ", ".join(columns) if columns else "*"
         query = f"""
             SELECT {select_cols} 
@@ -613,21 +1426,16 @@ class DatabaseManager:
             ON t1.{join_column1} = t2.{join_column2}
         """
         
-        cursor = self.connection.cursor()
         try:
-            cursor.execute(query)
-            results = cursor.fetchall()
-            column_names = [desc[0] for desc in cursor.description]
+            results = self._read_columnar(query)
+            column_names = results.column_names
             return results, column_names
         except psycopg2.Error as e:
-            self.connection.rollback()
-            self.logger.error(f"Join error: {e}")
+            self.logger.error("Join error: %s", e)
             raise ValueError(f"Ошибка соединения: {e}")
-        finally:
-            cursor.close()
     
     def execute_subquery_filter(self, main_table: str, subquery_table: str, 
-                               operator: str, column: str, sub_column: str) -> Tuple[List[Tuple], List[str]]:
+                               operator: str, column: str, sub_column: str) -> Tuple[ColumnarResult, List[str]]:
         try:
             if operator == "IN":
                 query = f"""
@@ -652,22 +1460,15 @@ class DatabaseManager:
             else:
                 raise ValueError(f"Неподдерживаемый оператор: {operator}")
             
-            cursor = self.connection.cursor()
-            try:
-                cursor.execute(query)
-                results = cursor.fetchall()
-                column_names = [desc[0] for desc in cursor.description]
-                self.connection.commit()
-                return results, column_names
-            finally:
-                cursor.close()
+            results = self._read_columnar(query)
+            column_names = results.column_names
+            return results, column_names
         except Exception as e:
-            self.connection.rollback()
-            self.logger.error(f"Subquery filter error: {e}")
+            self.logger.error("Subquery filter error: %s", e)
             raise
     
     def execute_aggregation(self, table: str, agg_func: str, agg_column: str,
-                           group_by_column: str = None, having: str = None) -> Tuple[List[Tuple], List[str]]:
+                           group_by_column: str = None, having: str = None) -> Tuple[ColumnarResult, List[str]]:
         try:
             query = f"SELECT {agg_func}({agg_column})"
             if group_by_column:
@@ -678,42 +1479,28 @@ class DatabaseManager:
             if having:
                 query += f" HAVING {having}"
             
-            cursor = self.connection.cursor()
-            try:
-                cursor.execute(query)
-                results = cursor.fetchall()
-                column_names = [desc[0] for desc in cursor.description]
-                self.connection.commit()
-                return results, column_names
-            finally:
-                cursor.close()
+            results = self._read_columnar(query)
+            column_names = results.column_names
+            return results, column_names
         except Exception as e:
-            self.connection.rollback()
-            self.logger.error(f"Aggregation error: {e}")
+            self.logger.error("Aggregation error: %s", e)
             raise
     
     def execute_case_expression(self, table: str, case_expr: str, 
-                               select_cols: str = "*") -> Tuple[List[Tuple], List[str]]:
+                               select_cols: str = "*") -> Tuple[ColumnarResult, List[str]]:
         try:
             query = f"SELECT {select_cols}, {case_expr} as case_result FROM bank_system.{table}"
             
-            cursor = self.connection.cursor()
-            try:
-                cursor.execute(query)
-                results = cursor.fetchall()
-                column_names = [desc[0] for desc in cursor.description]
-                self.connection.commit()
-                return results, column_names
-            finally:
-                cursor.close()
+            results = self._read_columnar(query)
+            column_names = results.column_names
+            return results, column_names
         except Exception as e:
-            self.connection.rollback()
-            self.logger.error(f"CASE expression error: {e}")
+            self.logger.error("CASE expression error: %s", e)
             raise
     
     def execute_coalesce_nullif(self, table: str, func_type: str, column: str,
                                coalesce_values: list = None, nullif_val1: str = None,
-                               nullif_val2: str = None, select_cols: str = "*") -> Tuple[List[Tuple], List[str]]:
+                               nullif_val2: str = None, select_cols: str = "*") -> Tuple[ColumnarResult, List[str]]:
         try:
             if func_type == "COALESCE":
                 if not coalesce_values:
@@ -727,23 +1514,16 @@ class DatabaseManager:
             
             query = f"SELECT {select_cols}, {expr} as result FROM bank_system.{table}"
             
-            cursor = self.connection.cursor()
-            try:
-                cursor.execute(query)
-                results = cursor.fetchall()
-                column_names = [desc[0] for desc in cursor.description]
-                self.connection.commit()
-                return results, column_names
-            finally:
-                cursor.close()
+            results = self._read_columnar(query)
+            column_names = results.column_names
+            return results, column_names
         except Exception as e:
-            self.connection.rollback()
-            self.logger.error(f"NULL function error: {e}")
+            self.logger.error("NULL function error: %s", e)
             raise
     
     def execute_advanced_grouping(self, table: str, select_cols: str, group_type: str,
                                  group_cols: list, where: str = None, 
-                                 having: str = None, order: str = None) -> Tuple[List[Tuple], List[str]]:
+                                 having: str = None, order: str = None) -> Tuple[ColumnarResult, List[str]]:
         try:
             query = f"SELECT {select_cols} FROM bank_system.{table}"
             
@@ -765,18 +1545,11 @@ class DatabaseManager:
             if order:
                 query += f" ORDER BY {order}"
             
-            cursor = self.connection.cursor()
-            try:
-                cursor.execute(query)
-                results = cursor.fetchall()
-                column_names = [desc[0] for desc in cursor.description]
-                self.connection.commit()
-                return results, column_names
-            finally:
-                cursor.close()
+            results = self._read_columnar(query)
+            column_names = results.column_names
+            return results, column_names
         except Exception as e:
-            self.connection.rollback()
-            self.logger.error(f"Advanced grouping error: {e}")
+            self.logger.error("Advanced grouping error: %s", e)
             raise
     
     def create_view(self, view_name: str, sql_query: str) -> bool:
@@ -802,7 +1575,7 @@ class DatabaseManager:
                 cursor.close()
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Create view error: {e}")
+            self.logger.error("Create view error: %s", e)
             raise
     
     def get_views(self) -> List[str]:
@@ -821,7 +1594,7 @@ class DatabaseManager:
             finally:
                 cursor.close()
         except Exception as e:
-            self.logger.error(f"Get views error: {e}")
+            self.logger.error("Get views error: %s", e)
             return []
     
     def get_view_definition(self, view_name: str) -> str:
@@ -839,7 +1612,7 @@ class DatabaseManager:
             finally:
                 cursor.close()
         except Exception as e:
-            self.logger.error(f"Get view definition error: {e}")
+            self.logger.error("Get view definition error: %s", e)
             raise
     
     def drop_view(self, view_name: str, cascade: bool = False) -> bool:
@@ -851,13 +1624,14 @@ class DatabaseManager:
                 drop_view_sql = f"DROP VIEW bank_system.{view_name} {cascade_str}"
                 cursor.execute(drop_view_sql)
                 self.connection.commit()
-                self.logger.info(f"View '{view_name}' dropped successfully")
+                self.invalidate_prepared()
+                self.logger.info("View '%s' dropped successfully", view_name)
                 return True
             finally:
                 cursor.close()
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Drop view error: {e}")
+            self.logger.error("Drop view error: %s", e)
             raise
     
     def get_materialized_views(self) -> List[str]:
@@ -875,7 +1649,7 @@ class DatabaseManager:
             finally:
                 cursor.close()
         except Exception as e:
-            self.logger.error(f"Get materialized views error: {e}")
+            self.logger.error("Get materialized views error: %s", e)
             return []
     
     def create_materialized_view(self, view_name: str, sql_query: str) -> bool:
@@ -901,7 +1675,7 @@ class DatabaseManager:
                 cursor.close()
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Create materialized view error: {e}")
+            self.logger.error("Create materialized view error: %s", e)
             raise
     
     def get_materialized_view_definition(self, view_name: str) -> str:
@@ -919,7 +1693,7 @@ class DatabaseManager:
             finally:
                 cursor.close()
         except Exception as e:
-            self.logger.error(f"Get materialized view definition error: {e}")
+            self.logger.error("Get materialized view definition error: %s", e)
             raise
     
     def refresh_materialized_view(self, view_name: str, concurrent: bool = False) -> bool:
@@ -936,7 +1710,7 @@ class DatabaseManager:
                 cursor.close()
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Refresh materialized view error: {e}")
+            self.logger.error("Refresh materialized view error: %s", e)
             raise
     
     def drop_materialized_view(self, view_name: str, cascade: bool = False) -> bool:
@@ -948,10 +1722,11 @@ class DatabaseManager:
                 drop_sql = f"DROP MATERIALIZED VIEW {cascade_str} bank_system.{view_name}"
                 cursor.execute(drop_sql)
                 self.connection.commit()
+                self.invalidate_prepared()
                 return True
             finally:
                 cursor.close()
         except Exception as e:
             self.connection.rollback()
-            self.logger.error(f"Drop materialized view error: {e}")
+            self.logger.error("Drop materialized view error: %s", e)
             raise
\ No newline at end of file
@@ -3,11 +3,143 @@ from PySide6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                                QComboBox, QMessageBox, QTabWidget, QWidget,
                                QTableWidget, QTableWidgetItem, QHeaderView,
                                QGroupBox, QScrollArea, QCheckBox, QFormLayout, QApplication,
-                               QListWidget)
-from PySide6.QtCore import Qt, QTimer
+                               QListWidget, QListWidgetItem, QTableView, QSpinBox)
+from PySide6.QtCore import Qt, QTimer, QObject, Signal
 from PySide6.QtGui import QClipboard
 from typing import Callable
 import logging
+import threading
+import time
+import uuid
+from table_models import ResultTableModel, ResultFilterProxyModel, sort_key
+from olap_engine import TransactionCube
+from rate_manager import RateManager, HOME_CURRENCY
+from portfolio_manager import PortfolioManager
+from query_builder import Select, Condition, Aggregate, Case, DOLLAR, LITERAL, coerce_value, case_value
+
+# Допустимое отклонение введенного курса от действующего, %
+RATE_DEVIATION_TOLERANCE = 1
+
+
+def create_result_view(headers=()):
+    """Таблица результатов с локальной сортировкой, фильтрацией и поиском"""
+    model = ResultTableModel(headers)
+    proxy = ResultFilterProxyModel()
+    proxy.setSourceModel(model)
+
+    view = QTableView()
+    view.setModel(proxy)
+    view.horizontalHeader().setSortIndicator(-1, Qt.SortOrder.AscendingOrder)
+    view.setSortingEnabled(True)
+    view.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+    view.verticalHeader().setDefaultSectionSize(30)
+
+    filter_edit = QLineEdit()
+    filter_edit.setClearButtonEnabled(True)
+    filter_edit.setPlaceholderText("Поиск по загруженным данным (столбец:значение - фильтр по столбцу)")
+    filter_edit.textChanged.connect(proxy.set_filter_text)
+
+    return view, model, filter_edit
+
+
+def add_condition_item(list_widget, col, op, val):
+    """Фильтр конструктора: текст в списке, Condition в данных элемента"""
+    item = QListWidgetItem(f"{col} {op} {val}")
+    item.setData(Qt.ItemDataRole.UserRole, Condition.parse(col, op, val))
+    list_widget.addItem(item)
+
+
+def list_conditions(list_widget):
+    return [list_widget.item(i).data(Qt.ItemDataRole.UserRole) for i in range(list_widget.count())]
+
+
+def query_text(db_manager, query):
+    """Текст запроса конструктора с плейсхолдерами $n и значениями параметров"""
+    composed, params = query.compile(DOLLAR)
+    text = db_manager.render_sql(composed)
+    if params:
+        text += "\nПараметры: " + ", ".join(f"${i}={value!r}" for i, value in enumerate(params, 1))
+    return text
+
+
+class ChangeNotifier(QObject):
+    """Передача уведомлений об изменениях из потока слушателя БД в поток GUI"""
+    changed = Signal(str, str, list)
+
+
+class PreviewRunner(QObject):
+    """Фоновое выполнение запроса предпросмотра с таймаутом, лимитом строк и отменой"""
+    finished = Signal(object, list, bool)
+    failed = Signal(str)
+    busy = Signal(bool)
+
+    def __init__(self, db_manager, parent=None, timeout_s: int = 30, max_rows: int = 1000):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self._thread = None
+
+        self.timeout_spin = QSpinBox()
+        self.timeout_spin.setRange(0, 3600)
+        self.timeout_spin.setValue(timeout_s)
+        self.timeout_spin.setSuffix(" с")
+        self.timeout_spin.setSpecialValueText("без ограничения")
+
+        self.limit_spin = QSpinBox()
+        self.limit_spin.setRange(0, 1000000)
+        self.limit_spin.setSingleStep(1000)
+        self.limit_spin.setValue(max_rows)
+        self.limit_spin.setSpecialValueText("все строки")
+
+        self.cancel_btn = QPushButton("Отменить запрос")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.setStyleSheet("background-color: #dc3545; color: white; padding: 10px; font-weight: bold;")
+        self.cancel_btn.clicked.connect(self.cancel)
+        self.busy.connect(self.cancel_btn.setEnabled)
+
+    def controls(self) -> QHBoxLayout:
+        layout = QHBoxLayout()
+        layout.addWidget(QLabel("Таймаут:"))
+        layout.addWidget(self.timeout_spin)
+        layout.addWidget(QLabel("Лимит строк:"))
+        layout.addWidget(self.limit_spin)
+        layout.addStretch()
+        layout.addWidget(self.cancel_btn)
+        return layout
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, query: str, params=None) -> bool:
+        if self.is_running():
+            return False
+        timeout_ms = self.timeout_spin.value() * 1000 or None
+        max_rows = self.limit_spin.value() or None
+        self.busy.emit(True)
+        self._thread = threading.Thread(
+            target=self._run, args=(query, params, timeout_ms, max_rows), name='preview-query', daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def _run(self, query, params, timeout_ms, max_rows):
+        try:
+            results, column_names, truncated = self.db_manager.execute_preview(query, params, max_rows, timeout_ms)
+            self.finished.emit(results, column_names, truncated)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            self.busy.emit(False)
+
+    def cancel(self):
+        if self.is_running():
+            self.db_manager.cancel_query()
+
+    @staticmethod
+    def summary(results, truncated: bool) -> str:
+        text = f"Найдено записей: {len(results)}"
+        if truncated:
+            text += f"\nПоказаны первые {len(results)} строк; увеличьте лимит строк, чтобы увидеть остальные"
+        return text
 
 
 class ConnectionDialog(QDialog):
@@ -49,6 +181,8 @@ class ConnectionDialog(QDialog):
         self.user_edit = QLineEdit("postgres")
         self.password_edit = QLineEdit()
         self.password_edit.setEchoMode(QLineEdit.EchoMode.Password)
+        self.replicas_edit = QLineEdit()
+        self.replicas_edit.setPlaceholderText("host=replica1; host=replica2 port=5433")
 
         grid.addWidget(QLabel("Хост:"), 0, 0)
         grid.addWidget(self.host_edit, 0, 1)
@@ -65,6 +199,9 @@ class ConnectionDialog(QDialog):
         grid.addWidget(QLabel("Пароль:"), 4, 0)
         grid.addWidget(self.password_edit, 4, 1)
 
+        grid.addWidget(QLabel("Реплики для чтения:"), 5, 0)
+        grid.addWidget(self.replicas_edit, 5, 1)
+
         layout.addLayout(grid)
 
         buttons_layout = QHBoxLayout()
@@ -87,7 +224,8 @@ class ConnectionDialog(QDialog):
             'port': self.port_edit.text().strip(),
             'database': self.database_edit.text().strip(),
             'user': self.user_edit.text().strip(),
-            'password': self.password_edit.text()
+            'password': self.password_edit.text(),
+            'replicas': [dsn.strip() for dsn in self.replicas_edit.text().split(';') if dsn.strip()]
         }
 
         if not all([self.connection_params['host'], self.connection_params['port'],
@@ -342,8 +480,14 @@ class AddDataDialog(QDialog):
         row += 1
         grid.addWidget(QLabel("Номер счета:"), row, 0)
         self.account_entries['account_number'] = QLineEdit()
-        self.account_entries['account_number'].setPlaceholderText("40702810500000012345")
-        grid.addWidget(self.account_entries['account_number'], row, 1)
+        self.account_entries['account_number'].setMaxLength(20)
+        self.account_entries['account_number'].setPlaceholderText("Пусто - номер будет выдан автоматически")
+        number_layout = QHBoxLayout()
+        number_layout.addWidget(self.account_entries['account_number'])
+        generate_btn = QPushButton("Сгенерировать")
+        generate_btn.clicked.connect(self.generate_account_number)
+        number_layout.addWidget(generate_btn)
+        grid.addLayout(number_layout, row, 1)
 
         row += 1
         grid.addWidget(QLabel("Начальный баланс:"), row, 0)
@@ -377,6 +521,8 @@ class AddDataDialog(QDialog):
         grid.setSpacing(8)
 
         self.trans_entries = {}
+        # Ключ идемпотентности формы: повторная отправка той же формы не создаст дубль
+        self.trans_request_key = str(uuid.uuid4())
 
         row = 0
         grid.addWidget(QLabel("ID счета:"), row, 0)
@@ -513,6 +659,8 @@ class AddDataDialog(QDialog):
             account_number = self.account_entries['account_number'].text().strip()
             balance = float(self.account_entries['balance'].text().strip())
             status = self.account_entries['status'].currentText()
+            if not account_number:
+                account_number = self.db_manager.account_numbers.allocate(currency_code)
 
             account_id = self.db_manager.insert_account(
                 client_id, currency_code, account_number, balance, status
@@ -529,6 +677,17 @@ class AddDataDialog(QDialog):
             QMessageBox.critical(self, "Ошибка", f"Неверный формат данных:\n{str(e)}")
             self.logger.error(f"Insert account error: {e}")
 
+    def generate_account_number(self):
+        currency_code = self.account_entries['currency_code'].text().strip().upper()
+        if not currency_code:
+            QMessageBox.warning(self, "Ошибка", "Укажите код валюты")
+            return
+        try:
+            self.account_entries['account_number'].setText(self.db_manager.account_numbers.allocate(currency_code))
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", str(e))
+            self.logger.error(f"Account number generation error: {e}")
+
     def insert_transaction(self):
         try:
             account_id = int(self.trans_entries['account_id'].text().strip())
@@ -543,14 +702,21 @@ class AddDataDialog(QDialog):
             description = self.trans_entries['description'].toPlainText().strip()
             employee = self.trans_entries['employee'].text().strip()
 
-            trans_id = self.db_manager.insert_transaction(
-                account_id, trans_type, amount, currency_code,
-                exchange_rate, commission, description, employee
-            )
+            if exchange_rate is not None and trans_type in ('BUY', 'SELL') and not self.confirm_exchange_rate(
+                    currency_code, trans_type, exchange_rate):
+                return
+
+            with self.db_manager.session('oltp'):
+                trans_id = self.db_manager.insert_transaction(
+                    account_id, trans_type, amount, currency_code,
+                    exchange_rate, commission, description, employee,
+                    request_key=self.trans_request_key
+                )
 
             QMessageBox.information(self, "Успех", f"Транзакция добавлена с ID: {trans_id}")
             self.log_callback(f"Добавлена транзакция {trans_type} (ID: {trans_id})")
             self.clear_entries(self.trans_entries)
+            self.trans_request_key = str(uuid.uuid4())
 
         except ValueError as e:
             QMessageBox.critical(self, "Ошибка", str(e))
@@ -559,6 +725,26 @@ class AddDataDialog(QDialog):
             QMessageBox.critical(self, "Ошибка", f"Неверный формат данных:\n{str(e)}")
             self.logger.error(f"Insert transaction error: {e}")
 
+    def confirm_exchange_rate(self, currency_code, trans_type, exchange_rate) -> bool:
+        """Сверка введенного курса с курсом, действующим на момент проведения"""
+        try:
+            checked = RateManager(self.db_manager).check_rate(currency_code, trans_type, exchange_rate)
+        except Exception as e:
+            self.logger.warning(f"Could not check exchange rate: {e}")
+            return True
+        if checked is None:
+            return True
+        effective, deviation = checked
+        if abs(deviation) <= RATE_DEVIATION_TOLERANCE:
+            return True
+        reply = QMessageBox.question(
+            self, "Проверка курса",
+            f"Введенный курс {exchange_rate} отличается от действующего курса {currency_code}/{HOME_CURRENCY} "
+            f"{effective} на {deviation:.2f}%.\nПровести транзакцию с введенным курсом?",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
+        )
+        return reply == QMessageBox.StandardButton.Yes
+
     def clear_entries(self, entries_dict):
         for key, widget in entries_dict.items():
             if isinstance(widget, QLineEdit):
@@ -583,6 +769,16 @@ class ViewDataDialog(QDialog):
 
         self.setup_ui()
 
+        # Загруженные вкладки обновляются построчно по уведомлениям об изменениях
+        self.loaded_tables = set()
+        self.change_notifier = ChangeNotifier()
+        self.change_notifier.changed.connect(self.apply_change)
+        self._change_callback = self.change_notifier.changed.emit
+        try:
+            self.db_manager.add_change_listener(self._change_callback)
+        except Exception as e:
+            self.logger.warning(f"Live refresh is unavailable: {e}")
+
     def setup_ui(self):
         layout = QVBoxLayout(self)
 
@@ -599,16 +795,16 @@ class ViewDataDialog(QDialog):
                 background-color: #138496;
             }
             /* СТИЛИ ДЛЯ ТАБЛИЦ */
-            QTableWidget {
+            QTableView {
                 background-color: white;
                 gridline-color: #d0d0d0;
                 border: 1px solid #cccccc;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 5px;
                 border-bottom: 1px solid #f0f0f0;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #2E86AB;
                 color: white;
             }
@@ -633,6 +829,7 @@ class ViewDataDialog(QDialog):
         self.create_clients_tab()
         self.create_accounts_tab()
         self.create_transactions_tab()
+        self.create_portfolios_tab()
 
         layout.addWidget(self.tabs)
 
@@ -660,13 +857,10 @@ class ViewDataDialog(QDialog):
         load_btn.clicked.connect(self.load_currencies)
         layout.addWidget(load_btn)
 
-        self.currencies_table = QTableWidget()
-        self.currencies_table.setColumnCount(5)
-        self.currencies_table.setHorizontalHeaderLabels([
+        self.currencies_table, self.currencies_model, filter_edit = create_result_view([
             'ID', 'Код', 'Название', 'Символ', 'Активна'
         ])
-        self.currencies_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        self.currencies_table.verticalHeader().setDefaultSectionSize(30)
+        layout.addWidget(filter_edit)
         layout.addWidget(self.currencies_table)
 
         self.tabs.addTab(widget, "Валюты")
@@ -689,13 +883,10 @@ class ViewDataDialog(QDialog):
         controls_layout.addStretch()
         layout.addLayout(controls_layout)
 
-        self.rates_table = QTableWidget()
-        self.rates_table.setColumnCount(7)
-        self.rates_table.setHorizontalHeaderLabels([
+        self.rates_table, self.rates_model, filter_edit = create_result_view([
             'ID', 'Базовая', 'Целевая', 'Курс покупки', 'Курс продажи', 'Дата', 'Обновил'
         ])
-        self.rates_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        self.rates_table.verticalHeader().setDefaultSectionSize(30)
+        layout.addWidget(filter_edit)
         layout.addWidget(self.rates_table)
 
         self.tabs.addTab(widget, "Курсы валют")
@@ -708,14 +899,11 @@ class ViewDataDialog(QDialog):
         load_btn.clicked.connect(self.load_clients)
         layout.addWidget(load_btn)
 
-        self.clients_table = QTableWidget()
-        self.clients_table.setColumnCount(9)
-        self.clients_table.setHorizontalHeaderLabels([
+        self.clients_table, self.clients_model, filter_edit = create_result_view([
             'ID', 'ФИО', 'Паспорт', 'Телефон', 'Email',
             'Дата регистрации', 'Дата рождения', 'VIP', 'Разрешенные операции'
         ])
-        self.clients_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        self.clients_table.verticalHeader().setDefaultSectionSize(30)
+        layout.addWidget(filter_edit)
         layout.addWidget(self.clients_table)
 
         self.tabs.addTab(widget, "Клиенты")
@@ -738,14 +926,11 @@ class ViewDataDialog(QDialog):
         controls_layout.addStretch()
         layout.addLayout(controls_layout)
 
-        self.accounts_table = QTableWidget()
-        self.accounts_table.setColumnCount(8)
-        self.accounts_table.setHorizontalHeaderLabels([
+        self.accounts_table, self.accounts_model, filter_edit = create_result_view([
             'ID', 'Клиент', 'Валюта', 'Номер счета',
             'Баланс', 'Статус', 'Дата открытия', 'Последняя операция'
         ])
-        self.accounts_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        self.accounts_table.verticalHeader().setDefaultSectionSize(30)
+        layout.addWidget(filter_edit)
         layout.addWidget(self.accounts_table)
 
         self.tabs.addTab(widget, "Валютные счета")
@@ -778,28 +963,50 @@ class ViewDataDialog(QDialog):
         controls_layout.addStretch()
         layout.addLayout(controls_layout)
 
-        self.transactions_table = QTableWidget()
-        self.transactions_table.setColumnCount(11)
-        self.transactions_table.setHorizontalHeaderLabels([
+        self.transactions_table, self.transactions_model, filter_edit = create_result_view([
             'ID', 'Клиент', 'Счет', 'Тип', 'Сумма',
             'Валюта', 'Курс', 'Комиссия', 'Дата', 'Описание', 'Сотрудник'
         ])
-        self.transactions_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        self.transactions_table.verticalHeader().setDefaultSectionSize(30)
+        layout.addWidget(filter_edit)
         layout.addWidget(self.transactions_table)
 
         self.tabs.addTab(widget, "Транзакции")
 
+    def create_portfolios_tab(self):
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+
+        controls_layout = QHBoxLayout()
+
+        controls_layout.addWidget(QLabel("Валюта отчета:"))
+        self.reporting_currency_combo = QComboBox()
+        self.reporting_currency_combo.addItems(['RUB', 'USD', 'EUR', 'GBP', 'CNY', 'JPY', 'CHF'])
+        controls_layout.addWidget(self.reporting_currency_combo)
+
+        self.vip_only_check = QCheckBox("Только VIP")
+        controls_layout.addWidget(self.vip_only_check)
+
+        load_btn = QPushButton("Рассчитать")
+        load_btn.clicked.connect(self.load_portfolios)
+        controls_layout.addWidget(load_btn)
+
+        controls_layout.addStretch()
+        layout.addLayout(controls_layout)
+
+        self.portfolios_table, self.portfolios_model, filter_edit = create_result_view([
+            'ID', 'Клиент', 'VIP', 'Стоимость', 'Счетов', 'Валют', 'Без курса'
+        ])
+        layout.addWidget(filter_edit)
+        layout.addWidget(self.portfolios_table)
+
+        self.tabs.addTab(widget, "Портфели")
+
     def load_currencies(self):
         try:
-            self.currencies_table.setRowCount(0)
             data = self.db_manager.get_currencies()
 
-            self.currencies_table.setRowCount(len(data))
-            for row_idx, row_data in enumerate(data):
-                for col_idx, value in enumerate(row_data):
-                    self.currencies_table.setItem(row_idx, col_idx,
-                                                  QTableWidgetItem(str(value)))
+            self.currencies_model.set_rows(data)
+            self.loaded_tables.add('currencies')
 
             QMessageBox.information(self, "Успех", f"Загружено записей: {len(data)}")
 
@@ -809,15 +1016,11 @@ class ViewDataDialog(QDialog):
 
     def load_exchange_rates(self):
         try:
-            self.rates_table.setRowCount(0)
             base_currency = self.base_currency_filter.currentText()
             data = self.db_manager.get_exchange_rates(base_currency)
 
-            self.rates_table.setRowCount(len(data))
-            for row_idx, row_data in enumerate(data):
-                for col_idx, value in enumerate(row_data):
-                    self.rates_table.setItem(row_idx, col_idx,
-                                             QTableWidgetItem(str(value)))
+            self.rates_model.set_rows(data)
+            self.loaded_tables.add('exchange_rates')
 
             QMessageBox.information(self, "Успех", f"Загружено записей: {len(data)}")
 
@@ -827,14 +1030,10 @@ class ViewDataDialog(QDialog):
 
     def load_clients(self):
         try:
-            self.clients_table.setRowCount(0)
             data = self.db_manager.get_clients()
 
-            self.clients_table.setRowCount(len(data))
-            for row_idx, row_data in enumerate(data):
-                for col_idx, value in enumerate(row_data):
-                    self.clients_table.setItem(row_idx, col_idx,
-                                               QTableWidgetItem(str(value)))
+            self.clients_model.set_rows(data)
+            self.loaded_tables.add('clients')
 
             QMessageBox.information(self, "Успех", f"Загружено записей: {len(data)}")
 
@@ -844,15 +1043,11 @@ class ViewDataDialog(QDialog):
 
     def load_accounts(self):
         try:
-            self.accounts_table.setRowCount(0)
             currency = self.account_currency_filter.currentText()
             data = self.db_manager.get_accounts(currency=currency)
 
-            self.accounts_table.setRowCount(len(data))
-            for row_idx, row_data in enumerate(data):
-                for col_idx, value in enumerate(row_data):
-                    self.accounts_table.setItem(row_idx, col_idx,
-                                                QTableWidgetItem(str(value)))
+            self.accounts_model.set_rows(data)
+            self.loaded_tables.add('currency_accounts')
 
             QMessageBox.information(self, "Успех", f"Загружено записей: {len(data)}")
 
@@ -862,8 +1057,6 @@ class ViewDataDialog(QDialog):
 
     def load_transactions(self):
         try:
-            self.transactions_table.setRowCount(0)
-
             trans_type = self.trans_type_filter.currentText()
             from_date = self.from_date_edit.text().strip()
             to_date = self.to_date_edit.text().strip()
@@ -872,11 +1065,8 @@ class ViewDataDialog(QDialog):
                 trans_type=trans_type, from_date=from_date, to_date=to_date
             )
 
-            self.transactions_table.setRowCount(len(data))
-            for row_idx, row_data in enumerate(data):
-                for col_idx, value in enumerate(row_data):
-                    self.transactions_table.setItem(row_idx, col_idx,
-                                                    QTableWidgetItem(str(value)))
+            self.transactions_model.set_rows(data)
+            self.loaded_tables.add('transactions')
 
             QMessageBox.information(self, "Успех", f"Загружено записей: {len(data)}")
 
@@ -884,6 +1074,63 @@ class ViewDataDialog(QDialog):
             QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить данные:\n{str(e)}")
             self.logger.error(f"Load transactions error: {e}")
 
+    def apply_change(self, table, op, ids):
+        """Применение изменений строк к загруженной вкладке без полной перезагрузки"""
+        readers = {
+            'currencies': (self.currencies_model,
+                           lambda keys: self.db_manager.get_currencies(ids=keys)),
+            'exchange_rates': (self.rates_model,
+                               lambda keys: self.db_manager.get_exchange_rates(
+                                   self.base_currency_filter.currentText(), ids=keys)),
+            'clients': (self.clients_model,
+                        lambda keys: self.db_manager.get_clients(ids=keys)),
+            'currency_accounts': (self.accounts_model,
+                                  lambda keys: self.db_manager.get_accounts(
+                                      currency=self.account_currency_filter.currentText(), ids=keys)),
+            'transactions': (self.transactions_model,
+                             lambda keys: self.db_manager.get_transactions(
+                                 trans_type=self.trans_type_filter.currentText(),
+                                 from_date=self.from_date_edit.text().strip(),
+                                 to_date=self.to_date_edit.text().strip(), ids=keys)),
+        }
+        if table not in self.loaded_tables or table not in readers:
+            return
+        model, reader = readers[table]
+        try:
+            if op == 'DELETE':
+                model.remove_keys(ids)
+                return
+            rows = reader(ids)
+            model.upsert_rows(rows)
+            # Измененные строки, которые больше не подходят под фильтр вкладки
+            found = {row[0] for row in rows}
+            model.remove_keys([key for key in ids if key not in found])
+            self.logger.info(f"Applied {op} of {len(ids)} rows to {table} view")
+        except Exception as e:
+            self.logger.error(f"Live refresh error for {table}: {e}")
+
+    def done(self, result):
+        self.db_manager.remove_change_listener(self._change_callback)
+        super().done(result)
+
+    def load_portfolios(self):
+        try:
+            reporting_currency = self.reporting_currency_combo.currentText()
+            with self.db_manager.session('analytics'):
+                data, _ = PortfolioManager(self.db_manager).value_portfolios(
+                    reporting_currency, vip_only=self.vip_only_check.isChecked()
+                )
+
+            self.portfolios_model.set_rows(data)
+
+            total = sum(row[3] for row in data)
+            QMessageBox.information(self, "Успех",
+                                    f"Оценено клиентов: {len(data)}\nОбщая стоимость: {total} {reporting_currency}")
+
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось загрузить данные:\n{str(e)}")
+            self.logger.error(f"Load portfolios error: {e}")
+
     def drop_schema(self):
         reply = QMessageBox.question(
             self,
@@ -1453,14 +1700,20 @@ class AdvancedSelectDialog(QDialog):
         
         controls_group.setLayout(controls_layout)
         layout.addWidget(controls_group)
-        
-        execute_btn = QPushButton("Выполнить запрос")
-        execute_btn.clicked.connect(self.execute_query)
-        execute_btn.setStyleSheet("background-color: #28a745; color: white; padding: 10px; font-weight: bold;")
-        layout.addWidget(execute_btn)
-        
-        self.result_table = QTableWidget()
-        self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+
+        self.preview = PreviewRunner(self.db_manager, self)
+        self.preview.finished.connect(self.show_results)
+        self.preview.failed.connect(self.show_error)
+        layout.addLayout(self.preview.controls())
+
+        self.execute_btn = QPushButton("Выполнить запрос")
+        self.execute_btn.clicked.connect(self.execute_query)
+        self.execute_btn.setStyleSheet("background-color: #28a745; color: white; padding: 10px; font-weight: bold;")
+        self.preview.busy.connect(self.execute_btn.setDisabled)
+        layout.addWidget(self.execute_btn)
+
+        self.result_table, self.result_model, filter_edit = create_result_view()
+        layout.addWidget(filter_edit)
         layout.addWidget(self.result_table)
         
         self.sql_label = QLabel()
@@ -1479,6 +1732,10 @@ class AdvancedSelectDialog(QDialog):
         except:
             return []
 
+    def done(self, result):
+        self.preview.cancel()
+        super().done(result)
+
     def on_select_all_columns(self, state):
         if state:
             for i in range(self.columns_list.count()):
@@ -1519,59 +1776,41 @@ class AdvancedSelectDialog(QDialog):
             selected_cols = [item.text() for item in self.columns_list.selectedItems()]
             columns = selected_cols if selected_cols else None
 
+            query = Select(table, columns or ())
+
             # where filters (AND)
-            where_clauses = []
-            for i in range(self.where_list.count()):
-                where_clauses.append(self.where_list.item(i).text())
-            where_clause = ' AND '.join(where_clauses)
+            for condition in list_conditions(self.where_list):
+                query.filter(condition)
 
             # group by
-            group_cols = [item.text() for item in self.group_list.selectedItems()]
-            group_by = ', '.join(group_cols) if group_cols else ''
+            query.group(*[item.text() for item in self.group_list.selectedItems()])
 
             # having
-            having = ''
             func = self.having_func_combo.currentText()
             hcol = self.having_col_combo.currentText()
             hop = self.having_op_combo.currentText()
             hval = self.having_value_edit.text().strip()
             if func and hcol and hop and hval:
-                having = f"{func}({hcol}) {hop} {hval}"
+                query.having_filter(Condition(Aggregate(func, hcol), hop, coerce_value(hval)))
 
             # order by
             order_col = self.order_col_combo.currentText()
-            order_dir = self.order_dir_combo.currentText()
-            order_by = f"{order_col} {order_dir}" if order_col else ''
-
-            sql = f"SELECT {', '.join(columns) if columns else '*'} FROM bank_system.{table}"
-            if where_clause:
-                sql += f" WHERE {where_clause}"
-            if group_by:
-                sql += f" GROUP BY {group_by}"
-            if having:
-                sql += f" HAVING {having}"
-            if order_by:
-                sql += f" ORDER BY {order_by}"
-
-            results, column_names = self.db_manager.execute_advanced_select(
-                table, columns, where_clause, order_by, group_by, having
-            )
+            if order_col:
+                query.order(order_col, self.order_dir_combo.currentText() == 'DESC')
 
-            self.sql_label.setText(f"SQL: {sql}")
+            self.sql_label.setText(f"SQL: {query_text(self.db_manager, query)}")
+            self.preview.start(query)
 
-            self.result_table.setRowCount(len(results))
-            self.result_table.setColumnCount(len(column_names))
-            self.result_table.setHorizontalHeaderLabels(column_names)
+        except Exception as e:
+            self.show_error(str(e))
 
-            for row_idx, row_data in enumerate(results):
-                for col_idx, value in enumerate(row_data):
-                    self.result_table.setItem(row_idx, col_idx, QTableWidgetItem(str(value)))
+    def show_results(self, results, column_names, truncated):
+        self.result_model.set_rows(results, column_names)
+        QMessageBox.information(self, "Успех", PreviewRunner.summary(results, truncated))
 
-            QMessageBox.information(self, "Успех", f"Найдено записей: {len(results)}")
-            
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить запрос:\n{str(e)}")
-            self.logger.error(f"Query error: {e}")
+    def show_error(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить запрос:\n{message}")
+        self.logger.error(f"Query error: {message}")
 
     def add_where_filter(self):
         col = self.where_col_combo.currentText()
@@ -1580,15 +1819,7 @@ class AdvancedSelectDialog(QDialog):
         if not col or not op or val == '':
             QMessageBox.warning(self, "Ошибка", "Заполните колонки фильтра")
             return
-        # Quote value if it looks like text
-        try:
-            float(val)
-            val_formatted = val
-        except:
-            val_formatted = f"'{val}'"
-
-        clause = f"{col} {op} {val_formatted}"
-        self.where_list.addItem(clause)
+        add_condition_item(self.where_list, col, op, val)
         self.where_value_edit.clear()
 
 
@@ -1957,7 +2188,7 @@ class JoinWizardDialog(QDialog):
         columns_layout = QHBoxLayout()
         
         self.columns_list = QListWidget()
-        self.columns_list.setSelectionMode(QAbstractItemModel.SelectionMode.MultiSelection)
+        self.columns_list.setSelectionMode(QListWidget.SelectionMode.MultiSelection)
         columns_layout.addWidget(self.columns_list)
         columns_group.setLayout(columns_layout)
         layout.addWidget(columns_group)
@@ -1969,13 +2200,19 @@ class JoinWizardDialog(QDialog):
         info_label.setStyleSheet("background-color: #e7f3ff; padding: 5px; border: 1px solid #b3d9ff;")
         layout.addWidget(info_label)
         
-        execute_btn = QPushButton("Выполнить соединение")
-        execute_btn.clicked.connect(self.execute_join)
-        execute_btn.setStyleSheet("background-color: #28a745; color: white; padding: 10px; font-weight: bold;")
-        layout.addWidget(execute_btn)
-        
-        self.result_table = QTableWidget()
-        self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        self.preview = PreviewRunner(self.db_manager, self)
+        self.preview.finished.connect(self.show_results)
+        self.preview.failed.connect(self.show_error)
+        layout.addLayout(self.preview.controls())
+
+        self.execute_btn = QPushButton("Выполнить соединение")
+        self.execute_btn.clicked.connect(self.execute_join)
+        self.execute_btn.setStyleSheet("background-color: #28a745; color: white; padding: 10px; font-weight: bold;")
+        self.preview.busy.connect(self.execute_btn.setDisabled)
+        layout.addWidget(self.execute_btn)
+
+        self.result_table, self.result_model, filter_edit = create_result_view()
+        layout.addWidget(filter_edit)
         layout.addWidget(self.result_table)
         
         self.sql_label = QLabel()
@@ -2064,29 +2301,22 @@ class JoinWizardDialog(QDialog):
             
             sql = f"SELECT {columns_str} FROM bank_system.{table1} t1 {join_type} JOIN bank_system.{table2} t2 ON t1.{column1} = t2.{column2}"
             self.sql_label.setText(f"SQL: {sql}")
-            
-            # Для db_manager, если нужны конкретные столбцы, преобразуем в список
-            columns = None
-            if columns_str != '*':
-                columns = [c.strip() for c in columns_str.split(',')]
-            
-            results, column_names = self.db_manager.execute_join(
-                table1, table2, column1, column2, join_type, columns
-            )
-            
-            self.result_table.setRowCount(len(results))
-            self.result_table.setColumnCount(len(column_names))
-            self.result_table.setHorizontalHeaderLabels(column_names)
-            
-            for row_idx, row_data in enumerate(results):
-                for col_idx, value in enumerate(row_data):
-                    self.result_table.setItem(row_idx, col_idx, QTableWidgetItem(str(value)))
-            
-            QMessageBox.information(self, "Успех", f"Найдено записей: {len(results)}")
-            
+            self.preview.start(sql)
+
         except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить соединение:\n{str(e)}")
-            self.logger.error(f"Join error: {e}")
+            self.show_error(str(e))
+
+    def show_results(self, results, column_names, truncated):
+        self.result_model.set_rows(results, column_names)
+        QMessageBox.information(self, "Успех", PreviewRunner.summary(results, truncated))
+
+    def show_error(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Не удалось выполнить соединение:\n{message}")
+        self.logger.error(f"Join error: {message}")
+
+    def done(self, result):
+        self.preview.cancel()
+        super().done(result)
 
 
 class SubqueryFilterDialog(QDialog):
@@ -2664,30 +2894,16 @@ class AggregationDialog(QDialog):
             if group_by == "(нет)":
                 group_by = None
 
-            having = None
-            if func and hcol and hop and hval:
-                # quote non-numeric value
-                try:
-                    float(hval)
-                    val_formatted = hval
-                except:
-                    val_formatted = f"'{hval}'"
-                having = f"{func}({hcol}) {hop} {val_formatted}"
-            
-            results, column_names = self.db_manager.execute_aggregation(
-                table, agg_func, agg_column, group_by, having
-            )
-            
-            sql = f"SELECT {agg_func}({agg_column})"
-            if group_by:
-                sql += f", {group_by}"
-            sql += f" FROM bank_system.{table}"
+            query = Select(table, [Aggregate(agg_func, agg_column)])
             if group_by:
-                sql += f" GROUP BY {group_by}"
-            if having:
-                sql += f" HAVING {having}"
-            
-            self.sql_label.setText(f"SQL: {sql}")
+                query.columns.append(group_by)
+                query.group(group_by)
+            if func and hcol and hop and hval:
+                query.having_filter(Condition(Aggregate(func, hcol), hop, coerce_value(hval)))
+
+            results, column_names = self.db_manager.execute_select(query)
+
+            self.sql_label.setText(f"SQL: {query_text(self.db_manager, query)}")
             
             self.result_table.setRowCount(len(results))
             self.result_table.setColumnCount(len(column_names))
@@ -2835,15 +3051,14 @@ class CaseConstructorDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Заполните все поля WHEN и THEN")
             return
 
-        # format value
         try:
-            float(val)
-            val_fmt = val
-        except:
-            val_fmt = f"'{val}'"
+            condition = Condition.parse(col, op, val)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", str(e))
+            return
 
-        when_expr = f"{col} {op} {val_fmt}"
-        self.when_then_pairs.append((when_expr, then))
+        when_expr = f"{col} {op} {val}"
+        self.when_then_pairs.append((when_expr, then, condition))
         self.when_list.addItem(f"WHEN {when_expr} THEN {then}")
         self.update_conditions_label()
         self.when_value_edit.clear()
@@ -2854,7 +3069,7 @@ class CaseConstructorDialog(QDialog):
             self.conditions_label.setText("Добавленные условия: нет")
         else:
             text = "Добавленные условия:\n"
-            for i, (when, then) in enumerate(self.when_then_pairs, 1):
+            for i, (when, then, _) in enumerate(self.when_then_pairs, 1):
                 text += f"{i}. WHEN {when} THEN {then}\n"
             self.conditions_label.setText(text)
     
@@ -2865,20 +3080,14 @@ class CaseConstructorDialog(QDialog):
                 return
             
             table = self.table_combo.currentText()
-            select_cols = self.select_edit.text().strip()
-            else_result = self.else_edit.text().strip()
-            
-            case_expr = "CASE"
-            for when, then in self.when_then_pairs:
-                case_expr += f" WHEN {when} THEN {then}"
-            case_expr += f" ELSE {else_result} END"
-            
-            results, column_names = self.db_manager.execute_case_expression(
-                table, case_expr, select_cols
-            )
-            
-            sql = f"SELECT {select_cols}, {case_expr} as case_result FROM bank_system.{table}"
-            self.sql_label.setText(f"SQL: {sql}")
+            select_cols = [col.strip() for col in self.select_edit.text().split(',') if col.strip()] or ['*']
+            case = Case([(condition, case_value(then)) for _, then, condition in self.when_then_pairs],
+                        case_value(self.else_edit.text()))
+            query = Select(table, select_cols + [case])
+
+            results, column_names = self.db_manager.execute_select(query)
+
+            self.sql_label.setText(f"SQL: {query_text(self.db_manager, query)}")
             
             self.result_table.setRowCount(len(results))
             self.result_table.setColumnCount(len(column_names))
@@ -3064,6 +3273,8 @@ class AdvancedGroupingDialog(QDialog):
             'accounts': ['client_id', 'currency_code', 'account_status'],
             'transactions': ['account_id', 'transaction_type', 'currency_code']
         }
+        # Куб транзакций загружается один раз и переиспользуется для всех перегруппировок
+        self.cube = None
         
         self.setup_ui()
     
@@ -3108,6 +3319,10 @@ class AdvancedGroupingDialog(QDialog):
         self.group_type_combo.addItems(['ROLLUP', 'CUBE', 'GROUPING_SETS'])
         top_layout.addWidget(self.group_type_combo, 1, 1)
         
+        self.local_cube_check = QCheckBox("Локальный куб транзакций (без повторных запросов)")
+        self.local_cube_check.toggled.connect(self.on_local_cube_toggled)
+        top_layout.addWidget(self.local_cube_check, 2, 0, 1, 2)
+        
         top_layout.addWidget(QLabel("WHERE условие (опционально):"), 1, 2)
         self.ag_where_col = QComboBox()
         top_layout.addWidget(self.ag_where_col, 1, 3)
@@ -3150,6 +3365,11 @@ class AdvancedGroupingDialog(QDialog):
         ag_clear_order_btn.clicked.connect(lambda: self.ag_order_col.setCurrentIndex(0))
         filter_layout.addWidget(ag_clear_order_btn, 0, 3)
         
+        self.reload_cube_btn = QPushButton("Перезагрузить куб")
+        self.reload_cube_btn.clicked.connect(self.reload_cube)
+        self.reload_cube_btn.setEnabled(False)
+        filter_layout.addWidget(self.reload_cube_btn, 1, 2)
+        
         execute_btn = QPushButton("Выполнить группировку")
         execute_btn.clicked.connect(self.execute_grouping)
         filter_layout.addWidget(execute_btn, 1, 3)
@@ -3157,10 +3377,9 @@ class AdvancedGroupingDialog(QDialog):
         layout.addLayout(filter_layout)
         
         # Таблица результатов
-        self.result_table = QTableWidget()
-        self.result_table.setColumnCount(0)
-        self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
-        self.result_table.verticalHeader().setDefaultSectionSize(30)
+        self.result_table, self.result_model, filter_edit = create_result_view()
+        self.result_table.doubleClicked.connect(self.drill_down)
+        layout.addWidget(filter_edit)
         layout.addWidget(self.result_table)
         
         self.sql_label = QLabel("SQL:")
@@ -3179,7 +3398,10 @@ class AdvancedGroupingDialog(QDialog):
     def update_column_checkboxes(self):
         """Обновляем checkboxes для колонок выбранной таблицы"""
         table = self.table_combo.currentText()
-        cols = self.table_columns.get(table, [])
+        if self.is_local_cube():
+            cols = TransactionCube.DIMENSIONS
+        else:
+            cols = self.table_columns.get(table, [])
         
         # Очищаем старые checkboxes
         if hasattr(self, 'columns_layout'):
@@ -3218,7 +3440,94 @@ class AdvancedGroupingDialog(QDialog):
     
     def on_table_changed(self):
         """При смене таблицы обновляем checkboxes"""
+        self.local_cube_check.setEnabled(self.table_combo.currentText() == 'transactions')
         self.update_column_checkboxes()
+        self.ag_where_list.clear()
+
+    def is_local_cube(self) -> bool:
+        return (hasattr(self, 'local_cube_check') and self.local_cube_check.isChecked()
+                and self.table_combo.currentText() == 'transactions')
+
+    def on_local_cube_toggled(self, checked):
+        self.reload_cube_btn.setEnabled(checked)
+        if checked:
+            self.group_type_combo.addItem('PIVOT')
+        else:
+            self.group_type_combo.removeItem(self.group_type_combo.findText('PIVOT'))
+        self.update_column_checkboxes()
+        self.ag_where_list.clear()
+
+    def load_cube(self, sync: bool) -> TransactionCube:
+        """Куб по локальной копии транзакций; без pyarrow - загрузка с сервера"""
+        replica = self.db_manager.analytics_replica
+        if not replica.available:
+            with self.db_manager.session('analytics'):
+                return TransactionCube.load(self.db_manager)
+        if sync or not replica.exists():
+            replica.sync()
+        return TransactionCube.from_replica(replica)
+
+    def reload_cube(self):
+        try:
+            self.cube = self.load_cube(sync=True)
+            QMessageBox.information(self, "Успех", f"Куб загружен: {len(self.cube)} транзакций")
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Ошибка загрузки куба:\n{str(e)}")
+            self.logger.error(f"Cube load error: {e}")
+
+    def cube_filters(self):
+        """Фильтры списка WHERE в виде {измерение: значения} для локального куба"""
+        filters = {}
+        for i in range(self.ag_where_list.count()):
+            condition = self.ag_where_list.item(i).data(Qt.ItemDataRole.UserRole)
+            col = condition.expr
+            if condition.op not in ('=', 'IN'):
+                raise ValueError(f"Локальный куб поддерживает только фильтры '=' и 'IN': {condition.label()}")
+            values = condition.value if condition.op == 'IN' else [condition.value]
+            labels = {str(label): label for label in self.cube.labels(col)}
+            wanted = {labels[str(v)] for v in values if str(v) in labels}
+            filters[col] = wanted if col not in filters else filters[col] & wanted
+        return filters
+
+    def execute_cube_grouping(self, group_type, selected_cols, order_col, order_dir):
+        if self.cube is None:
+            self.cube = self.load_cube(sync=False)
+        filters = self.cube_filters()
+        started = time.perf_counter()
+        if group_type == 'PIVOT':
+            if len(selected_cols) != 2:
+                QMessageBox.warning(self, "Ошибка", "Для PIVOT выберите две колонки: строки и столбцы")
+                return None
+            results, column_names = self.cube.pivot(selected_cols[0], selected_cols[1], filters=filters)
+        elif group_type == 'CUBE':
+            results, column_names = self.cube.cube(selected_cols, filters)
+        elif group_type == 'ROLLUP':
+            results, column_names = self.cube.rollup(selected_cols, filters)
+        else:
+            results, column_names = self.cube.grouping_sets(selected_cols, [[col] for col in selected_cols], filters)
+        if order_col in column_names:
+            position = column_names.index(order_col)
+            results.sort(key=lambda row: sort_key(row[position]), reverse=order_dir == 'DESC')
+        elapsed = (time.perf_counter() - started) * 1000
+        self.sql_label.setText(
+            f"Локальный куб: {group_type}({', '.join(selected_cols)}) по {len(self.cube)} транзакциям, {elapsed:.1f} мс"
+        )
+        return results, column_names
+
+    def drill_down(self, index):
+        """Двойной щелчок по строке агрегата локального куба показывает исходные транзакции"""
+        if not self.is_local_cube() or self.cube is None:
+            return
+        row = self.result_table.model().mapToSource(index).row()
+        headers = self.result_model.headers()
+        filters = self.cube_filters()
+        for position, col in enumerate(headers):
+            value = self.result_model.raw_value(row, position)
+            if col in TransactionCube.DIMENSIONS and value is not None:
+                filters[col] = {value}
+        results, column_names = self.cube.drill_down(filters)
+        self.result_model.set_rows(results, column_names)
+        self.sql_label.setText(f"Детализация: {filters} ({len(results)} транзакций)")
 
     def add_advanced_group_filter(self):
         col = self.ag_where_col.currentText()
@@ -3227,13 +3536,7 @@ class AdvancedGroupingDialog(QDialog):
         if not col or not op or val == '':
             QMessageBox.warning(self, "Ошибка", "Заполните фильтр")
             return
-        try:
-            float(val)
-            vf = val
-        except:
-            vf = f"'{val}'"
-        clause = f"{col} {op} {vf}"
-        self.ag_where_list.addItem(clause)
+        add_condition_item(self.ag_where_list, col, op, val)
         self.ag_where_val.clear()
     
     def execute_grouping(self):
@@ -3242,14 +3545,9 @@ class AdvancedGroupingDialog(QDialog):
             group_type = self.group_type_combo.currentText()
             # collect select columns
             sel_items = [self.select_columns_box.item(i).text() for i in range(self.select_columns_box.count()) if self.select_columns_box.item(i).isSelected()]
-            select_cols = ', '.join(sel_items) if sel_items else '*'
-            # where clauses
-            where_clauses = [self.ag_where_list.item(i).text() for i in range(self.ag_where_list.count())]
-            where = ' AND '.join(where_clauses) if where_clauses else None
             # order
             order_col = self.ag_order_col.currentText()
             order_dir = self.ag_order_dir.currentText()
-            order = f"{order_col} {order_dir}" if order_col else None
 
             # Получаем выбранные колонки для GROUP BY
             selected_cols = [col for col, cb in self.column_checkboxes.items() if cb.isChecked()]
@@ -3258,33 +3556,27 @@ class AdvancedGroupingDialog(QDialog):
                 QMessageBox.warning(self, "Ошибка", "Выберите хотя бы одну колонку для GROUP BY")
                 return
 
-            group_cols_str = ", ".join(selected_cols)
+            if self.is_local_cube():
+                cube_result = self.execute_cube_grouping(group_type, selected_cols, order_col, order_dir)
+                if cube_result is not None:
+                    self.result_model.set_rows(*cube_result)
+                return
 
             # При SELECT * с ROLLUP/CUBE/GROUPING_SETS нужно выбирать только GROUP BY колонки
             # или использовать агрегатные функции
-            if select_cols == '*':
-                select_cols = group_cols_str + ", COUNT(*) as count"
+            query = Select(table, sel_items or selected_cols + [Aggregate('COUNT')])
+            for condition in list_conditions(self.ag_where_list):
+                query.filter(condition)
+            query.group(*selected_cols, grouping=group_type)
+            if order_col:
+                query.order(order_col, order_dir == 'DESC')
 
-            results, column_names = self.db_manager.execute_advanced_grouping(
-                table, select_cols, group_type, selected_cols, where, None, order
-            )
+            with self.db_manager.session('analytics'):
+                results, column_names = self.db_manager.execute_select(query)
 
-            sql = f"SELECT {select_cols} FROM bank_system.{table}"
-            if where:
-                sql += f" WHERE {where}"
-            sql += f" GROUP BY {group_type}({group_cols_str})"
-            if order:
-                sql += f" ORDER BY {order}"
+            self.sql_label.setText(f"SQL: {query_text(self.db_manager, query)}")
 
-            self.sql_label.setText(f"SQL: {sql}")
-
-            self.result_table.setRowCount(len(results))
-            self.result_table.setColumnCount(len(column_names))
-            self.result_table.setHorizontalHeaderLabels(column_names)
-
-            for row_idx, row_data in enumerate(results):
-                for col_idx, value in enumerate(row_data):
-                    self.result_table.setItem(row_idx, col_idx, QTableWidgetItem(str(value)))
+            self.result_model.set_rows(results, column_names)
 
             QMessageBox.information(self, "Успех", f"Найдено записей: {len(results)}")
         except Exception as e:
@@ -3480,13 +3772,7 @@ class ViewManagementDialog(QDialog):
         if not col or not op or val == '':
             QMessageBox.warning(self, "Ошибка", "Заполните фильтр")
             return
-        try:
-            float(val)
-            vf = val
-        except:
-            vf = f"'{val}'"
-        clause = f"{col} {op} {vf}"
-        self.view_where_list.addItem(clause)
+        add_condition_item(self.view_where_list, col, op, val)
         self.view_where_val.clear()
 
     def create_view_from_builder(self):
@@ -3508,12 +3794,12 @@ class ViewManagementDialog(QDialog):
         if not selected_columns:
             QMessageBox.warning(self, "Ошибка", "Выберите хотя бы одну колонку")
             return
-        columns_str = ", ".join(f"bank_system.{table}.{c}" for c in selected_columns)
-        where_clauses = [self.view_where_list.item(i).text() for i in range(self.view_where_list.count())]
-        sql_query = f"SELECT {columns_str} FROM bank_system.{table}"
-        if where_clauses:
-            sql_query += " WHERE " + " AND ".join(where_clauses)
         try:
+            query = Select(table, selected_columns)
+            for condition in list_conditions(self.view_where_list):
+                query.filter(condition)
+            # Определение представления не может содержать параметров
+            sql_query = self.db_manager.render_sql(query.compile(LITERAL)[0])
             self.db_manager.create_view(view_name, sql_query)
             QMessageBox.information(self, "Успех", f"Представление '{view_name}' успешно создано")
             self.view_name_edit.clear()
@@ -3744,15 +4030,12 @@ class MaterializedViewManagementDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Выберите хотя бы одну колонку")
             return
 
-        # Собрать SQL запрос
-        columns_str = ", ".join(f"bank_system.{table_name}.{col}" for col in selected_columns)
-        sql_query = f"SELECT {columns_str} FROM bank_system.{table_name}"
-        # add where filters if any
-        where_clauses = [self.mv_where_list.item(i).text() for i in range(self.mv_where_list.count())]
-        if where_clauses:
-            sql_query += " WHERE " + " AND ".join(where_clauses)
-
         try:
+            # Собрать SQL запрос; значения фильтров встраиваются литералами
+            query = Select(table_name, selected_columns)
+            for condition in list_conditions(self.mv_where_list):
+                query.filter(condition)
+            sql_query = self.db_manager.render_sql(query.compile(LITERAL)[0])
             self.db_manager.create_materialized_view(view_name, sql_query)
             QMessageBox.information(self, "Успех", f"Материализованное представление '{view_name}' успешно создано")
             self.mview_name_edit.clear()
@@ -3802,13 +4085,7 @@ class MaterializedViewManagementDialog(QDialog):
         if not col or not op or val == '':
             QMessageBox.warning(self, "Ошибка", "Заполните фильтр")
             return
-        try:
-            float(val)
-            vf = val
-        except:
-            vf = f"'{val}'"
-        clause = f"{col} {op} {vf}"
-        self.mv_where_list.addItem(clause)
+        add_condition_item(self.mv_where_list, col, op, val)
         self.mv_where_val.clear()
     
     def load_mview_tables(self):
@@ -3963,10 +4240,16 @@ class CTEConstructorDialog(QDialog):
         # Кнопки действий
         buttons_layout = QHBoxLayout()
         
-        execute_btn = QPushButton("Выполнить запрос")
-        execute_btn.clicked.connect(self.execute_query)
-        execute_btn.setStyleSheet("background-color: #27AE60; color: white; font-weight: bold; padding: 5px;")
-        buttons_layout.addWidget(execute_btn)
+        self.preview = PreviewRunner(self.db_manager, self)
+        self.preview.finished.connect(self.display_results)
+        self.preview.failed.connect(self.show_error)
+        layout.addLayout(self.preview.controls())
+
+        self.execute_btn = QPushButton("Выполнить запрос")
+        self.execute_btn.clicked.connect(self.execute_query)
+        self.execute_btn.setStyleSheet("background-color: #27AE60; color: white; font-weight: bold; padding: 5px;")
+        self.preview.busy.connect(self.execute_btn.setDisabled)
+        buttons_layout.addWidget(self.execute_btn)
         
         copy_btn = QPushButton("Скопировать SQL")
         copy_btn.clicked.connect(self.copy_sql)
@@ -3983,7 +4266,8 @@ class CTEConstructorDialog(QDialog):
         
         # Результаты запроса
         layout.addWidget(QLabel("Результаты:"))
-        self.results_table = QTableWidget()
+        self.results_table, self.results_model, filter_edit = create_result_view()
+        layout.addWidget(filter_edit)
         layout.addWidget(self.results_table)
         
         self.setLayout(layout)
@@ -4098,13 +4382,15 @@ class CTEConstructorDialog(QDialog):
             QMessageBox.warning(self, "Ошибка", "Выберите хотя бы одну колонку")
             return
         
-        where_condition = self.cte_where_edit.toPlainText().strip()
+        query = Select(table_name, selected_columns)
+        for condition in list_conditions(self.cte_where_list):
+            query.filter(condition)
         
         # Сохранить CTE
         self.ctes[cte_name] = {
             'table': table_name,
             'selected_columns': selected_columns,
-            'where': where_condition
+            'query': query
         }
         
         # Добавить в таблицу
@@ -4119,7 +4405,7 @@ class CTEConstructorDialog(QDialog):
         
         # Очистить форму
         self.cte_name_edit.clear()
-        self.cte_where_edit.clear()
+        self.cte_where_list.clear()
         
         # Обновить комбобокс источников
         cte_names = list(self.ctes.keys())
@@ -4141,13 +4427,7 @@ class CTEConstructorDialog(QDialog):
         if not col or not op or val == '':
             QMessageBox.warning(self, "Ошибка", "Заполните фильтр CTE")
             return
-        try:
-            float(val)
-            vf = val
-        except:
-            vf = f"'{val}'"
-        clause = f"{col} {op} {vf}"
-        self.cte_where_list.addItem(clause)
+        add_condition_item(self.cte_where_list, col, op, val)
         self.cte_where_val.clear()
 
     def add_main_filter(self):
@@ -4157,13 +4437,7 @@ class CTEConstructorDialog(QDialog):
         if not col or not op or val == '':
             QMessageBox.warning(self, "Ошибка", "Заполните фильтр основного запроса")
             return
-        try:
-            float(val)
-            vf = val
-        except:
-            vf = f"'{val}'"
-        clause = f"{col} {op} {vf}"
-        self.main_where_list.addItem(clause)
+        add_condition_item(self.main_where_list, col, op, val)
         self.main_where_val.clear()
     
     def delete_cte(self, cte_name):
@@ -4188,26 +4462,8 @@ class CTEConstructorDialog(QDialog):
                 self.main_select_table_combo.setCurrentText(current_text)
             self.main_select_table_combo.blockSignals(False)
     
-    def build_sql(self):
-        """Построить SQL запрос"""
-        sql_parts = []
-        
-        # Построить WITH часть
-        if self.ctes:
-            cte_list = []
-            for cte_name, cte_info in self.ctes.items():
-                table = cte_info['table']
-                columns = ", ".join(cte_info['selected_columns'])
-                cte_sql = f"{cte_name} AS (SELECT {columns} FROM bank_system.{table}"
-                
-                if cte_info['where']:
-                    cte_sql += f" WHERE {cte_info['where']}"
-                
-                cte_sql += ")"
-                cte_list.append(cte_sql)
-            
-            sql_parts.append("WITH " + ",\n     ".join(cte_list))
-        
+    def build_query(self):
+        """Построить запрос: основной SELECT с CTE в WITH"""
         # Построить основной SELECT
         main_table = self.main_select_table_combo.currentText()
         if not main_table:
@@ -4225,61 +4481,43 @@ class CTEConstructorDialog(QDialog):
         if not selected_columns:
             return None
         
-        columns_str = ", ".join(selected_columns)
-        
         # Определить, это CTE или таблица
-        if main_table in self.ctes:
-            main_sql = f"SELECT {columns_str} FROM {main_table}"
-        else:
-            main_sql = f"SELECT {columns_str} FROM bank_system.{main_table}"
+        query = Select(main_table, selected_columns, schema=None if main_table in self.ctes else 'bank_system')
+        for cte_name, cte_info in self.ctes.items():
+            query.with_cte(cte_name, cte_info['query'])
+        for condition in list_conditions(self.main_where_list):
+            query.filter(condition)
         
-        main_where = self.main_where_edit.toPlainText().strip()
-        if main_where:
-            main_sql += f" WHERE {main_where}"
-        
-        sql_parts.append(main_sql)
-        
-        return "\n".join(sql_parts)
+        return query
     
     def execute_query(self):
         """Выполнить построенный запрос"""
-        sql = self.build_sql()
-        if not sql:
+        query = self.build_query()
+        if not query:
             QMessageBox.warning(self, "Ошибка", "Не удалось построить запрос")
             return
         
-        self.sql_preview.setText(sql)
-        
-        try:
-            results = self.db_manager.execute_query(sql)
-            self.display_results(results)
-        except Exception as e:
-            QMessageBox.critical(self, "Ошибка", f"Ошибка выполнения запроса:\n{str(e)}")
-            self.logger.error(f"CTE execute error: {e}")
-    
-    def display_results(self, results):
+        self.sql_preview.setText(query_text(self.db_manager, query))
+        self.preview.start(query)
+
+    def display_results(self, results, column_names, truncated):
         """Отобразить результаты запроса"""
-        if not results:
-            self.results_table.setRowCount(0)
-            self.results_table.setColumnCount(0)
-            return
-        
-        # Получить названия колонок
-        first_row = results[0]
-        columns = [str(i) for i in range(len(first_row))]
-        
-        self.results_table.setColumnCount(len(columns))
-        self.results_table.setHorizontalHeaderLabels(columns)
-        self.results_table.setRowCount(len(results))
-        
-        for row_idx, row_data in enumerate(results):
-            for col_idx, value in enumerate(row_data):
-                self.results_table.setItem(row_idx, col_idx, QTableWidgetItem(str(value)))
+        self.results_model.set_rows(results, column_names)
+        if truncated:
+            QMessageBox.information(self, "Результат", PreviewRunner.summary(results, truncated))
+
+    def show_error(self, message):
+        QMessageBox.critical(self, "Ошибка", f"Ошибка выполнения запроса:\n{message}")
+        self.logger.error(f"CTE execute error: {message}")
+
+    def done(self, result):
+        self.preview.cancel()
+        super().done(result)
     
     def copy_sql(self):
         """Скопировать SQL в буфер обмена"""
-        sql = self.build_sql()
-        if sql:
+        query = self.build_query()
+        if query:
             clipboard = QApplication.clipboard()
-            clipboard.setText(sql)
+            clipboard.setText(self.db_manager.render_sql(query.compile(LITERAL)[0]))
             QMessageBox.information(self, "Успех", "SQL скопирован в буфер обмена")
\ No newline at end of file
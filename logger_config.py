@@ -1,25 +1,92 @@
+import atexit
+import json
 import logging
-from datetime import datetime
+import logging.handlers
 import os
+import queue
+from typing import Optional
 
-def setup_logger(log_file: str = 'bank_app.log'):
-    log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    date_format = '%Y-%m-%d %H:%M:%S'
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        datefmt=date_format,
-        handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Структурированный журнал: одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': self.formatTime(record, DATE_FORMAT),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Передает запись в очередь без форматирования.
+
+    Стандартный QueueHandler подставляет аргументы сообщения в вызывающем
+    потоке; очередь здесь внутрипроцессная, поэтому запись передается как есть,
+    а форматирование и запись на диск выполняет поток QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logger(log_file: str = 'bank_app.log', json_format: Optional[bool] = None,
+                 max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5):
+    """Настройка журнала: очередь в вызывающих потоках, файл с ротацией и консоль в фоновом потоке.
+
+    Формат JSON включается параметром json_format или переменной окружения BANK_APP_LOG_JSON=1.
+    """
+    global _listener
+    if json_format is None:
+        json_format = os.environ.get('BANK_APP_LOG_JSON', '').lower() in ('1', 'true', 'yes')
+
+    shutdown_logging()
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
     )
-    
+    file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT, DATE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    root.addHandler(DeferredQueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, file_handler, stream_handler,
+                                               respect_handler_level=True)
+    _listener.start()
+
     logger = logging.getLogger('bank_app')
-    logger.info("="*60)
+    logger.info("=" * 60)
     logger.info("Application started")
-    logger.info("="*60)
-    
+    logger.info("=" * 60)
+
     return logger
 
+
+def shutdown_logging():
+    """Остановка фонового потока журнала с записью оставшихся в очереди сообщений"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+atexit.register(shutdown_logging)
@@ -1,11 +1,12 @@
 import sys
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
-                               QHBoxLayout, QPushButton, QLabel, QTextEdit,
-                               QGroupBox, QMessageBox, QSizePolicy, QScrollArea)
+                               QHBoxLayout, QPushButton, QLabel,
+                               QGroupBox, QMessageBox, QSizePolicy, QScrollArea, QProgressDialog)
 from PySide6.QtCore import Qt
 from PySide6.QtGui import QFont
 import logging
 from logger_config import setup_logger
+from activity_log import ActivityLogPanel
 from db_manager import DatabaseManager
 from gui_windows import (ConnectionDialog, AddDataDialog, ViewDataDialog,
                          AlterTableDialog, AdvancedSelectDialog, TextSearchDialog,
@@ -350,14 +351,13 @@ class BankSystemApp(QMainWindow):
 
         log_group = QGroupBox("Последние действия")
         log_layout = QVBoxLayout()
-        self.log_text = QTextEdit()
-        self.log_text.setReadOnly(True)
+        self.activity_log = ActivityLogPanel()
         # Allow the log area to resize with the window instead of forcing a
         # small limit which can push other widgets out of view or cause
         # clipping when the window is resized on different screens.
-        self.log_text.setMinimumHeight(150)
-        self.log_text.setStyleSheet("""
-            QTextEdit {
+        self.activity_log.setMinimumHeight(150)
+        self.activity_log.view.setStyleSheet("""
+            QListView {
                 background-color: #F8F9FA;
                 border: 1px solid #DDD;
                 border-radius: 3px;
@@ -365,7 +365,7 @@ class BankSystemApp(QMainWindow):
                 font-family: Consolas, monospace;
             }
         """)
-        log_layout.addWidget(self.log_text)
+        log_layout.addWidget(self.activity_log)
         log_group.setLayout(log_layout)
         main_layout.addWidget(log_group)
 
@@ -403,7 +403,8 @@ class BankSystemApp(QMainWindow):
                 port=int(params['port']),
                 database=params['database'],
                 user=params['user'],
-                password=params['password']
+                password=params['password'],
+                replica_dsns=params.get('replicas')
             )
 
             self.db_manager.connect()
@@ -438,7 +439,7 @@ class BankSystemApp(QMainWindow):
         except Exception as e:
             self.logger.error(f"Connection failed: {e}")
             QMessageBox.critical(self, "Ошибка подключения", str(e))
-            self.add_log(f"Ошибка подключения: {e}")
+            self.add_log(f"Ошибка подключения: {e}", logging.ERROR)
 
     def create_schema(self):
         if not self.is_connected:
@@ -446,11 +447,22 @@ class BankSystemApp(QMainWindow):
             return
 
         try:
-            with open('database_schema.sql', 'r', encoding='utf-8') as f:
-                sql_script = f.read()
+            progress = QProgressDialog("Применение database_schema.sql...", None, 0, 100, self)
+            progress.setWindowTitle("Создание схемы")
+            progress.setWindowModality(Qt.WindowModality.WindowModal)
+            progress.setMinimumDuration(500)
 
-            self.db_manager.execute_script(sql_script)
+            def report_progress(done, total, statements):
+                progress.setValue(int(done * 100 / total) if total else 100)
+                progress.setLabelText(f"Выполнено операторов: {statements}")
+                QApplication.processEvents()
 
+            try:
+                timings = self.db_manager.bootstrap_schema('database_schema.sql', progress=report_progress)
+            finally:
+                progress.close()
+
+            steps = "\n".join(f"- {step}: {seconds:.2f} с" for step, seconds in timings)
             QMessageBox.information(
                 self,
                 "Успех",
@@ -460,16 +472,19 @@ class BankSystemApp(QMainWindow):
                 "- Типы ENUM (transaction_type, account_status)\n"
                 "- 5 таблиц с ограничениями\n"
                 "- Индексы для оптимизации\n"
-                "- Тестовые данные (валюты, курсы, клиенты, счета, транзакции)"
+                "- Тестовые данные (валюты, курсы, клиенты, счета, транзакции)\n\n"
+                f"Время шагов:\n{steps}"
             )
             self.add_log("Схема БД создана с тестовыми данными")
+            for step, seconds in timings:
+                self.add_log(f"Развертывание схемы: {step} - {seconds:.2f} с")
 
         except FileNotFoundError:
             QMessageBox.critical(self, "Ошибка", "Файл database_schema.sql не найден")
-            self.add_log("Ошибка: файл схемы не найден")
+            self.add_log("Ошибка: файл схемы не найден", logging.ERROR)
         except Exception as e:
             QMessageBox.critical(self, "Ошибка", f"Не удалось создать схему:\n{str(e)}")
-            self.add_log(f"Ошибка создания схемы: {e}")
+            self.add_log(f"Ошибка создания схемы: {e}", logging.ERROR)
 
     def drop_schema(self):
         reply = QMessageBox.question(
@@ -501,14 +516,14 @@ class BankSystemApp(QMainWindow):
                         "Предупреждение",
                         "Не удалось удалить схему bank_system"
                     )
-                    self.add_log("Предупреждение: не удалось удалить схему")
+                    self.add_log("Предупреждение: не удалось удалить схему", logging.WARNING)
             except Exception as e:
                 QMessageBox.critical(
                     self,
                     "Ошибка",
                     f"Не удалось удалить схему:\n{str(e)}"
                 )
-                self.add_log(f"Ошибка удаления схемы: {e}")
+                self.add_log(f"Ошибка удаления схемы: {e}", logging.ERROR)
 
     def show_insert_dialog(self):
         if not self.is_connected:
@@ -661,8 +676,8 @@ class BankSystemApp(QMainWindow):
         dialog.exec()
         self.add_log("Открыто окно конструктора CTE")
 
-    def add_log(self, message: str):
-        self.log_text.append(f"• {message}")
+    def add_log(self, message: str, level: int = logging.INFO):
+        self.activity_log.add(message, level)
 
     def closeEvent(self, event):
         if self.db_manager:
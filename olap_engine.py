@@ -0,0 +1,276 @@
+import logging
+from array import array
+from decimal import Decimal
+from itertools import combinations
+from math import prod
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from columnar_result import ColumnarResult, np
+
+_INT64_MAX = 2 ** 63 - 1
+
+
+class TransactionCube:
+    """Локальный OLAP-куб транзакций.
+
+    Транзакции вместе со счетами и клиентами загружаются с сервера один раз
+    в столбцовом виде; группировки, ROLLUP, CUBE, сводные таблицы и
+    детализация считаются в памяти по кодам измерений без повторных запросов.
+    Суммы считаются точно в целых, масштабированных как NUMERIC столбца.
+    """
+
+    DIMENSIONS = ['transaction_type', 'currency_code', 'employee_name', 'month',
+                  'full_name', 'is_vip', 'account_id']
+    MEASURES = ['amount', 'commission']
+
+    LOAD_QUERY = """
+        SELECT t.transaction_id, t.transaction_type, t.currency_code, t.employee_name,
+               to_char(t.transaction_date, 'YYYY-MM') AS month,
+               c.full_name, c.is_vip, t.account_id,
+               t.amount, COALESCE(t.commission, 0) AS commission,
+               t.exchange_rate, t.transaction_date, t.description
+        FROM bank_system.transactions t
+        JOIN bank_system.currency_accounts a ON t.account_id = a.account_id
+        JOIN bank_system.clients c ON a.client_id = c.client_id
+    """
+
+    def __init__(self, data: ColumnarResult):
+        self.logger = logging.getLogger('TransactionCube')
+        self.data = data
+        self._codes: Dict[str, Any] = {}
+        self._labels: Dict[str, List[Any]] = {}
+        # Меры: (целые значения, scale) - сумма делится на 10**scale только в конце
+        self._measures: Dict[str, Tuple[Any, int]] = {}
+        for dim in self.DIMENSIONS:
+            self._codes[dim], self._labels[dim] = self._factorize(dim)
+        for measure in self.MEASURES:
+            self._measures[measure] = data.scaled(measure)
+
+    @classmethod
+    def load(cls, db_manager, where: str = "", params: tuple = None) -> 'TransactionCube':
+        query = cls.LOAD_QUERY
+        if where:
+            query += f" WHERE {where}"
+        cursor = db_manager.connection.cursor()
+        try:
+            cursor.execute(query, params)
+            data = ColumnarResult.from_cursor(cursor)
+            db_manager.connection.commit()
+        except Exception:
+            db_manager.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        cube = cls(data)
+        cube.logger.info(f"Transaction cube loaded: {len(data)} rows, {data.nbytes()} bytes")
+        return cube
+
+    @classmethod
+    def from_replica(cls, replica) -> 'TransactionCube':
+        """Куб по локальной копии транзакций (TransactionReplica) без обращения к серверу"""
+        table = replica.load()
+        # Столбцы в порядке LOAD_QUERY, ключи клиента и номер счета в кубе не нужны
+        columns = [name for name in table.column_names if name not in ('client_id', 'account_number')]
+        data = ColumnarResult.from_arrow(table.select(columns))
+        cube = cls(data)
+        cube.logger.info(f"Transaction cube built from local replica: {len(data)} rows, {data.nbytes()} bytes")
+        return cube
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def _factorize(self, dim: str) -> Tuple[Any, List[Any]]:
+        if self.data.kind(dim) == 'category':
+            codes, labels = self.data.codes(dim)
+            labels = list(labels)
+            nulls = self.data.nulls(dim)
+            if any(nulls):
+                # NULL получает отдельный код в конце словаря
+                codes = array('i', (len(labels) if null else code for code, null in zip(codes, nulls)))
+                labels.append(None)
+        elif np is not None and self.data.kind(dim) in ('int', 'bool') and 1 not in self.data.nulls(dim):
+            # Целые без NULL (account_id, is_vip) кодируются векторно
+            unique, inverse = np.unique(self.data.numeric(dim), return_inverse=True)
+            cast = bool if self.data.kind(dim) == 'bool' else int
+            return inverse.astype(np.int32), [cast(value) for value in unique.tolist()]
+        else:
+            index: Dict[Any, int] = {}
+            labels = []
+            codes = array('i')
+            for value in self.data.column(dim):
+                code = index.get(value)
+                if code is None:
+                    code = index[value] = len(labels)
+                    labels.append(value)
+                codes.append(code)
+        if np is not None:
+            codes = np.frombuffer(codes, dtype=np.int32)
+        return codes, labels
+
+    def labels(self, dim: str) -> List[Any]:
+        return list(self._labels[dim])
+
+    def _mask(self, filters: Optional[Dict[str, Iterable[Any]]]):
+        """Маска строк, удовлетворяющих фильтрам {измерение: допустимые значения}"""
+        if not filters:
+            return None
+        mask = None
+        for dim, values in filters.items():
+            wanted = set(values)
+            allowed = [code for code, label in enumerate(self._labels[dim]) if label in wanted]
+            codes = self._codes[dim]
+            if np is not None:
+                dim_mask = np.isin(codes, allowed)
+                mask = dim_mask if mask is None else mask & dim_mask
+            else:
+                allowed = set(allowed)
+                dim_mask = [code in allowed for code in codes]
+                mask = dim_mask if mask is None else [a and b for a, b in zip(mask, dim_mask)]
+        return mask
+
+    @staticmethod
+    def _group_sums(inverse, values, groups: int):
+        """Точные суммы целых по группам; при риске переполнения int64 - в целых Python"""
+        if len(values) and int(np.abs(values).max()) * len(values) > _INT64_MAX:
+            sums = np.zeros(groups, dtype=object)
+            np.add.at(sums, inverse, values.astype(object))
+        else:
+            sums = np.zeros(groups, dtype=np.int64)
+            np.add.at(sums, inverse, values)
+        return sums.tolist()
+
+    def _aggregate(self, dims: Sequence[str], mask) -> Dict[Tuple[int, ...], List]:
+        """Базовая агрегация: {коды измерений: [count, sum(amount), sum(commission)]}.
+
+        Суммы - целые в масштабе меры (см. _total).
+        """
+        sizes = [len(self._labels[dim]) for dim in dims]
+        if np is not None:
+            codes = [self._codes[dim] for dim in dims]
+            amount = self._measures['amount'][0]
+            commission = self._measures['commission'][0]
+            if mask is not None:
+                codes = [column[mask] for column in codes]
+                amount, commission = amount[mask], commission[mask]
+            if prod(sizes) <= _INT64_MAX:
+                # Коды измерений складываются в один ключ int64 (смешанная система счисления)
+                key = np.zeros(len(amount), dtype=np.int64)
+                for column, size in zip(codes, sizes):
+                    key = key * size + column
+                groups, inverse = np.unique(key, return_inverse=True)
+                keys = []
+                for g in groups.tolist():
+                    key_codes = []
+                    for size in reversed(sizes):
+                        g, code = divmod(g, size)
+                        key_codes.append(code)
+                    keys.append(tuple(reversed(key_codes)))
+            else:
+                # Ключ не помещается в int64: уникальные строки матрицы кодов
+                groups, inverse = np.unique(np.stack(codes, axis=1), axis=0, return_inverse=True)
+                keys = [tuple(row) for row in groups.tolist()]
+            inverse = inverse.reshape(-1)
+            counts = np.bincount(inverse, minlength=len(keys)).tolist()
+            amounts = self._group_sums(inverse, amount, len(keys))
+            commissions = self._group_sums(inverse, commission, len(keys))
+            return {key: [count, total, comm]
+                    for key, count, total, comm in zip(keys, counts, amounts, commissions)}
+
+        result: Dict[Tuple[int, ...], List] = {}
+        columns = [self._codes[dim] for dim in dims]
+        amount = self._measures['amount'][0]
+        commission = self._measures['commission'][0]
+        for row in range(len(self.data)):
+            if mask is not None and not mask[row]:
+                continue
+            key = tuple(col[row] for col in columns)
+            acc = result.get(key)
+            if acc is None:
+                result[key] = [1, amount[row], commission[row]]
+            else:
+                acc[0] += 1
+                acc[1] += amount[row]
+                acc[2] += commission[row]
+        return result
+
+    @staticmethod
+    def _roll(base: Dict[Tuple[int, ...], List], keep: Sequence[int]) -> Dict[Tuple, List]:
+        """Свертка готовой агрегации до подмножества измерений (позиции keep)"""
+        result: Dict[Tuple, List] = {}
+        for key, (count, total, comm) in base.items():
+            sub = tuple(key[i] if i in keep else None for i in range(len(key)))
+            acc = result.get(sub)
+            if acc is None:
+                result[sub] = [count, total, comm]
+            else:
+                acc[0] += count
+                acc[1] += total
+                acc[2] += comm
+        return result
+
+    def _total(self, measure: str, raw: int) -> Decimal:
+        return Decimal(raw).scaleb(-self._measures[measure][1])
+
+    def _rows(self, dims: Sequence[str], grouped: Dict[Tuple, List]) -> List[Tuple]:
+        rows = []
+        for key, (count, total, comm) in grouped.items():
+            labels = tuple(None if code is None else self._labels[dim][code]
+                           for dim, code in zip(dims, key))
+            rows.append(labels + (count, self._total('amount', total), self._total('commission', comm)))
+        return rows
+
+    def _columns(self, dims: Sequence[str]) -> List[str]:
+        return list(dims) + ['count', 'sum_amount', 'sum_commission']
+
+    def group_by(self, dims: Sequence[str],
+                 filters: Dict[str, Iterable[Any]] = None) -> Tuple[List[Tuple], List[str]]:
+        grouped = self._aggregate(dims, self._mask(filters))
+        return self._rows(dims, grouped), self._columns(dims)
+
+    def grouping_sets(self, dims: Sequence[str], sets: Iterable[Sequence[str]],
+                      filters: Dict[str, Iterable[Any]] = None) -> Tuple[List[Tuple], List[str]]:
+        """Несколько группировок за один проход: наборы сворачиваются из самой детальной"""
+        base = self._aggregate(dims, self._mask(filters))
+        rows = []
+        for grouping in sets:
+            keep = [dims.index(dim) for dim in grouping]
+            rows.extend(self._rows(dims, self._roll(base, keep)))
+        return rows, self._columns(dims)
+
+    def rollup(self, dims: Sequence[str],
+               filters: Dict[str, Iterable[Any]] = None) -> Tuple[List[Tuple], List[str]]:
+        sets = [dims[:n] for n in range(len(dims), -1, -1)]
+        return self.grouping_sets(dims, sets, filters)
+
+    def cube(self, dims: Sequence[str],
+             filters: Dict[str, Iterable[Any]] = None) -> Tuple[List[Tuple], List[str]]:
+        sets = [list(subset) for n in range(len(dims), -1, -1) for subset in combinations(dims, n)]
+        return self.grouping_sets(dims, sets, filters)
+
+    def pivot(self, row_dim: str, col_dim: str, measure: str = 'sum_amount',
+              filters: Dict[str, Iterable[Any]] = None) -> Tuple[List[Tuple], List[str]]:
+        """Сводная таблица: строки - row_dim, столбцы - значения col_dim, плюс итог"""
+        position = {'count': 0, 'sum_amount': 1, 'sum_commission': 2}[measure]
+        base = self._aggregate([row_dim, col_dim], self._mask(filters))
+        col_codes = sorted({key[1] for key in base}, key=lambda c: str(self._labels[col_dim][c]))
+        row_codes = sorted({key[0] for key in base}, key=lambda c: str(self._labels[row_dim][c]))
+        rows = []
+        for r in row_codes:
+            values = [base.get((r, c), [0, 0, 0])[position] for c in col_codes]
+            if position:
+                values = [self._total(self.MEASURES[position - 1], value) for value in values]
+            rows.append((self._labels[row_dim][r],) + tuple(values) + (sum(values),))
+        headers = [row_dim] + [str(self._labels[col_dim][c]) for c in col_codes] + ['Итого']
+        return rows, headers
+
+    def drill_down(self, filters: Dict[str, Iterable[Any]], limit: int = 1000) -> Tuple[List[Tuple], List[str]]:
+        """Исходные транзакции, попавшие в ячейку агрегата"""
+        mask = self._mask(filters)
+        rows = []
+        for row in range(len(self.data)):
+            if mask is not None and not mask[row]:
+                continue
+            rows.append(self.data[row])
+            if len(rows) >= limit:
+                break
+        return rows, self.data.column_names
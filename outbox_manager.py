@@ -0,0 +1,122 @@
+import logging
+from typing import Callable, List, Optional, Tuple
+
+
+class OutboxConsumer:
+    """Потребитель событий outbox (transaction_events) с сохраняемым курсором.
+
+    События пишутся триггером trg_transactions_outbox в той же транзакции, что и
+    сама транзакция. Курсор потребителя - пара (tx_id, event_id) последнего
+    обработанного события; читаются только события транзакций, завершившихся
+    раньше всех еще активных, поэтому событие с меньшим event_id, закоммиченное
+    позже, не будет пропущено. Один потребитель рассчитан на один обработчик.
+    """
+
+    EVENT_COLUMNS = ['event_id', 'tx_id', 'transaction_id', 'event_type', 'payload', 'created_at']
+
+    def __init__(self, db_manager, consumer_name: str):
+        self.db_manager = db_manager
+        self.consumer_name = consumer_name
+        self.logger = logging.getLogger('OutboxConsumer')
+        self.register()
+
+    def register(self):
+        self.db_manager.execute_query(
+            """
+                INSERT INTO bank_system.outbox_consumers (consumer_name)
+                VALUES (%s)
+                ON CONFLICT (consumer_name) DO NOTHING
+            """,
+            (self.consumer_name,)
+        )
+
+    def position(self) -> Tuple[str, int]:
+        """Текущий курсор потребителя: (last_tx_id, last_event_id)"""
+        rows = self.db_manager.execute_query(
+            "SELECT last_tx_id, last_event_id FROM bank_system.outbox_consumers WHERE consumer_name = %s",
+            (self.consumer_name,)
+        )
+        return rows[0]
+
+    def fetch_batch(self, limit: int = 500) -> List[Tuple]:
+        """Следующая пачка необработанных событий в порядке (tx_id, event_id)"""
+        query = """
+            SELECT e.event_id, e.tx_id, e.transaction_id, e.event_type, e.payload, e.created_at
+            FROM bank_system.transaction_events e
+            JOIN bank_system.outbox_consumers c ON c.consumer_name = %s
+            WHERE (e.tx_id, e.event_id) > (c.last_tx_id, c.last_event_id)
+              AND e.tx_id < pg_snapshot_xmin(pg_current_snapshot())
+            ORDER BY e.tx_id, e.event_id
+            LIMIT %s
+        """
+        return self.db_manager.execute_query(query, (self.consumer_name, limit))
+
+    def ack(self, events: List[Tuple]):
+        """Сдвиг курсора на последнее событие обработанной пачки"""
+        if not events:
+            return
+        event_id, tx_id = events[-1][0], events[-1][1]
+        self.db_manager.execute_query(
+            """
+                UPDATE bank_system.outbox_consumers
+                SET last_tx_id = %s::xid8, last_event_id = %s, updated_at = CURRENT_TIMESTAMP
+                WHERE consumer_name = %s
+            """,
+            (str(tx_id), event_id, self.consumer_name)
+        )
+        self.logger.info(f"Consumer {self.consumer_name} acknowledged events up to {event_id}")
+
+    def poll(self, handler: Callable[[List[Tuple]], None], batch_size: int = 500,
+             max_batches: Optional[int] = None) -> int:
+        """Обработка новых событий пачками до опустошения очереди.
+
+        Курсор сдвигается только после успешного вызова handler, поэтому при
+        ошибке пачка будет прочитана повторно (доставка не менее одного раза).
+        """
+        processed = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            events = self.fetch_batch(batch_size)
+            if not events:
+                break
+            handler(events)
+            self.ack(events)
+            processed += len(events)
+            batches += 1
+        return processed
+
+    def lag(self) -> int:
+        """Количество событий, еще не обработанных потребителем"""
+        rows = self.db_manager.execute_query(
+            """
+                SELECT COUNT(*)
+                FROM bank_system.transaction_events e
+                JOIN bank_system.outbox_consumers c ON c.consumer_name = %s
+                WHERE (e.tx_id, e.event_id) > (c.last_tx_id, c.last_event_id)
+            """,
+            (self.consumer_name,)
+        )
+        return rows[0][0]
+
+
+def purge_consumed_events(db_manager) -> int:
+    """Удаление событий, уже обработанных всеми зарегистрированными потребителями"""
+    cursor = db_manager.connection.cursor()
+    try:
+        cursor.execute("""
+            DELETE FROM bank_system.transaction_events e
+            WHERE NOT EXISTS (
+                SELECT 1 FROM bank_system.outbox_consumers c
+                WHERE (e.tx_id, e.event_id) > (c.last_tx_id, c.last_event_id)
+            )
+            AND EXISTS (SELECT 1 FROM bank_system.outbox_consumers)
+        """)
+        deleted = cursor.rowcount
+        db_manager.connection.commit()
+        logging.getLogger('OutboxConsumer').info(f"Purged {deleted} consumed outbox events")
+        return deleted
+    except Exception:
+        db_manager.connection.rollback()
+        raise
+    finally:
+        cursor.close()
@@ -0,0 +1,144 @@
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+class PermissionCache:
+    """Проверка clients.allowed_operations при проведении транзакций без лишних запросов.
+
+    В памяти хранятся счет -> клиент и клиент -> битовая маска разрешенных
+    transaction_type (бит - порядковый номер значения в ENUM). Проверка - два
+    обращения к словарям; недостающие счета загружаются одним запросом на
+    пачку. Записи сбрасываются по уведомлениям об изменении clients и
+    currency_accounts; пока слушатель уведомлений не работает, кэш не
+    используется между вызовами, а запуск слушателя повторяется не чаще
+    раза в LISTEN_RETRY_INTERVAL секунд.
+    """
+
+    LISTEN_RETRY_INTERVAL = 30.0
+
+    BITS_QUERY = "SELECT unnest(enum_range(NULL::bank_system.transaction_type))::text"
+
+    ACCOUNTS_QUERY = """
+        SELECT a.account_id, a.client_id,
+               (SELECT COALESCE(bit_or(1 << (array_position(enum_range(NULL::bank_system.transaction_type), op) - 1)), 0)
+                FROM unnest(c.allowed_operations) AS op)
+        FROM bank_system.currency_accounts a
+        JOIN bank_system.clients c ON c.client_id = a.client_id
+        WHERE a.account_id = ANY(%s)
+    """
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.logger = logging.getLogger('PermissionCache')
+        self._lock = threading.Lock()
+        self._bits: Dict[str, int] = {}
+        self._account_clients: Dict[int, int] = {}
+        self._client_masks: Dict[int, int] = {}
+        # Счетчик сбросов: маски, прочитанные до уведомления, не сохраняются
+        self._version = 0
+        self._subscribed = False
+        self._live = False
+        self._warned = False
+        self._retry_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self._bits = {}
+            self._account_clients = {}
+            self._client_masks = {}
+
+    def _on_change(self, table: str, op: str, ids: List[int]):
+        with self._lock:
+            self._version += 1
+            if table == 'clients':
+                for client_id in ids:
+                    self._client_masks.pop(client_id, None)
+            elif table == 'currency_accounts':
+                for account_id in ids:
+                    self._account_clients.pop(account_id, None)
+
+    def _ensure_live(self):
+        if self._live and self.db_manager.is_listening():
+            return
+        # Пока уведомления не приходили, сохраненные маски могли устареть
+        self.invalidate()
+        self._live = False
+        now = time.monotonic()
+        if now < self._retry_at:
+            return
+        try:
+            if self._subscribed:
+                self.db_manager.start_listener()
+            else:
+                # Подписка регистрируется один раз, даже если запуск слушателя не удался
+                self._subscribed = True
+                self.db_manager.add_change_listener(self._on_change)
+            self._live = True
+            self._warned = False
+        except Exception as e:
+            self._retry_at = now + self.LISTEN_RETRY_INTERVAL
+            if not self._warned:
+                self.logger.warning("Permission cache runs without change notifications: %s", e)
+                self._warned = True
+
+    def _load(self, account_ids: Set[int]) -> Tuple[Dict[int, int], Dict[str, int]]:
+        with self._lock:
+            version = self._version
+        cursor = self.db_manager.connection.cursor()
+        try:
+            if not self._bits:
+                cursor.execute(self.BITS_QUERY)
+                bits = {label: 1 << i for i, (label,) in enumerate(cursor.fetchall())}
+            else:
+                bits = self._bits
+            cursor.execute(self.ACCOUNTS_QUERY, (list(account_ids),))
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        with self._lock:
+            # Уведомление во время запроса могло относиться к прочитанным строкам
+            if self._version == version:
+                self._bits = bits
+                for account_id, client_id, mask in rows:
+                    self._account_clients[account_id] = client_id
+                    self._client_masks[client_id] = mask
+        self.logger.debug("Loaded permissions for %d accounts", len(rows))
+        return {account_id: mask for account_id, client_id, mask in rows}, bits
+
+    def check_many(self, postings: Iterable[Tuple[int, str]]):
+        """Проверка пар (account_id, transaction_type); ValueError на первой запрещенной операции"""
+        postings = [(int(account_id), str(trans_type)) for account_id, trans_type in postings]
+        if not postings:
+            return
+        self._ensure_live()
+        masks: Dict[int, int] = {}
+        with self._lock:
+            for account_id, _ in postings:
+                mask = self._client_masks.get(self._account_clients.get(account_id))
+                if mask is not None:
+                    masks[account_id] = mask
+            missing = {account_id for account_id, _ in postings if account_id not in masks}
+            bits = self._bits
+        if missing or not bits:
+            # Загруженные маски используются напрямую: уведомление могло сбросить их сразу после загрузки
+            loaded, bits = self._load(missing)
+            masks.update(loaded)
+        for account_id, trans_type in postings:
+            bit = bits.get(trans_type)
+            if bit is None:
+                raise ValueError(f"Неизвестный тип операции: {trans_type}")
+            mask = masks.get(account_id)
+            if mask is None:
+                raise ValueError(f"Счет {account_id} не найден")
+            if not mask & bit:
+                raise ValueError(f"Операция {trans_type} не разрешена клиенту счета {account_id}")
+        if not self._live:
+            with self._lock:
+                self._account_clients = {}
+                self._client_masks = {}
+
+    def check(self, account_id: int, trans_type: str):
+        self.check_many([(account_id, trans_type)])
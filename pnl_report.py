@@ -0,0 +1,185 @@
+import logging
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+
+from rate_manager import HOME_CURRENCY
+from transaction_types import BALANCE_SIGNS, QUOTE_RATES, signed_case
+
+# Позиция банка по валюте меняется противоположно счету клиента
+_BANK_SIGNS = {trans_type: -BALANCE_SIGNS[trans_type] for trans_type in QUOTE_RATES}
+_CLIENT_SIGNS = {trans_type: BALANCE_SIGNS[trans_type] for trans_type in QUOTE_RATES}
+
+
+class PnLReport:
+    """Отчет о валютных позициях и доходах банка по операциям BUY/SELL.
+
+    Операции записываются со стороны клиента (transaction_types): BUY клиента -
+    банк продает валюту по sell_rate, SELL клиента - банк покупает по buy_rate.
+    SELL увеличивает позицию банка по валюте (bought_amount), BUY уменьшает
+    (sold_amount). Спредовый доход считается относительно среднего курса
+    (buy_rate + sell_rate) / 2, действовавшего на момент транзакции, и положителен
+    для сделок по котировке; комиссионный - по полю commission.
+    Отчет строится одним запросом с GROUPING SETS; закрытые дни читаются из
+    таблицы pnl_daily_snapshots, и пересчитываются только дни после последнего снимка
+    и снимки, посчитанные по формуле другой версии (formula_version). Снимки
+    архивных месяцев пишет TransactionArchive.archive() до удаления их строк;
+    потом они не пересчитываются, так как транзакций месяца в таблице уже нет.
+    """
+
+    # Версия формул DAILY_QUERY; снимки с другой версией пересчитываются
+    FORMULA_VERSION = 2
+
+    METRICS = ['net_position', 'bought_amount', 'sold_amount', 'spread_income',
+               'commission_income', 'transactions_count', 'unpriced_count']
+
+    COLUMNS = ['day', 'currency_code', 'employee_name', 'grouping_level'] + METRICS
+
+    # Дневная агрегация по сырым транзакциям за [live_from, date_to)
+    DAILY_QUERY = f"""
+        SELECT t.transaction_date::date AS snapshot_date, t.currency_code, t.employee_name,
+               SUM({signed_case('t.amount', _BANK_SIGNS, 't.transaction_type')}) AS net_position,
+               SUM(CASE WHEN t.transaction_type = 'SELL' THEN t.amount ELSE 0 END) AS bought_amount,
+               SUM(CASE WHEN t.transaction_type = 'BUY' THEN t.amount ELSE 0 END) AS sold_amount,
+               COALESCE(SUM({signed_case('(t.exchange_rate - r.mid_rate) * t.amount', _CLIENT_SIGNS,
+                                         't.transaction_type')}), 0) AS spread_income,
+               SUM(COALESCE(t.commission, 0)) AS commission_income,
+               COUNT(*) AS transactions_count,
+               COUNT(*) FILTER (WHERE t.transaction_type IN ('BUY', 'SELL')
+                                  AND (r.mid_rate IS NULL OR t.exchange_rate IS NULL)) AS unpriced_count
+        FROM bank_system.transactions t
+        LEFT JOIN LATERAL (
+            SELECT (er.buy_rate + er.sell_rate) / 2 AS mid_rate
+            FROM bank_system.exchange_rates er
+            WHERE er.base_currency = t.currency_code
+              AND er.target_currency = %(home_currency)s
+              AND er.rate_date <= t.transaction_date
+            ORDER BY er.rate_date DESC, er.rate_id DESC
+            LIMIT 1
+        ) r ON t.transaction_type IN ('BUY', 'SELL')
+        WHERE t.is_completed
+          AND t.transaction_date >= %(live_from)s
+          AND t.transaction_date < %(date_to)s
+        GROUP BY 1, 2, 3
+    """
+
+    def __init__(self, db_manager, home_currency: str = HOME_CURRENCY):
+        self.db_manager = db_manager
+        self.home_currency = home_currency
+        self.logger = logging.getLogger('PnLReport')
+
+    def last_snapshot_date(self) -> Optional[date]:
+        rows = self.db_manager.execute_query("SELECT MAX(snapshot_date) FROM bank_system.pnl_daily_snapshots")
+        return rows[0][0] if rows else None
+
+    def recompute_from(self) -> Optional[date]:
+        """Первый день для пересчета снимков или None, если снимков нет.
+
+        Это последний день со снимком (он мог быть неполным) либо самый ранний
+        снимок, посчитанный по формулам другой версии.
+        """
+        rows = self.db_manager.execute_query("""
+            SELECT LEAST(MAX(snapshot_date), MIN(snapshot_date) FILTER (WHERE formula_version <> %s))
+            FROM bank_system.pnl_daily_snapshots
+        """, (self.FORMULA_VERSION,))
+        return rows[0][0] if rows else None
+
+    def archived_until(self, fresh: bool = False) -> Optional[date]:
+        """Первый день после последнего архивного месяца или None, если архива нет"""
+        if fresh:
+            self.db_manager.archive.reset()
+        months = [month for month, _, _ in self.db_manager.archive.manifest()]
+        if not months:
+            return None
+        # Первое число следующего месяца
+        return (max(months).replace(day=28) + timedelta(days=4)).replace(day=1)
+
+    def write_snapshots(self, cursor, from_date: date, to_date: date) -> int:
+        """Замена снимков дней [from_date, to_date) пересчетом по транзакциям; без фиксации"""
+        params = {'home_currency': self.home_currency, 'live_from': from_date,
+                  'date_to': to_date, 'formula_version': self.FORMULA_VERSION}
+        columns = ', '.join(['snapshot_date', 'currency_code', 'employee_name'] + self.METRICS)
+        cursor.execute("DELETE FROM bank_system.pnl_daily_snapshots WHERE snapshot_date >= %s AND snapshot_date < %s",
+                       (from_date, to_date))
+        cursor.execute(f"""
+            INSERT INTO bank_system.pnl_daily_snapshots ({columns}, formula_version)
+            SELECT daily.*, %(formula_version)s FROM ({self.DAILY_QUERY}) daily
+        """, params)
+        return cursor.rowcount
+
+    def refresh_snapshots(self, from_date: Optional[date] = None) -> int:
+        """Пересчет дневных снимков начиная с from_date (по умолчанию - с recompute_from()).
+
+        Архивные месяцы не пересчитываются: from_date сдвигается на archived_until().
+        """
+        if from_date is None:
+            from_date = self.recompute_from() or date(1970, 1, 1)
+        archived_until = self.archived_until(fresh=True)
+        if archived_until and from_date < archived_until:
+            self.logger.info(f"P&L snapshots before {archived_until} are archived and kept")
+            from_date = archived_until
+        cursor = self.db_manager.connection.cursor()
+        try:
+            inserted = self.write_snapshots(cursor, from_date, date.today() + timedelta(days=1))
+            self.db_manager.connection.commit()
+            self.logger.info(f"P&L snapshots refreshed from {from_date}: {inserted} rows")
+            return inserted
+        except Exception as e:
+            self.db_manager.connection.rollback()
+            self.logger.error(f"Error refreshing P&L snapshots: {e}")
+            raise
+        finally:
+            cursor.close()
+
+    def get_report(self, from_date: Optional[date] = None, to_date: Optional[date] = None,
+                   use_snapshots: bool = True) -> Tuple[List[Tuple], List[str]]:
+        """Позиции и доходы по дням, валютам и сотрудникам с промежуточными итогами.
+
+        grouping_level - битовая маска GROUPING(day, currency_code, employee_name):
+        0 - детальная строка, 7 - общий итог.
+        """
+        from_date = from_date or date(1970, 1, 1)
+        to_date = to_date or date.today()
+        # Последний день со снимком мог быть неполным, а снимки другой версии
+        # формул неверны, поэтому начиная с них отчет считается по транзакциям
+        live_from = from_date
+        if use_snapshots:
+            # Архивные месяцы есть только в снимках, даже если те другой версии
+            starts = [day for day in (self.recompute_from(), self.archived_until()) if day]
+            if starts and max(starts) > from_date:
+                live_from = min(max(starts), to_date + timedelta(days=1))
+        params = {'home_currency': self.home_currency, 'date_from': from_date,
+                  'live_from': live_from, 'date_to': to_date + timedelta(days=1)}
+        metrics = ', '.join(self.METRICS)
+        sums = ',\n                   '.join(f"SUM({metric}) AS {metric}" for metric in self.METRICS)
+        query = f"""
+            WITH daily AS (
+                SELECT snapshot_date, currency_code, employee_name, {metrics}
+                FROM bank_system.pnl_daily_snapshots
+                WHERE snapshot_date >= %(date_from)s AND snapshot_date < %(live_from)s
+                UNION ALL
+                {self.DAILY_QUERY}
+            )
+            SELECT snapshot_date AS day, currency_code, employee_name,
+                   GROUPING(snapshot_date, currency_code, employee_name) AS grouping_level,
+                   {sums}
+            FROM daily
+            GROUP BY GROUPING SETS (
+                (snapshot_date, currency_code, employee_name),
+                (snapshot_date),
+                (currency_code),
+                (employee_name),
+                ()
+            )
+            ORDER BY grouping_level, day, currency_code, employee_name
+        """
+        results = self.db_manager.execute_query(query, params)
+        self.logger.info(f"P&L report {from_date}..{to_date} (live from {live_from}): {len(results)} rows")
+        return results, list(self.COLUMNS)
+
+    def get_open_positions(self, as_of: Optional[date] = None) -> List[Tuple]:
+        """Чистая открытая позиция банка по каждой валюте на дату: (currency_code, net_position)"""
+        results, columns = self.get_report(to_date=as_of)
+        level = columns.index('grouping_level')
+        position = columns.index('net_position')
+        # GROUPING = 5 (0b101): итог только по валюте
+        return [(row[1], row[position]) for row in results if row[level] == 5]
@@ -0,0 +1,82 @@
+import logging
+from typing import List, Optional, Tuple
+
+from rate_manager import RateManager, HOME_CURRENCY
+
+
+class PortfolioManager:
+    """Оценка портфелей клиентов в валюте отчета.
+
+    Курсы пересчета всех валют в валюту отчета вычисляются один раз по
+    последним курсам и передаются в запрос массивом, поэтому оценка всех
+    клиентов выполняется одним проходом по активным счетам.
+    """
+
+    COLUMNS = ['client_id', 'full_name', 'is_vip', 'total_value', 'accounts_count',
+               'currencies_count', 'unpriced_accounts']
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.rate_manager = RateManager(db_manager)
+        self.logger = logging.getLogger('PortfolioManager')
+
+    def _rates_param(self, reporting_currency: str) -> Tuple[list, list]:
+        rates = self.rate_manager.conversion_rates(reporting_currency)
+        return list(rates.keys()), list(rates.values())
+
+    def value_portfolios(self, reporting_currency: str = HOME_CURRENCY, client_id: Optional[int] = None,
+                         vip_only: bool = False, limit: Optional[int] = None) -> Tuple[List[Tuple], List[str]]:
+        """Стоимость активных счетов каждого клиента, по убыванию стоимости.
+
+        Счета в валютах без курса не учитываются в total_value и считаются
+        в unpriced_accounts.
+        """
+        currencies, rates = self._rates_param(reporting_currency)
+        query = """
+            WITH rates AS (
+                SELECT * FROM unnest(%s::varchar[], %s::numeric[]) AS r(currency_code, rate)
+            )
+            SELECT c.client_id, c.full_name, c.is_vip,
+                   ROUND(COALESCE(SUM(a.balance * r.rate), 0), 2) AS total_value,
+                   COUNT(a.account_id) AS accounts_count,
+                   COUNT(DISTINCT a.currency_code) AS currencies_count,
+                   COUNT(a.account_id) FILTER (WHERE r.rate IS NULL) AS unpriced_accounts
+            FROM bank_system.currency_accounts a
+            JOIN bank_system.clients c ON a.client_id = c.client_id
+            LEFT JOIN rates r ON r.currency_code = a.currency_code
+            WHERE a.account_status = 'ACTIVE'
+        """
+        params = [currencies, rates]
+        if client_id:
+            query += " AND c.client_id = %s"
+            params.append(client_id)
+        if vip_only:
+            query += " AND c.is_vip"
+        query += """
+            GROUP BY c.client_id, c.full_name, c.is_vip
+            ORDER BY total_value DESC, c.client_id
+        """
+        if limit:
+            query += " LIMIT %s"
+            params.append(limit)
+        results = self.db_manager.execute_query(query, tuple(params))
+        self.logger.info(f"Portfolios valued in {reporting_currency}: {len(results)} clients")
+        return results, list(self.COLUMNS)
+
+    def value_client_accounts(self, client_id: int, reporting_currency: str = HOME_CURRENCY) -> List[Tuple]:
+        """Балансы клиента по валютам с пересчетом: (валюта, баланс, счетов, курс, стоимость)"""
+        currencies, rates = self._rates_param(reporting_currency)
+        query = """
+            WITH rates AS (
+                SELECT * FROM unnest(%s::varchar[], %s::numeric[]) AS r(currency_code, rate)
+            )
+            SELECT a.currency_code, SUM(a.balance) AS total_balance,
+                   COUNT(a.account_id) AS account_count, r.rate,
+                   ROUND(SUM(a.balance) * r.rate, 2) AS value
+            FROM bank_system.currency_accounts a
+            LEFT JOIN rates r ON r.currency_code = a.currency_code
+            WHERE a.client_id = %s AND a.account_status = 'ACTIVE'
+            GROUP BY a.currency_code, r.rate
+            ORDER BY a.currency_code
+        """
+        return self.db_manager.execute_query(query, (currencies, rates, client_id))
@@ -0,0 +1,226 @@
+import hashlib
+import re
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple, Union
+
+from psycopg2 import sql
+
+OPERATORS = ('=', '!=', '>', '<', '>=', '<=', 'LIKE', 'ILIKE', 'IN')
+AGGREGATES = ('COUNT', 'SUM', 'AVG', 'MIN', 'MAX')
+GROUPINGS = ('ROLLUP', 'CUBE', 'GROUPING SETS')
+
+# Числа без ведущих нулей: '007' остается строкой (номера документов, коды)
+_INTEGER = re.compile(r'-?(0|[1-9]\d*)')
+_DECIMAL = re.compile(r'-?(0|[1-9]\d*)\.\d+')
+
+# Способы подстановки значений при компиляции
+PYFORMAT = 'pyformat'   # %s - параметры передаются в cursor.execute
+DOLLAR = 'dollar'       # $1, $2 ... - текст для PREPARE
+LITERAL = 'literal'     # значения встраиваются через sql.Literal (представления); числа условий - в кавычках
+
+
+def identifier(name: str) -> sql.Identifier:
+    """Имя колонки или таблицы; 't1.col' превращается в "t1"."col\""""
+    return sql.Identifier(*name.split('.'))
+
+
+def coerce_value(text: str) -> Any:
+    """Значение фильтра из поля ввода: целые и дробные числа передаются числами, остальное строкой"""
+    text = text.strip()
+    if _INTEGER.fullmatch(text):
+        return int(text)
+    if _DECIMAL.fullmatch(text):
+        return Decimal(text)
+    return text
+
+
+def split_list(text: str) -> List[Any]:
+    """Значение для IN: '(a, b)' или 'a, b'"""
+    return [coerce_value(item.strip().strip("'")) for item in text.strip().strip('()').split(',') if item.strip()]
+
+
+def case_value(text: str) -> Any:
+    """Результат THEN/ELSE: 'текст' в кавычках - строка, иначе как в coerce_value; пустое поле - None"""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == "'":
+        return text[1:-1]
+    return coerce_value(text) if text else None
+
+
+class Aggregate:
+    """Агрегатная функция над колонкой: COUNT(*), SUM(amount) ..."""
+
+    def __init__(self, func: str, column: str = '*'):
+        func = func.upper()
+        if func not in AGGREGATES:
+            raise ValueError(f"Неподдерживаемая агрегатная функция: {func}")
+        self.func = func
+        self.column = column
+
+    def compose(self) -> sql.Composable:
+        argument = sql.SQL('*') if self.column == '*' else identifier(self.column)
+        return sql.SQL('{}({})').format(sql.SQL(self.func), argument)
+
+    def label(self) -> str:
+        return f"{self.func}({self.column})"
+
+
+Expression = Union[str, Aggregate]
+
+
+def compose_expression(expr: Expression) -> sql.Composable:
+    if isinstance(expr, Aggregate):
+        return expr.compose()
+    return sql.SQL('*') if expr == '*' else identifier(expr)
+
+
+class Condition:
+    """Условие 'выражение оператор значение'; для IN значение - список"""
+
+    def __init__(self, expr: Expression, op: str, value: Any):
+        op = op.upper()
+        if op not in OPERATORS:
+            raise ValueError(f"Неподдерживаемый оператор: {op}")
+        if op == 'IN' and not value:
+            raise ValueError("Для IN укажите хотя бы одно значение")
+        self.expr = expr
+        self.op = op
+        self.value = list(value) if op == 'IN' else value
+
+    @classmethod
+    def parse(cls, expr: Expression, op: str, text: str) -> 'Condition':
+        """Условие из текста поля ввода фильтра"""
+        return cls(expr, op, split_list(text) if op.upper() == 'IN' else coerce_value(text))
+
+    def label(self) -> str:
+        expr = self.expr.label() if isinstance(self.expr, Aggregate) else self.expr
+        return f"{expr} {self.op} {self.value!r}"
+
+
+class Case:
+    """Колонка 'CASE WHEN условие THEN значение ... ELSE значение END AS имя'; значения - параметры"""
+
+    def __init__(self, whens: Sequence[Tuple[Condition, Any]], else_value: Any = None, alias: str = 'case_result'):
+        if not whens:
+            raise ValueError("Добавьте хотя бы одно условие WHEN/THEN")
+        self.whens = list(whens)
+        self.else_value = else_value
+        self.alias = alias
+
+    def label(self) -> str:
+        return self.alias
+
+
+class Select:
+    """AST запроса SELECT визуальных конструкторов.
+
+    Имена всегда выводятся через sql.Identifier, значения - параметрами, поэтому
+    текст запроса зависит только от структуры фильтров, а не от их значений:
+    один и тот же подготовленный оператор переиспользуется при смене значений.
+    """
+
+    def __init__(self, table: str, columns: Sequence[Union[Expression, Case]] = (),
+                 schema: Optional[str] = 'bank_system'):
+        # schema=None - источник без схемы (CTE из with_cte)
+        self.schema = schema
+        self.table = table
+        self.columns: List[Union[Expression, Case]] = list(columns)
+        self.ctes: List[Tuple[str, 'Select']] = []
+        self.where: List[Condition] = []
+        self.group_by: List[str] = []
+        self.grouping: Optional[str] = None
+        self.having: List[Condition] = []
+        self.order_by: List[Tuple[str, bool]] = []
+        self.limit: Optional[int] = None
+
+    def filter(self, condition: Condition) -> 'Select':
+        self.where.append(condition)
+        return self
+
+    def with_cte(self, name: str, query: 'Select') -> 'Select':
+        self.ctes.append((name, query))
+        return self
+
+    def group(self, *columns: str, grouping: Optional[str] = None) -> 'Select':
+        """GROUP BY колонок; grouping - ROLLUP, CUBE или GROUPING SETS"""
+        if grouping is not None:
+            grouping = grouping.upper().replace('_', ' ')
+            if grouping not in GROUPINGS:
+                raise ValueError(f"Неподдерживаемый вид группировки: {grouping}")
+            self.grouping = grouping
+        self.group_by.extend(columns)
+        return self
+
+    def having_filter(self, condition: Condition) -> 'Select':
+        self.having.append(condition)
+        return self
+
+    def order(self, column: str, descending: bool = False) -> 'Select':
+        self.order_by.append((column, descending))
+        return self
+
+    def compile(self, style: str = PYFORMAT) -> Tuple[sql.Composed, List[Any]]:
+        """Текст запроса и список параметров в выбранном стиле подстановки"""
+        params: List[Any] = []
+
+        def value(v: Any, compared: bool = False) -> sql.Composable:
+            if style == LITERAL:
+                # Сравниваемое число встраивается как '...': тип такого литерала берется
+                # из колонки, поэтому account_number = '40817...' работает и для varchar
+                if compared and isinstance(v, (int, Decimal)) and not isinstance(v, bool):
+                    v = str(v)
+                return sql.Literal(v)
+            params.append(v)
+            return sql.SQL(f"${len(params)}") if style == DOLLAR else sql.Placeholder()
+
+        return self._compose(value), params
+
+    def _compose(self, value) -> sql.Composed:
+        """Текст запроса; value(v) подставляет значение (части собираются в порядке текста)"""
+
+        def condition(c: Condition) -> sql.Composed:
+            expr = compose_expression(c.expr)
+            if c.op == 'IN':
+                # Каждое значение - отдельный параметр: тип выводится из колонки (в том числе ENUM)
+                return sql.SQL('{} IN ({})').format(expr, sql.SQL(', ').join(value(v, True) for v in c.value))
+            return sql.SQL('{} {} {}').format(expr, sql.SQL(c.op), value(c.value, True))
+
+        def column(c: Union[Expression, Case]) -> sql.Composable:
+            if isinstance(c, Case):
+                whens = sql.SQL(' ').join(sql.SQL('WHEN {} THEN {}').format(condition(cond), value(result))
+                                          for cond, result in c.whens)
+                otherwise = sql.SQL(' ELSE {}').format(value(c.else_value)) if c.else_value is not None else sql.SQL('')
+                return sql.SQL('CASE {}{} END AS {}').format(whens, otherwise, sql.Identifier(c.alias))
+            return compose_expression(c)
+
+        parts = []
+        if self.ctes:
+            parts.append(sql.SQL('WITH ') + sql.SQL(', ').join(
+                sql.SQL('{} AS ({})').format(sql.Identifier(name), query._compose(value)) for name, query in self.ctes
+            ) + sql.SQL(' '))
+        columns = sql.SQL(', ').join(column(c) for c in self.columns) if self.columns else sql.SQL('*')
+        source = sql.Identifier(self.schema, self.table) if self.schema else sql.Identifier(self.table)
+        parts.append(sql.SQL('SELECT {} FROM {}').format(columns, source))
+        if self.where:
+            parts.append(sql.SQL(' WHERE ') + sql.SQL(' AND ').join(condition(c) for c in self.where))
+        if self.group_by:
+            group_columns = sql.SQL(', ').join(identifier(c) for c in self.group_by)
+            if self.grouping == 'GROUPING SETS':
+                group_columns = sql.SQL('GROUPING SETS (({}))').format(group_columns)
+            elif self.grouping:
+                group_columns = sql.SQL('{}({})').format(sql.SQL(self.grouping), group_columns)
+            parts.append(sql.SQL(' GROUP BY ') + group_columns)
+        if self.having:
+            parts.append(sql.SQL(' HAVING ') + sql.SQL(' AND ').join(condition(c) for c in self.having))
+        if self.order_by:
+            parts.append(sql.SQL(' ORDER BY ') + sql.SQL(', ').join(
+                identifier(c) + sql.SQL(' DESC' if desc else ' ASC') for c, desc in self.order_by
+            ))
+        if self.limit is not None:
+            parts.append(sql.SQL(' LIMIT ') + value(int(self.limit)))
+        return sql.Composed(parts)
+
+
+def statement_name(query_text: str) -> str:
+    """Имя подготовленного оператора по тексту запроса"""
+    return f"qb_{hashlib.md5(query_text.encode('utf-8')).hexdigest()[:16]}"
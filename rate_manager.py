@@ -0,0 +1,325 @@
+import logging
+from bisect import bisect_right
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from transaction_types import QUOTE_RATES, quote_case
+
+HOME_CURRENCY = 'RUB'
+
+
+class RateTimeline:
+    """Курсы пар валют в памяти, упорядоченные по времени, для поиска курса на момент.
+
+    Загружается одним запросом; поиск курса для каждой транзакции - двоичный
+    поиск по датам пары без обращения к серверу.
+    """
+
+    def __init__(self, rows: Iterable[Tuple]):
+        # rows: (base_currency, target_currency, rate_date, rate_id, buy_rate, sell_rate)
+        self._dates: Dict[Tuple[str, str], List[datetime]] = {}
+        self._rates: Dict[Tuple[str, str], List[Tuple]] = {}
+        for base, target, rate_date, rate_id, buy_rate, sell_rate in sorted(rows, key=lambda r: (r[0], r[1], r[2], r[3])):
+            pair = (base, target)
+            self._dates.setdefault(pair, []).append(rate_date)
+            self._rates.setdefault(pair, []).append((rate_id, buy_rate, sell_rate, rate_date))
+
+    def __len__(self) -> int:
+        return sum(len(dates) for dates in self._dates.values())
+
+    def rate_at(self, base_currency: str, target_currency: str, ts: datetime) -> Optional[Tuple]:
+        """Последний курс пары с rate_date <= ts: (rate_id, buy_rate, sell_rate, rate_date)"""
+        dates = self._dates.get((base_currency, target_currency))
+        if not dates:
+            return None
+        position = bisect_right(dates, ts)
+        return self._rates[(base_currency, target_currency)][position - 1] if position else None
+
+
+class RateManager:
+    """История курсов валют в виде прореженных OHLC-рядов и курс на момент времени.
+
+    Минутные, часовые и дневные свечи поддерживаются триггером
+    ``trg_exchange_rates_ohlc`` в таблице ``exchange_rate_ohlc``; недельные и
+    месячные собираются из дневных свечей, сырые котировки для графиков не читаются.
+    """
+
+    ROLLUP_BUCKETS = ('minute', 'hour', 'day')
+    BUCKETS = ('minute', 'hour', 'day', 'week', 'month')
+    BUCKET_SPANS = {
+        'minute': timedelta(minutes=1),
+        'hour': timedelta(hours=1),
+        'day': timedelta(days=1),
+        'week': timedelta(weeks=1),
+        'month': timedelta(days=30),
+    }
+
+    OHLC_COLUMNS = ['bucket_start', 'buy_open', 'buy_high', 'buy_low', 'buy_close',
+                    'sell_open', 'sell_high', 'sell_low', 'sell_close', 'tick_count']
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        self.logger = logging.getLogger('RateManager')
+
+    def choose_bucket(self, from_date: datetime, to_date: datetime, max_points: int = 2000) -> str:
+        """Самый мелкий интервал, при котором ряд укладывается в max_points точек"""
+        span = to_date - from_date
+        for bucket in self.BUCKETS:
+            if span / self.BUCKET_SPANS[bucket] <= max_points:
+                return bucket
+        return 'month'
+
+    def get_rate_history(self, base_currency: str, target_currency: str, bucket: Optional[str] = None,
+                         from_date: Optional[datetime] = None, to_date: Optional[datetime] = None,
+                         max_points: int = 2000) -> List[Tuple]:
+        """OHLC-ряд курсов покупки и продажи по паре валют, по возрастанию времени"""
+        if not self.db_manager.connection:
+            raise ConnectionError("Database connection is not established. Call connect() first.")
+        if bucket is None:
+            bucket = self.choose_bucket(from_date or datetime(1970, 1, 1), to_date or datetime.now(), max_points)
+        if bucket not in self.BUCKETS:
+            raise ValueError(f"Неизвестный интервал: {bucket}. Допустимые: {', '.join(self.BUCKETS)}")
+
+        conditions = ["base_currency = %s", "target_currency = %s", "bucket = %s"]
+        params = [base_currency, target_currency, bucket if bucket in self.ROLLUP_BUCKETS else 'day']
+        if from_date:
+            conditions.append("bucket_start >= date_trunc(%s, %s::timestamp)")
+            params.extend([bucket, from_date])
+        if to_date:
+            conditions.append("bucket_start <= %s")
+            params.append(to_date)
+        where = " AND ".join(conditions)
+
+        if bucket in self.ROLLUP_BUCKETS:
+            query = f"""
+                SELECT {', '.join(self.OHLC_COLUMNS)}
+                FROM bank_system.exchange_rate_ohlc
+                WHERE {where}
+                ORDER BY bucket_start
+            """
+        else:
+            query = f"""
+                SELECT date_trunc(%s, bucket_start) AS period_start,
+                       (array_agg(buy_open ORDER BY bucket_start))[1],
+                       MAX(buy_high), MIN(buy_low),
+                       (array_agg(buy_close ORDER BY bucket_start DESC))[1],
+                       (array_agg(sell_open ORDER BY bucket_start))[1],
+                       MAX(sell_high), MIN(sell_low),
+                       (array_agg(sell_close ORDER BY bucket_start DESC))[1],
+                       SUM(tick_count)
+                FROM bank_system.exchange_rate_ohlc
+                WHERE {where}
+                GROUP BY period_start
+                ORDER BY period_start
+            """
+            params.insert(0, bucket)
+
+        results = self.db_manager.execute_query(query, tuple(params))
+        self.logger.info(f"Rate history {base_currency}/{target_currency} by {bucket}: {len(results)} points")
+        return results
+
+    def get_rates_at(self, lookups: Sequence[Tuple[str, str, datetime]]) -> List[Optional[Tuple]]:
+        """Курсы на момент времени для пакета (base, target, ts) одним запросом.
+
+        Для каждого элемента возвращается (rate_id, buy_rate, sell_rate, rate_date)
+        последнего курса пары с rate_date <= ts или None, в порядке запросов.
+        """
+        if not lookups:
+            return []
+        bases, targets, stamps = (list(column) for column in zip(*lookups))
+        query = """
+            SELECT q.ord, r.rate_id, r.buy_rate, r.sell_rate, r.rate_date
+            FROM unnest(%s::varchar[], %s::varchar[], %s::timestamp[])
+                 WITH ORDINALITY AS q(base_currency, target_currency, ts, ord)
+            LEFT JOIN LATERAL (
+                SELECT er.rate_id, er.buy_rate, er.sell_rate, er.rate_date
+                FROM bank_system.exchange_rates er
+                WHERE er.base_currency = q.base_currency
+                  AND er.target_currency = q.target_currency
+                  AND er.rate_date <= q.ts
+                ORDER BY er.rate_date DESC, er.rate_id DESC
+                LIMIT 1
+            ) r ON TRUE
+            ORDER BY q.ord
+        """
+        rows = self.db_manager.execute_query(query, (bases, targets, stamps))
+        return [None if row[1] is None else tuple(row[1:]) for row in rows]
+
+    def get_rate_at(self, base_currency: str, target_currency: str, ts: datetime) -> Optional[Tuple]:
+        return self.get_rates_at([(base_currency, target_currency, ts)])[0]
+
+    def load_timeline(self, pairs: Sequence[Tuple[str, str]] = None,
+                      to_date: Optional[datetime] = None) -> RateTimeline:
+        """Загрузка курсов в память для поиска курса на момент без запросов на каждую строку"""
+        query = """
+            SELECT base_currency, target_currency, rate_date, rate_id, buy_rate, sell_rate
+            FROM bank_system.exchange_rates
+            WHERE 1=1
+        """
+        params = []
+        if pairs:
+            query += " AND (base_currency, target_currency) IN (SELECT * FROM unnest(%s::varchar[], %s::varchar[]))"
+            params.extend([[p[0] for p in pairs], [p[1] for p in pairs]])
+        if to_date:
+            query += " AND rate_date <= %s"
+            params.append(to_date)
+        timeline = RateTimeline(self.db_manager.execute_query(query, tuple(params) if params else None))
+        self.logger.info(f"Rate timeline loaded: {len(timeline)} rates")
+        return timeline
+
+    def resolve_transaction_rates(self, transaction_ids: Sequence[int] = None,
+                                  from_date: Optional[datetime] = None, to_date: Optional[datetime] = None,
+                                  quote_currency: str = HOME_CURRENCY) -> List[Tuple]:
+        """Действовавший курс для каждой валютной транзакции одним запросом.
+
+        Операции записываются со стороны клиента (transaction_types): BUY
+        сверяется с sell_rate, SELL - с buy_rate пары (валюта транзакции,
+        quote_currency); так же считается спред в PnLReport. Возвращает строки
+        (transaction_id, transaction_type, currency_code, transaction_date,
+        exchange_rate, effective_rate, rate_id, rate_date, deviation_pct).
+        """
+        effective = quote_case('r.', 't.transaction_type')
+        query = f"""
+            SELECT t.transaction_id, t.transaction_type, t.currency_code, t.transaction_date,
+                   t.exchange_rate,
+                   {effective} AS effective_rate,
+                   r.rate_id, r.rate_date,
+                   ROUND((t.exchange_rate / NULLIF({effective}, 0) - 1) * 100, 4) AS deviation_pct
+            FROM bank_system.transactions t
+            LEFT JOIN LATERAL (
+                SELECT er.rate_id, er.buy_rate, er.sell_rate, er.rate_date
+                FROM bank_system.exchange_rates er
+                WHERE er.base_currency = t.currency_code
+                  AND er.target_currency = %s
+                  AND er.rate_date <= t.transaction_date
+                ORDER BY er.rate_date DESC, er.rate_id DESC
+                LIMIT 1
+            ) r ON TRUE
+            WHERE t.transaction_type IN ('BUY', 'SELL') AND t.currency_code <> %s
+        """
+        params = [quote_currency, quote_currency]
+        if transaction_ids:
+            query += " AND t.transaction_id = ANY(%s)"
+            params.append(list(transaction_ids))
+        if from_date:
+            query += " AND t.transaction_date >= %s"
+            params.append(from_date)
+        if to_date:
+            query += " AND t.transaction_date <= %s"
+            params.append(to_date)
+        query += " ORDER BY t.transaction_id"
+        return self.db_manager.execute_query(query, tuple(params))
+
+    def check_rate(self, currency_code: str, trans_type: str, exchange_rate: float,
+                   ts: Optional[datetime] = None, quote_currency: str = HOME_CURRENCY) -> Optional[Tuple[Decimal, Decimal]]:
+        """Действующий курс и отклонение введенного курса от него в процентах.
+
+        BUY клиента сверяется с sell_rate, SELL - с buy_rate (QUOTE_RATES).
+        """
+        rate = self.get_rate_at(currency_code, quote_currency, ts or datetime.now())
+        if rate is None:
+            return None
+        effective = rate[1] if QUOTE_RATES.get(trans_type) == 'buy_rate' else rate[2]
+        deviation = (Decimal(str(exchange_rate)) / effective - 1) * 100
+        return effective, deviation
+
+    def get_latest_rates(self) -> Dict[Tuple[str, str], Decimal]:
+        """Последний средний курс (buy_rate + sell_rate) / 2 по каждой паре"""
+        query = """
+            SELECT DISTINCT ON (base_currency, target_currency)
+                   base_currency, target_currency, (buy_rate + sell_rate) / 2
+            FROM bank_system.exchange_rates
+            ORDER BY base_currency, target_currency, rate_date DESC, rate_id DESC
+        """
+        return {(base, target): mid for base, target, mid in self.db_manager.execute_query(query)}
+
+    @staticmethod
+    def _convert(latest: Dict[Tuple[str, str], Decimal], source: str, target: str) -> Optional[Decimal]:
+        if source == target:
+            return Decimal(1)
+        if (source, target) in latest:
+            return latest[(source, target)]
+        if (target, source) in latest:
+            return 1 / latest[(target, source)]
+        return None
+
+    def conversion_rates(self, reporting_currency: str,
+                         latest: Dict[Tuple[str, str], Decimal] = None) -> Dict[str, Decimal]:
+        """Курсы пересчета каждой валюты в валюту отчета.
+
+        Используется прямая пара, обратная пара или кросс-курс через HOME_CURRENCY;
+        валюты без курса в результат не попадают.
+        """
+        if latest is None:
+            latest = self.get_latest_rates()
+        currencies = {reporting_currency, HOME_CURRENCY}
+        for base, target in latest:
+            currencies.update((base, target))
+        rates = {}
+        for currency in currencies:
+            rate = self._convert(latest, currency, reporting_currency)
+            if rate is None:
+                to_home = self._convert(latest, currency, HOME_CURRENCY)
+                home_to_target = self._convert(latest, HOME_CURRENCY, reporting_currency)
+                if to_home is not None and home_to_target is not None:
+                    rate = to_home * home_to_target
+            if rate is not None:
+                rates[currency] = rate
+        return rates
+
+    def get_rate_matrix(self) -> Dict[Tuple[str, str], Decimal]:
+        """Матрица пересчета {(из валюты, в валюту): курс} по последним курсам"""
+        latest = self.get_latest_rates()
+        currencies = {HOME_CURRENCY}
+        for base, target in latest:
+            currencies.update((base, target))
+        matrix = {}
+        for target in currencies:
+            for source, rate in self.conversion_rates(target, latest).items():
+                matrix[(source, target)] = rate
+        return matrix
+
+    def get_rate_pairs(self) -> List[Tuple[str, str]]:
+        query = """
+            SELECT DISTINCT base_currency, target_currency
+            FROM bank_system.exchange_rate_ohlc
+            WHERE bucket = 'day'
+            ORDER BY base_currency, target_currency
+        """
+        return self.db_manager.execute_query(query)
+
+    def rebuild_ohlc(self) -> int:
+        """Полный пересчет свечей по сырым котировкам (после импорта в обход триггера)"""
+        cursor = self.db_manager.connection.cursor()
+        try:
+            cursor.execute("DELETE FROM bank_system.exchange_rate_ohlc")
+            inserted = 0
+            for bucket in self.ROLLUP_BUCKETS:
+                cursor.execute("""
+                    INSERT INTO bank_system.exchange_rate_ohlc
+                        (base_currency, target_currency, bucket, bucket_start,
+                         buy_open, buy_high, buy_low, buy_close,
+                         sell_open, sell_high, sell_low, sell_close,
+                         first_rate_date, last_rate_date, tick_count)
+                    SELECT base_currency, target_currency, %s, date_trunc(%s, rate_date) AS bucket_start,
+                           (array_agg(buy_rate ORDER BY rate_date, rate_id))[1],
+                           MAX(buy_rate), MIN(buy_rate),
+                           (array_agg(buy_rate ORDER BY rate_date DESC, rate_id DESC))[1],
+                           (array_agg(sell_rate ORDER BY rate_date, rate_id))[1],
+                           MAX(sell_rate), MIN(sell_rate),
+                           (array_agg(sell_rate ORDER BY rate_date DESC, rate_id DESC))[1],
+                           MIN(rate_date), MAX(rate_date), COUNT(*)
+                    FROM bank_system.exchange_rates
+                    GROUP BY base_currency, target_currency, bucket_start
+                """, (bucket, bucket))
+                inserted += cursor.rowcount
+            self.db_manager.connection.commit()
+            self.logger.info(f"OHLC rollup rebuilt: {inserted} buckets")
+            return inserted
+        except Exception as e:
+            self.db_manager.connection.rollback()
+            self.logger.error(f"Error rebuilding OHLC rollup: {e}")
+            raise
+        finally:
+            cursor.close()
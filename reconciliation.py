@@ -0,0 +1,133 @@
+import csv
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import List, Tuple
+
+from report_session import ReportSession
+from transaction_types import BALANCE_SIGNS, signed_case
+
+
+class ReconciliationReport:
+    """Результат сверки: строки расхождений и сводка по проверке"""
+
+    COLUMNS = ['account_id', 'account_number', 'currency_code', 'balance',
+               'computed_balance', 'difference', 'transactions_count']
+
+    def __init__(self, rows: List[Tuple], accounts_checked: int, ranges: int, workers: int,
+                 elapsed: float, snapshot_id: str):
+        self.rows = rows
+        self.accounts_checked = accounts_checked
+        self.ranges = ranges
+        self.workers = workers
+        self.elapsed = elapsed
+        self.snapshot_id = snapshot_id
+
+    @property
+    def total_difference(self) -> Decimal:
+        return sum((row[5] for row in self.rows), Decimal('0'))
+
+    def summary(self) -> str:
+        return (f"Проверено счетов: {self.accounts_checked}, расхождений: {len(self.rows)}, "
+                f"сумма расхождений: {self.total_difference}, "
+                f"время: {self.elapsed:.2f} с ({self.ranges} диапазонов, потоков: {self.workers})")
+
+    def to_csv(self, path: str):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.COLUMNS)
+            writer.writerows(self.rows)
+
+
+class BalanceReconciler:
+    """Сверка currency_accounts.balance с суммой проведенных транзакций счета.
+
+    Счета делятся на диапазоны account_id, которые параллельно сканируются
+    рабочими соединениями ReportSession. Все они работают в одном экспортированном
+    снимке, поэтому диапазоны проверяются по одному и тому же согласованному
+    состоянию базы, даже если проводки продолжаются.
+
+    Знак суммы задается SIGNS (BALANCE_SIGNS, операции со стороны клиента):
+    пополнение и покупка валюты на счет увеличивают остаток, снятие, продажа
+    и перевод - уменьшают; комиссия на остаток валютного счета не влияет. Суммы транзакций, перенесенных в архив, берутся
+    из account_archived_balances.
+    """
+
+    SIGNS = BALANCE_SIGNS
+
+    BOUNDS_QUERY = "SELECT MIN(account_id), MAX(account_id) FROM bank_system.currency_accounts"
+
+    COUNT_QUERY = """
+        SELECT COUNT(*) FROM bank_system.currency_accounts
+        WHERE account_id >= %(low)s AND account_id < %(high)s
+    """
+
+    def __init__(self, db_manager, workers: int = 4, ranges_per_worker: int = 4,
+                 tolerance: Decimal = Decimal('0.00')):
+        self.db_manager = db_manager
+        self.workers = max(1, workers)
+        self.ranges_per_worker = max(1, ranges_per_worker)
+        self.tolerance = tolerance
+        self.logger = logging.getLogger('BalanceReconciler')
+
+    def _range_query(self) -> str:
+        return f"""
+            SELECT a.account_id, a.account_number, a.currency_code, a.balance,
+                   COALESCE(ab.archived_total, 0) + COALESCE(t.total, 0) AS computed_balance,
+                   a.balance - COALESCE(ab.archived_total, 0) - COALESCE(t.total, 0) AS difference,
+                   COALESCE(ab.archived_count, 0) + COALESCE(t.transactions_count, 0) AS transactions_count
+            FROM bank_system.currency_accounts a
+            LEFT JOIN bank_system.account_archived_balances ab ON ab.account_id = a.account_id
+            LEFT JOIN (
+                SELECT account_id, SUM({signed_case('amount', self.SIGNS)}) AS total,
+                       COUNT(*) AS transactions_count
+                FROM bank_system.transactions
+                WHERE is_completed AND account_id >= %(low)s AND account_id < %(high)s
+                GROUP BY account_id
+            ) t ON t.account_id = a.account_id
+            WHERE a.account_id >= %(low)s AND a.account_id < %(high)s
+              AND abs(a.balance - COALESCE(ab.archived_total, 0) - COALESCE(t.total, 0)) > %(tolerance)s
+            ORDER BY a.account_id
+        """
+
+    @staticmethod
+    def split(low: int, high: int, parts: int) -> List[Tuple[int, int]]:
+        """Полуоткрытые диапазоны [начало, конец), покрывающие low..high"""
+        step = max(1, -(-(high - low + 1) // parts))
+        return [(start, min(start + step, high + 1)) for start in range(low, high + 1, step)]
+
+    def run(self, progress=None) -> ReconciliationReport:
+        """Сверка всех счетов; progress(готово диапазонов, всего) вызывается из рабочих потоков"""
+        started = time.perf_counter()
+        with ReportSession(self.db_manager, workers=self.workers) as session:
+            low, high = session.query(self.BOUNDS_QUERY)[0]
+            if low is None:
+                return ReconciliationReport([], 0, 0, 0, time.perf_counter() - started, session.snapshot_id)
+
+            ranges = self.split(low, high, self.workers * self.ranges_per_worker)
+            query = self._range_query()
+            lock = threading.Lock()
+            done = [0]
+
+            def scan(bounds: Tuple[int, int]) -> Tuple[List[Tuple], int]:
+                params = {'low': bounds[0], 'high': bounds[1], 'tolerance': self.tolerance}
+                found = session.query(query, params)
+                checked = session.query(self.COUNT_QUERY, params)[0][0]
+                with lock:
+                    done[0] += 1
+                    finished = done[0]
+                if progress:
+                    progress(finished, len(ranges))
+                return found, checked
+
+            results = session.map(scan, ranges)
+            snapshot_id = session.snapshot_id
+
+        # Диапазоны идут по возрастанию account_id, строки внутри диапазона уже упорядочены
+        mismatches = [row for found, _ in results for row in found]
+        report = ReconciliationReport(mismatches, sum(checked for _, checked in results), len(ranges),
+                                      min(self.workers, len(ranges)), time.perf_counter() - started, snapshot_id)
+        self.logger.info("Reconciliation finished: %d accounts, %d mismatches in %.2fs",
+                         report.accounts_checked, len(mismatches), report.elapsed)
+        return report
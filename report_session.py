@@ -0,0 +1,172 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import psycopg2
+
+# Соединение со снимком, привязанное к потоку: чтения DatabaseManager в этом потоке идут через него
+_bound = threading.local()
+
+
+def bound_connection(db_manager):
+    """Соединение отчетного снимка текущего потока для db_manager или None"""
+    binding = getattr(_bound, 'binding', None)
+    if binding is not None and binding[0] is db_manager:
+        return binding[1]
+    return None
+
+
+class ReportSession:
+    """Отчет из нескольких запросов по одному согласованному снимку.
+
+    Открывает на отдельном соединении транзакцию REPEATABLE READ READ ONLY и
+    экспортирует ее снимок. Внутри with чтения DatabaseManager (get_accounts,
+    get_transactions, get_client_balance_summary, execute_read ...) в этом
+    потоке выполняются в снимке. Тяжелые части отчета можно выполнить
+    параллельно через map/parallel: каждый рабочий поток получает свое
+    соединение, импортировавшее тот же снимок (SET TRANSACTION SNAPSHOT).
+    Выборки по ids (обновления по уведомлениям) по-прежнему идут на основное соединение.
+    """
+
+    def __init__(self, db_manager, workers: int = 4, profile: Optional[str] = 'analytics'):
+        self.db_manager = db_manager
+        self.workers = max(1, workers)
+        self.profile = profile
+        self.snapshot_id: Optional[str] = None
+        self.logger = logging.getLogger('ReportSession')
+        self._coordinator = None
+        self._idle: List[Any] = []
+        self._lock = threading.Lock()
+        self._previous_binding = None
+
+    def _connect(self, snapshot_id: Optional[str] = None):
+        conn = psycopg2.connect(**self.db_manager.connection_params, options="-c client_encoding=UTF8")
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cursor = conn.cursor()
+        try:
+            # Импорт снимка должен быть первым оператором транзакции
+            if snapshot_id:
+                cursor.execute("SET TRANSACTION SNAPSHOT %s", (snapshot_id,))
+            cursor.execute("SELECT set_config('search_path', 'bank_system, public', true)")
+            if self.profile:
+                for name, value in self.db_manager.SESSION_PROFILES[self.profile].items():
+                    cursor.execute("SELECT set_config(%s, %s, true)", (name, value))
+            # ENUM и составные типы как на основном соединении; запросы каталога
+            # идут уже внутри транзакции со снимком и не завершают ее
+            self.db_manager.type_adapters.register(conn)
+        except Exception:
+            conn.close()
+            raise
+        finally:
+            cursor.close()
+        return conn
+
+    def open(self) -> 'ReportSession':
+        self._coordinator = self._connect()
+        cursor = self._coordinator.cursor()
+        try:
+            cursor.execute("SELECT pg_export_snapshot()")
+            self.snapshot_id = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        self.logger.info("Report snapshot %s opened", self.snapshot_id)
+        return self
+
+    def close(self):
+        with self._lock:
+            connections, self._idle = self._idle, []
+        if self._coordinator is not None:
+            connections.append(self._coordinator)
+            self._coordinator = None
+        for conn in connections:
+            try:
+                # Транзакция только читала: завершение без фиксации
+                conn.rollback()
+            finally:
+                conn.close()
+                self.db_manager.forget_prepared(conn)
+        self.logger.info("Report snapshot %s closed", self.snapshot_id)
+
+    def __enter__(self) -> 'ReportSession':
+        self.open()
+        self._previous_binding = getattr(_bound, 'binding', None)
+        _bound.binding = (self.db_manager, self._coordinator)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _bound.binding = self._previous_binding
+        self.close()
+        return False
+
+    def connection(self):
+        """Соединение снимка текущего потока (координатор или рабочее соединение map)"""
+        conn = bound_connection(self.db_manager)
+        return conn if conn is not None else self._coordinator
+
+    def query(self, query: str, params=None) -> List[Tuple]:
+        cursor = self.connection().cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return self._connect(self.snapshot_id)
+
+    def _release(self, conn):
+        with self._lock:
+            self._idle.append(conn)
+
+    def map(self, func: Callable[[Any], Any], items: Sequence[Any]) -> List[Any]:
+        """func(item) для каждого элемента в рабочих потоках со снимком; результаты в порядке items.
+
+        Внутри func чтения DatabaseManager и self.query/self.connection()
+        используют соединение снимка рабочего потока.
+        """
+        if self._coordinator is None:
+            raise ConnectionError("Отчетный снимок не открыт")
+        items = list(items)
+        results: List[Any] = [None] * len(items)
+        pending: 'queue.Queue[int]' = queue.Queue()
+        for index in range(len(items)):
+            pending.put(index)
+
+        def worker():
+            conn = self._acquire()
+            _bound.binding = (self.db_manager, conn)
+            try:
+                while True:
+                    try:
+                        index = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    results[index] = func(items[index])
+            except Exception:
+                # Транзакция со снимком после ошибки непригодна, соединение не переиспользуется
+                conn.close()
+                self.db_manager.forget_prepared(conn)
+                raise
+            else:
+                self._release(conn)
+            finally:
+                _bound.binding = None
+
+        workers = min(self.workers, len(items))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(worker) for _ in range(workers)]
+            errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            self.logger.error("%d of %d report workers failed", len(errors), workers)
+            raise errors[0]
+        return results
+
+    def parallel(self, calls: Sequence[Callable[[], Any]]) -> List[Any]:
+        """Параллельное выполнение независимых частей отчета, например
+        [lambda: db.get_accounts(), lambda: db.get_transactions()]"""
+        return self.map(lambda call: call(), calls)
@@ -0,0 +1,66 @@
+import logging
+import re
+import time
+from typing import Callable, List, Optional, Tuple
+
+from script_runner import ScriptRunner
+
+_INDEX_NAME = re.compile(r"CREATE\s+INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\S+)", re.I)
+
+
+class SchemaBootstrap:
+    """Развертывание схемы с данными на новой базе.
+
+    Скрипт выполняется без неуникальных индексов (данные загружаются в пустые
+    таблицы), затем индексы строятся параллельно в нескольких соединениях с
+    увеличенным maintenance_work_mem, и в конце таблицы схемы анализируются.
+    Время каждого шага возвращается и пишется в журнал.
+    """
+
+    def __init__(self, db_manager, workers: int = 4, maintenance_work_mem_mb: int = 1024,
+                 commit_every: int = 10000):
+        self.db_manager = db_manager
+        self.workers = max(1, workers)
+        self.maintenance_work_mem_mb = maintenance_work_mem_mb
+        self.commit_every = commit_every
+        self.logger = logging.getLogger('SchemaBootstrap')
+
+    def _step(self, timings: List[Tuple[str, float]], name: str, started: float):
+        elapsed = time.perf_counter() - started
+        timings.append((name, elapsed))
+        self.logger.info(f"Bootstrap step '{name}' took {elapsed:.2f}s")
+
+    def run(self, path: str, schema: str = 'bank_system',
+            progress: Optional[Callable[[int, int, int], None]] = None) -> List[Tuple[str, float]]:
+        """Выполнение всех шагов; возвращает [(шаг, секунды)]"""
+        timings: List[Tuple[str, float]] = []
+        runner = ScriptRunner(self.db_manager)
+
+        started = time.perf_counter()
+        runner.run_file(path, defer_indexes=True, commit_every=self.commit_every, progress=progress)
+        self._step(timings, "Загрузка схемы и данных", started)
+
+        if runner.deferred_indexes:
+            # Память на сортировку делится между одновременно работающими соединениями
+            workers = min(self.workers, len(runner.deferred_indexes))
+            memory = max(64, self.maintenance_work_mem_mb // workers)
+            started = time.perf_counter()
+            built = runner.build_indexes(
+                runner.deferred_indexes, workers, {'maintenance_work_mem': f'{memory}MB'}
+            )
+            for statement, seconds in built:
+                match = _INDEX_NAME.search(statement)
+                timings.append((f"Индекс {match.group(1) if match else statement}", seconds))
+            self._step(timings, f"Построение индексов ({len(built)}, потоков: {workers})", started)
+
+        tables = self.db_manager.execute_query(
+            "SELECT format('%%I.%%I', schemaname, tablename) FROM pg_tables WHERE schemaname = %s",
+            (schema,)
+        )
+        started = time.perf_counter()
+        runner.run_parallel([f"ANALYZE {table}" for (table,) in tables], self.workers)
+        self._step(timings, f"ANALYZE ({len(tables)} таблиц)", started)
+
+        total = sum(seconds for name, seconds in timings if not name.startswith("Индекс "))
+        self.logger.info(f"Schema bootstrap finished in {total:.2f}s")
+        return timings
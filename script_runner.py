@@ -0,0 +1,394 @@
+import codecs
+import io
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import psycopg2
+
+_SPECIAL = re.compile(r"'|\"|--|/\*|;|\$(?:[^\W\d]\w*)?\$")
+_NEWLINE = re.compile(r"\n")
+_DOUBLE_QUOTE = re.compile(r'"')
+_BLOCK_COMMENT = re.compile(r"/\*|\*/")
+_STRING_END = re.compile(r"'")
+_E_STRING_END = re.compile(r"\\.|'", re.S)
+_COPY_FROM_STDIN = re.compile(r"^COPY\b.*\bFROM\s+STDIN\b", re.I | re.S)
+_CREATE_INDEX = re.compile(r"^CREATE\s+INDEX\b", re.I)
+# Максимальная длина токена, который может оказаться разрезан границей блока
+_LOOKBACK = 64
+
+
+def _without_leading_comments(sql: str) -> str:
+    """Текст оператора без начальных комментариев (блочные могут быть вложенными)"""
+    pos = 0
+    while True:
+        while pos < len(sql) and sql[pos].isspace():
+            pos += 1
+        if sql.startswith('--', pos):
+            end = sql.find('\n', pos)
+            pos = len(sql) if end < 0 else end + 1
+        elif sql.startswith('/*', pos):
+            depth = 0
+            for m in _BLOCK_COMMENT.finditer(sql, pos):
+                depth += 1 if m.group() == '/*' else -1
+                if not depth:
+                    pos = m.end()
+                    break
+            else:
+                return ''
+        else:
+            return sql[pos:].rstrip().rstrip(';').rstrip()
+
+
+class ScriptStatement:
+    """Один оператор скрипта; для COPY ... FROM stdin - еще и поток его данных"""
+
+    __slots__ = ('sql', 'line', 'copy_data')
+
+    def __init__(self, sql: str, line: int, copy_data: Optional['CopyData'] = None):
+        self.sql = sql
+        self.line = line
+        self.copy_data = copy_data
+
+
+class CopyData(io.TextIOBase):
+    """Строки данных COPY ... FROM stdin, читаемые из скрипта до строки ``\\.``"""
+
+    def __init__(self, reader: 'SqlScriptReader'):
+        super().__init__()
+        self._reader = reader
+        self._done = False
+        self._pending = ''
+
+    def readable(self) -> bool:
+        return True
+
+    def readline(self, size: int = -1) -> str:
+        if self._done:
+            return ''
+        line = self._reader._read_line()
+        if line is None or line.rstrip('\r\n') == '\\.':
+            self._done = True
+            return ''
+        return line
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._pending]
+        total = len(self._pending)
+        while size < 0 or total < size:
+            line = self.readline()
+            if not line:
+                break
+            parts.append(line)
+            total += len(line)
+        data = ''.join(parts)
+        if size >= 0:
+            self._pending = data[size:]
+            data = data[:size]
+        else:
+            self._pending = ''
+        return data
+
+    def drain(self):
+        self._pending = ''
+        while self.readline():
+            pass
+
+
+class SqlScriptReader:
+    """Потоковый разбор SQL-скрипта на операторы.
+
+    Учитывает строки, E-строки, идентификаторы в кавычках, комментарии (в том
+    числе вложенные блочные), dollar-quoting и блоки данных COPY ... FROM stdin.
+    В памяти держится только текущий оператор и непрочитанный остаток блока.
+    """
+
+    def __init__(self, read: Callable[[int], str], chunk_size: int = 1 << 20):
+        self._read = read
+        self._chunk_size = chunk_size
+        self._buf = ''
+        self._cut = 0
+        self._eof = False
+        self._line = 1
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf += chunk
+        return True
+
+    def _compact(self):
+        if self._cut:
+            self._buf = self._buf[self._cut:]
+            self._cut = 0
+
+    def _search(self, pattern, pos: int):
+        # Совпадение у самого конца буфера может быть началом более длинного токена
+        while True:
+            m = pattern.search(self._buf, pos)
+            if m and (m.end() < len(self._buf) or self._eof):
+                return m
+            if m is None and self._eof:
+                return None
+            restart = m.start() if m else max(pos, len(self._buf) - _LOOKBACK)
+            self._fill()
+            pos = restart
+
+    def _skip_string(self, start: int) -> int:
+        before = self._buf[start - 1] if start > 0 else ''
+        escaped = before in ('e', 'E') and (start < 2 or not (
+            self._buf[start - 2].isalnum() or self._buf[start - 2] == '_'))
+        pattern = _E_STRING_END if escaped else _STRING_END
+        pos = start + 1
+        while True:
+            m = self._search(pattern, pos)
+            if m is None:
+                return len(self._buf)
+            if m.group() != "'":
+                pos = m.end()
+                continue
+            if m.end() < len(self._buf) and self._buf[m.end()] == "'":
+                pos = m.end() + 1
+                continue
+            return m.end()
+
+    def _skip_block_comment(self, pos: int) -> int:
+        depth = 1
+        while depth:
+            m = self._search(_BLOCK_COMMENT, pos)
+            if m is None:
+                return len(self._buf)
+            depth += 1 if m.group() == '/*' else -1
+            pos = m.end()
+        return pos
+
+    def _skip_to(self, pattern, pos: int) -> int:
+        m = self._search(pattern, pos)
+        return m.end() if m else len(self._buf)
+
+    def _read_line(self) -> Optional[str]:
+        while True:
+            idx = self._buf.find('\n', self._cut)
+            if idx >= 0:
+                line = self._buf[self._cut:idx + 1]
+                self._cut = idx + 1
+                self._line += 1
+                return line
+            self._compact()
+            if not self._fill():
+                if self._buf:
+                    line, self._buf = self._buf, ''
+                    return line
+                return None
+
+    def _take(self, end: int) -> str:
+        sql = self._buf[self._cut:end]
+        self._cut = end
+        return sql
+
+    def _next_statement(self) -> Optional[ScriptStatement]:
+        if self._cut > self._chunk_size:
+            self._compact()
+        pos = self._cut
+        while True:
+            m = self._search(_SPECIAL, pos)
+            if m is None or m.group() == ';':
+                sql = self._take(m.end() if m else len(self._buf))
+                leading = len(sql) - len(sql.lstrip())
+                line = self._line + sql[:leading].count('\n')
+                self._line += sql.count('\n')
+                if _without_leading_comments(sql):
+                    return self._make(sql, line)
+                if m is None:
+                    return None
+                pos = self._cut
+                continue
+            token = m.group()
+            if token == '--':
+                pos = self._skip_to(_NEWLINE, m.end())
+            elif token == '/*':
+                pos = self._skip_block_comment(m.end())
+            elif token == "'":
+                pos = self._skip_string(m.start())
+            elif token == '"':
+                pos = self._skip_to(_DOUBLE_QUOTE, m.end())
+            elif m.start() > self._cut and (self._buf[m.start() - 1].isalnum() or self._buf[m.start() - 1] in '_$'):
+                # $ внутри идентификатора, а не начало dollar-quoting
+                pos = m.start() + 1
+            else:
+                pos = self._skip_to(re.compile(re.escape(token)), m.end())
+
+    def _make(self, sql: str, line: int) -> ScriptStatement:
+        sql = sql.strip()
+        if _COPY_FROM_STDIN.match(_without_leading_comments(sql)):
+            # Данные начинаются со следующей строки после COPY ... FROM stdin;
+            self._read_line()
+            return ScriptStatement(sql, line, CopyData(self))
+        return ScriptStatement(sql, line)
+
+    def __iter__(self) -> Iterator[ScriptStatement]:
+        while True:
+            statement = self._next_statement()
+            if statement is None:
+                return
+            yield statement
+            if statement.copy_data is not None:
+                statement.copy_data.drain()
+
+
+class ScriptRunner:
+    """Применение SQL-скриптов произвольного размера потоково, по операторам.
+
+    Операторы отправляются на сервер пачками по statements_per_call, COPY-блоки
+    передаются через copy_expert без загрузки в память. commit_every задает
+    число операторов на транзакцию (None - весь скрипт в одной транзакции).
+    При parallel_indexes > 0 неуникальные CREATE INDEX откладываются до конца
+    скрипта и строятся параллельно в отдельных соединениях; при defer_indexes
+    они только собираются в deferred_indexes для построения вызывающим кодом.
+    """
+
+    def __init__(self, db_manager, chunk_size: int = 1 << 20):
+        self.db_manager = db_manager
+        self.chunk_size = chunk_size
+        self.deferred_indexes: List[str] = []
+        self.logger = logging.getLogger('ScriptRunner')
+
+    def run_file(self, path: str, encoding: str = 'utf-8-sig', **options) -> int:
+        total = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            decoder = codecs.getincrementaldecoder(encoding)()
+
+            def read(size: int) -> str:
+                while True:
+                    data = f.read(size)
+                    text = decoder.decode(data, final=not data)
+                    if text or not data:
+                        return text
+
+            self.logger.info(f"Applying SQL script {path} ({total} bytes)")
+            return self.run(read, total, f.tell, **options)
+
+    def run_string(self, sql_script: str, **options) -> int:
+        stream = io.StringIO(sql_script)
+        return self.run(stream.read, len(sql_script), stream.tell, **options)
+
+    def run(self, read: Callable[[int], str], total: int, position: Callable[[], int],
+            commit_every: Optional[int] = None, statements_per_call: int = 50,
+            parallel_indexes: int = 0, defer_indexes: bool = False,
+            progress: Optional[Callable[[int, int, int], None]] = None) -> int:
+        connection = self.db_manager.connection
+        cursor = connection.cursor()
+        pending: List[ScriptStatement] = []
+        deferred_indexes = self.deferred_indexes = []
+        executed = 0
+        uncommitted = 0
+
+        def flush():
+            nonlocal executed, uncommitted
+            if not pending:
+                return
+            try:
+                cursor.execute('\n'.join(s.sql if s.sql.endswith(';') else s.sql + ';' for s in pending))
+            except Exception as e:
+                self.logger.error(f"Script failed in statements starting at line {pending[0].line}: {e}")
+                raise
+            executed += len(pending)
+            uncommitted += len(pending)
+            pending.clear()
+            if progress:
+                progress(position(), total, executed)
+
+        try:
+            for statement in SqlScriptReader(read, self.chunk_size):
+                if (parallel_indexes or defer_indexes) and _CREATE_INDEX.match(_without_leading_comments(statement.sql)):
+                    deferred_indexes.append(statement.sql)
+                    continue
+                if statement.copy_data is not None:
+                    flush()
+                    try:
+                        cursor.copy_expert(statement.sql, statement.copy_data)
+                    except Exception as e:
+                        self.logger.error(f"COPY at line {statement.line} failed: {e}")
+                        raise
+                    executed += 1
+                    uncommitted += 1
+                else:
+                    pending.append(statement)
+                    if len(pending) >= statements_per_call:
+                        flush()
+                if commit_every and uncommitted >= commit_every:
+                    flush()
+                    connection.commit()
+                    uncommitted = 0
+            flush()
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+
+        if deferred_indexes and parallel_indexes:
+            self.build_indexes(deferred_indexes, parallel_indexes)
+            executed += len(deferred_indexes)
+        if progress:
+            progress(total, total, executed)
+        self.logger.info(f"SQL script applied: {executed} statements")
+        return executed
+
+    def _worker_connection(self, search_path: str, settings: Optional[Dict[str, str]] = None):
+        conn = psycopg2.connect(**self.db_manager.connection_params, options="-c client_encoding=UTF8")
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute(f"SET search_path TO {search_path}")
+        for name, value in (settings or {}).items():
+            cursor.execute("SELECT set_config(%s, %s, false)", (name, value))
+        cursor.close()
+        return conn
+
+    def run_parallel(self, statements: List[str], workers: int,
+                     settings: Optional[Dict[str, str]] = None) -> List[Tuple[str, float]]:
+        """Выполнение независимых операторов параллельно, по одному соединению на поток.
+
+        Возвращает время выполнения каждого оператора в секундах.
+        """
+        cursor = self.db_manager.connection.cursor()
+        try:
+            cursor.execute("SHOW search_path")
+            search_path = cursor.fetchone()[0]
+            self.db_manager.connection.commit()
+        finally:
+            cursor.close()
+
+        def execute(statement: str) -> Tuple[str, float]:
+            conn = self._worker_connection(search_path, settings)
+            try:
+                started = time.perf_counter()
+                worker_cursor = conn.cursor()
+                worker_cursor.execute(statement)
+                worker_cursor.close()
+                elapsed = time.perf_counter() - started
+                self.logger.info(f"Executed in {elapsed:.2f}s: {statement}")
+                return statement, elapsed
+            finally:
+                conn.close()
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(execute, statement) for statement in statements]
+            errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            self.logger.error(f"{len(errors)} of {len(statements)} parallel statements failed")
+            raise errors[0]
+        return [f.result() for f in futures]
+
+    def build_indexes(self, statements: List[str], workers: int,
+                      settings: Optional[Dict[str, str]] = None) -> List[Tuple[str, float]]:
+        """Построение индексов параллельно в отдельных соединениях"""
+        return self.run_parallel(statements, workers, settings)
@@ -0,0 +1,289 @@
+from PySide6.QtCore import Qt, QAbstractTableModel, QModelIndex, QSortFilterProxyModel, QTimer
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+from columnar_result import ColumnarResult
+
+
+def sort_key(value: Any) -> Tuple:
+    """Ключ сортировки с учетом типа значения (числа и даты не сравниваются как строки)"""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (bool, int, float, Decimal)):
+        return (1, value)
+    if isinstance(value, datetime):
+        return (2, value.replace(tzinfo=None))
+    if isinstance(value, date):
+        return (2, datetime.combine(value, time.min))
+    return (3, str(value).casefold())
+
+
+class ResultTableModel(QAbstractTableModel):
+    """Модель таблицы над уже загруженными строками результата запроса"""
+
+    def __init__(self, headers: Sequence[str] = (), parent=None):
+        super().__init__(parent)
+        self._headers: List[str] = list(headers)
+        self._rows = []
+        self._sort_keys: Dict[int, List[Tuple]] = {}
+        self._search_rows: Optional[List[Tuple[str, ...]]] = None
+
+    def set_rows(self, rows, headers: Sequence[str] = None):
+        self.beginResetModel()
+        if headers is not None:
+            self._headers = list(headers)
+        # Столбцовый результат хранится как есть, без распаковки в кортежи
+        self._rows = rows if isinstance(rows, ColumnarResult) else [tuple(row) for row in rows]
+        self._sort_keys = {}
+        self._search_rows = None
+        self.endResetModel()
+
+    def headers(self) -> List[str]:
+        return list(self._headers)
+
+    def _ensure_list(self):
+        # Построчные изменения требуют изменяемого списка кортежей
+        if isinstance(self._rows, ColumnarResult):
+            self._rows = list(self._rows)
+
+    def _invalidate_caches(self):
+        self._sort_keys = {}
+        self._search_rows = None
+
+    def upsert_rows(self, rows, key_column: int = 0):
+        """Замена строк с совпадающим ключом и добавление новых строк в конец.
+
+        Замененные строки сообщаются одним dataChanged на каждый непрерывный
+        диапазон, кэши сбрасываются один раз на вызов.
+        """
+        self._ensure_list()
+        positions = {row[key_column]: i for i, row in enumerate(self._rows)}
+        new_rows = []
+        changed = set()
+        for row in rows:
+            row = tuple(row)
+            position = positions.get(row[key_column])
+            if position is None:
+                new_rows.append(row)
+                continue
+            self._rows[position] = row
+            changed.add(position)
+        if changed:
+            self._invalidate_caches()
+            last_column = self.columnCount() - 1
+            ordered = sorted(changed)
+            start = previous = ordered[0]
+            for position in ordered[1:] + [None]:
+                if position == previous + 1:
+                    previous = position
+                    continue
+                self.dataChanged.emit(self.index(start, 0), self.index(previous, last_column))
+                start = previous = position
+        if new_rows:
+            start = len(self._rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(new_rows) - 1)
+            self._rows.extend(new_rows)
+            self._invalidate_caches()
+            self.endInsertRows()
+
+    def remove_keys(self, keys, key_column: int = 0):
+        """Удаление строк с указанными ключами (соседние строки удаляются одним блоком)"""
+        keys = set(keys)
+        self._ensure_list()
+        position = len(self._rows) - 1
+        while position >= 0:
+            if self._rows[position][key_column] not in keys:
+                position -= 1
+                continue
+            end = position
+            while position > 0 and self._rows[position - 1][key_column] in keys:
+                position -= 1
+            self.beginRemoveRows(QModelIndex(), position, end)
+            del self._rows[position:end + 1]
+            self._invalidate_caches()
+            self.endRemoveRows()
+            position -= 1
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        if self._headers:
+            return len(self._headers)
+        return len(self._rows[0]) if self._rows else 0
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        value = self.raw_value(index.row(), index.column())
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(value)
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+                return int(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole:
+            return None
+        if orientation == Qt.Orientation.Horizontal:
+            if section < len(self._headers):
+                return self._headers[section]
+            return str(section)
+        return str(section + 1)
+
+    def raw_value(self, row: int, column: int) -> Any:
+        if isinstance(self._rows, ColumnarResult):
+            return self._rows.value(row, column)
+        return self._rows[row][column]
+
+    def _column_values(self, column: int) -> List[Any]:
+        if isinstance(self._rows, ColumnarResult):
+            return self._rows.column(column)
+        return [row[column] for row in self._rows]
+
+    def sort_keys(self, column: int) -> List[Tuple]:
+        """Ключи сортировки столбца вычисляются один раз на загрузку"""
+        keys = self._sort_keys.get(column)
+        if keys is None:
+            keys = [sort_key(value) for value in self._column_values(column)]
+            self._sort_keys[column] = keys
+        return keys
+
+    def search_rows(self) -> List[Tuple[str, ...]]:
+        """Строковые представления ячеек в нижнем регистре для поиска"""
+        if self._search_rows is None:
+            self._search_rows = [
+                tuple('' if value is None else str(value).casefold() for value in row)
+                for row in self._rows
+            ]
+        return self._search_rows
+
+
+class ResultFilterProxyModel(QSortFilterProxyModel):
+    """Сортировка, фильтрация и поиск по загруженным строкам без повторного запроса.
+
+    Строка фильтра разбивается на слова: слово вида ``столбец:значение``
+    фильтрует указанный столбец, остальные слова ищутся во всех столбцах.
+    Если новый текст только уточняет предыдущий, проверяются лишь строки,
+    прошедшие прошлый фильтр.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._terms: List[str] = []
+        self._column_terms: Dict[int, List[str]] = {}
+        self._accepted: Optional[Set[int]] = None
+        self.setDynamicSortFilter(False)
+        # Изменения источника за один проход цикла событий обрабатываются одним пересчетом
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.setInterval(0)
+        self._refresh_timer.timeout.connect(self._refresh)
+
+    def setSourceModel(self, model):
+        super().setSourceModel(model)
+        model.modelReset.connect(self._on_source_reset)
+        model.rowsInserted.connect(self._on_source_rows_changed)
+        model.rowsRemoved.connect(self._on_source_rows_changed)
+        model.dataChanged.connect(self._on_source_rows_changed)
+
+    def _on_source_reset(self):
+        self._refresh_timer.stop()
+        self._accepted = None
+        self._apply(narrowing=False)
+
+    def _on_source_rows_changed(self, *args):
+        self._refresh_timer.start()
+
+    def _refresh(self):
+        # Номера строк источника сдвинулись - набор прошедших фильтр считается заново
+        self._apply(narrowing=False)
+        if self.sortColumn() >= 0:
+            self.sort(self.sortColumn(), self.sortOrder())
+
+    def set_filter_text(self, text: str):
+        # Отложенный пересчет выполняется сейчас: прошлый набор строк уже неактуален
+        pending = self._refresh_timer.isActive()
+        if pending:
+            self._refresh_timer.stop()
+            self._accepted = None
+        terms, column_terms = self._parse(text)
+        narrowing = self._is_narrowing(terms, column_terms)
+        self._terms, self._column_terms = terms, column_terms
+        self._apply(narrowing)
+        if pending and self.sortColumn() >= 0:
+            self.sort(self.sortColumn(), self.sortOrder())
+
+    def clear_filter(self):
+        self.set_filter_text('')
+
+    def _parse(self, text: str) -> Tuple[List[str], Dict[int, List[str]]]:
+        headers = {}
+        for i, header in enumerate(self.sourceModel().headers()):
+            headers[header.casefold()] = i
+            headers[header.casefold().replace(' ', '_')] = i
+        terms: List[str] = []
+        column_terms: Dict[int, List[str]] = {}
+        for word in text.casefold().split():
+            name, sep, value = word.partition(':')
+            if sep and name in headers:
+                if value:
+                    column_terms.setdefault(headers[name], []).append(value)
+            else:
+                terms.append(word)
+        return terms, column_terms
+
+    @staticmethod
+    def _extends(old: List[str], new: List[str]) -> bool:
+        if len(new) < len(old):
+            return False
+        return all(n.find(o) != -1 for o, n in zip(old, new))
+
+    def _is_narrowing(self, terms, column_terms) -> bool:
+        if self._accepted is None:
+            return False
+        if not self._extends(self._terms, terms):
+            return False
+        for column, old in self._column_terms.items():
+            if not self._extends(old, column_terms.get(column, [])):
+                return False
+        return True
+
+    def _row_matches(self, cells: Tuple[str, ...]) -> bool:
+        for column, values in self._column_terms.items():
+            cell = cells[column]
+            for value in values:
+                if value not in cell:
+                    return False
+        if self._terms:
+            line = '\x1f'.join(cells)
+            for term in self._terms:
+                if term not in line:
+                    return False
+        return True
+
+    def _apply(self, narrowing: bool):
+        source = self.sourceModel()
+        if source is None:
+            return
+        if not self._terms and not self._column_terms:
+            self._accepted = None
+        else:
+            rows = source.search_rows()
+            candidates = self._accepted if narrowing else range(len(rows))
+            self._accepted = {r for r in candidates if self._row_matches(rows[r])}
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent) -> bool:
+        return self._accepted is None or source_row in self._accepted
+
+    def lessThan(self, left, right) -> bool:
+        keys = self.sourceModel().sort_keys(left.column())
+        a, b = keys[left.row()], keys[right.row()]
+        try:
+            return a < b
+        except TypeError:
+            return str(a) < str(b)
@@ -0,0 +1,63 @@
+import os
+import re
+
+import pytest
+
+from account_numbers import AccountNumberAllocator, _KEY_WEIGHTS, control_key
+
+
+def checksum(bank_code, account_number):
+    """Контрольная сумма номера счета: у верного номера младший разряд равен 0"""
+    digits = bank_code[-3:] + account_number
+    return sum(int(digit) * weight % 10 for digit, weight in zip(digits, _KEY_WEIGHTS)) % 10
+
+
+# Корреспондентские счета банков в Банке России (опубликованные реквизиты); для них
+# вместо трех последних цифр БИК берется '0' + 5-я и 6-я цифры БИК
+PUBLISHED_ACCOUNTS = [
+    ('044525225', '30101810400000000225'),
+    ('044525974', '30101810145250000974'),
+    ('044525187', '30101810700000000187'),
+    ('044525593', '30101810200000000593'),
+    ('044030653', '30101810500000000653'),
+]
+
+
+@pytest.mark.parametrize('bik, account_number', PUBLISHED_ACCOUNTS)
+def test_control_key_of_published_accounts(bik, account_number):
+    assert control_key('0' + bik[4:6], account_number) == account_number[8]
+    assert checksum('0' + bik[4:6], account_number) == 0
+
+
+def test_seed_accounts_have_valid_keys():
+    schema_path = os.path.join(os.path.dirname(__file__), os.pardir, 'database_schema.sql')
+    with open(schema_path, encoding='utf-8') as f:
+        numbers = re.findall(r"'(40817\d{15})'", f.read())
+    assert numbers
+    bik = AccountNumberAllocator(db_manager=None).bik
+    assert [number for number in numbers if control_key(bik, number) != number[8]] == []
+
+
+def test_control_key_ignores_current_key_digit():
+    number = '40817810000000001234'
+    key = control_key('044525000', number)
+    for digit in '0123456789':
+        assert control_key('044525000', number[:8] + digit + number[9:]) == key
+
+
+@pytest.mark.parametrize('currency', ['RUB', 'USD', 'EUR'])
+def test_formatted_numbers_are_valid(currency):
+    allocator = AccountNumberAllocator(db_manager=None, bik='044525225')
+    for sequence in (1, 1000, 12345678901):
+        number = allocator.format(currency, sequence)
+        assert len(number) == 20
+        assert checksum('044525225', number) == 0
+
+
+def test_format_validation():
+    allocator = AccountNumberAllocator(db_manager=None)
+    assert allocator.format('USD', 7).startswith('40817840')
+    with pytest.raises(ValueError):
+        allocator.format('XXX', 1)
+    with pytest.raises(ValueError):
+        allocator.format('USD', 1, prefix='408')
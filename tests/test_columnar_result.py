@@ -0,0 +1,71 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from columnar_result import ColumnarResult
+
+ROWS = [
+    (1, 'BUY', Decimal('10.50'), datetime(2026, 1, 2, 3, 4, 5, 6), date(2026, 1, 2), True, 1.5),
+    (2, 'SELL', Decimal('0.125'), None, date(2025, 12, 31), False, None),
+    (None, 'BUY', None, datetime(1969, 12, 31, 23, 59, 59), None, None, -2.0),
+]
+NAMES = ['id', 'type', 'amount', 'created', 'day', 'flag', 'ratio']
+
+
+def test_round_trip_and_kinds():
+    result = ColumnarResult.from_rows(ROWS, NAMES)
+    assert len(result) == 3
+    assert list(result) == ROWS
+    assert result[-1] == ROWS[2]
+    assert [result.kind(name) for name in NAMES] == ['int', 'category', 'decimal', 'timestamp', 'date', 'bool', 'float']
+    assert result.column('amount') == [Decimal('10.500'), Decimal('0.125'), None]
+    assert result.value(1, 'type') == 'SELL'
+    assert list(result.nulls('id')) == [0, 0, 1]
+    with pytest.raises(IndexError):
+        result[3]
+
+
+def test_codes_and_promotion_to_object():
+    result = ColumnarResult.from_rows([('a',), ('b',), ('a',), (1,)], ['mixed'])
+    assert result.kind('mixed') == 'object'
+    assert result.column('mixed') == ['a', 'b', 'a', 1]
+    with pytest.raises(ValueError):
+        result.codes('mixed')
+
+    result = ColumnarResult.from_rows([('USD',), ('EUR',), ('USD',)], ['currency'])
+    codes, categories = result.codes('currency')
+    assert [categories[code] for code in codes] == ['USD', 'EUR', 'USD']
+
+
+def test_int_overflow_falls_back_to_object():
+    result = ColumnarResult.from_rows([(1,), (2 ** 70,)], ['n'])
+    assert result.kind('n') == 'object'
+    assert result.column('n') == [1, 2 ** 70]
+
+
+def test_exact_sums():
+    rows = [(Decimal('0.10'),), (Decimal('0.20'),), (None,), (Decimal('-0.05'),)]
+    result = ColumnarResult.from_rows(rows, ['amount'])
+    assert result.sum('amount') == Decimal('0.25')
+    values, scale = result.scaled('amount')
+    assert (list(values), scale) == ([10, 20, 0, -5], 2)
+
+
+def test_scaled_object_and_errors():
+    result = ColumnarResult.from_rows([(1,), (Decimal('2.5'),), (None,), ('x',)], ['v'])
+    with pytest.raises(ValueError):
+        result.scaled('v')
+    result = ColumnarResult.from_rows([(True,), (False,)], ['flag'])
+    values, scale = result.scaled('flag')
+    assert (list(values), scale) == ([1, 0], 0)
+
+
+def test_from_arrow_uses_scale_metadata():
+    pa = pytest.importorskip('pyarrow')
+    schema = pa.schema([pa.field('amount', pa.int64(), metadata={'scale': '2'}),
+                        pa.field('currency', pa.string())])
+    table = pa.table({'amount': [150, None, -5], 'currency': ['USD', 'EUR', None]}, schema=schema)
+    result = ColumnarResult.from_arrow(table)
+    assert list(result) == [(Decimal('1.50'), 'USD'), (None, 'EUR'), (Decimal('-0.05'), None)]
+    assert result.sum('amount') == Decimal('1.45')
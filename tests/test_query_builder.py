@@ -0,0 +1,95 @@
+from decimal import Decimal
+
+import pytest
+from psycopg2 import sql
+
+from query_builder import (DOLLAR, LITERAL, PYFORMAT, Aggregate, Case, Condition, Select, coerce_value,
+                           split_list, statement_name)
+
+
+def render(composable):
+    """Текст составного запроса без соединения с БД (для проверки структуры)"""
+    if isinstance(composable, sql.Composed):
+        return ''.join(render(part) for part in composable.seq)
+    if isinstance(composable, sql.SQL):
+        return composable.string
+    if isinstance(composable, sql.Identifier):
+        return '.'.join(f'"{name}"' for name in composable.strings)
+    if isinstance(composable, sql.Placeholder):
+        return '%s'
+    if isinstance(composable, sql.Literal):
+        return f"<{composable.wrapped!r}>"
+    raise TypeError(composable)
+
+
+def test_coerce_value():
+    assert coerce_value(' 42 ') == 42
+    assert coerce_value('-1.50') == Decimal('-1.50')
+    assert coerce_value('007') == '007'
+    assert coerce_value('USD') == 'USD'
+    assert split_list("('a', 2, 3.5)") == ['a', 2, Decimal('3.5')]
+
+
+def test_compile_pyformat():
+    query = (Select('transactions', ['currency_code', Aggregate('sum', 'amount')])
+             .filter(Condition('transaction_type', '=', 'BUY'))
+             .filter(Condition('currency_code', 'in', ['USD', 'EUR']))
+             .group('currency_code')
+             .having_filter(Condition(Aggregate('COUNT'), '>', 10))
+             .order('currency_code', descending=True))
+    query.limit = 100
+    composed, params = query.compile(PYFORMAT)
+    assert render(composed) == (
+        'SELECT "currency_code", SUM("amount") FROM "bank_system"."transactions"'
+        ' WHERE "transaction_type" = %s AND "currency_code" IN (%s, %s)'
+        ' GROUP BY "currency_code" HAVING COUNT(*) > %s ORDER BY "currency_code" DESC LIMIT %s'
+    )
+    assert params == ['BUY', 'USD', 'EUR', 10, 100]
+
+
+def test_compile_dollar_numbers_parameters_in_text_order():
+    query = (Select('summary', [Case([(Condition('amount', '>=', 1000), 'large')], 'small', 'size')], schema=None)
+             .with_cte('summary', Select('transactions').filter(Condition('t.account_id', '=', 7)))
+             .filter(Condition('size', '!=', 'none')))
+    composed, params = query.compile(DOLLAR)
+    assert render(composed) == (
+        'WITH "summary" AS (SELECT * FROM "bank_system"."transactions" WHERE "t"."account_id" = $1) '
+        'SELECT CASE WHEN "amount" >= $2 THEN $3 ELSE $4 END AS "size" FROM "summary" WHERE "size" != $5'
+    )
+    assert params == [7, 1000, 'large', 'small', 'none']
+
+
+def test_compile_literal_quotes_compared_numbers():
+    query = (Select('currency_accounts', [Case([(Condition('balance', '>', Decimal('0.5')), 1)], 0)])
+             .filter(Condition('account_number', '=', 40817810100000000001))
+             .filter(Condition('client_id', 'IN', [1, 2]))
+             .filter(Condition('is_active', '=', True)))
+    composed, params = query.compile(LITERAL)
+    assert params == []
+    assert render(composed) == (
+        "SELECT CASE WHEN \"balance\" > <'0.5'> THEN <1> ELSE <0> END AS \"case_result\""
+        " FROM \"bank_system\".\"currency_accounts\""
+        " WHERE \"account_number\" = <'40817810100000000001'> AND \"client_id\" IN (<'1'>, <'2'>)"
+        " AND \"is_active\" = <True>"
+    )
+
+
+def test_grouping_and_validation():
+    query = Select('transactions', ['currency_code']).group('currency_code', 'transaction_type', grouping='grouping_sets')
+    assert render(query.compile()[0]).endswith(' GROUP BY GROUPING SETS (("currency_code", "transaction_type"))')
+    with pytest.raises(ValueError):
+        Select('transactions').group('currency_code', grouping='PIVOT')
+    with pytest.raises(ValueError):
+        Condition('amount', 'BETWEEN', 1)
+    with pytest.raises(ValueError):
+        Condition('amount', 'IN', [])
+    with pytest.raises(ValueError):
+        Aggregate('MEDIAN', 'amount')
+
+
+def test_query_text_does_not_depend_on_values():
+    first = Select('transactions').filter(Condition('amount', '>', 1)).compile(DOLLAR)[0]
+    second = Select('transactions').filter(Condition('amount', '>', 2)).compile(DOLLAR)[0]
+    assert render(first) == render(second)
+    assert statement_name(render(first)) == statement_name(render(second))
+    assert statement_name(render(first)).startswith('qb_')
@@ -0,0 +1,18 @@
+import pytest
+
+from reconciliation import BalanceReconciler
+
+
+@pytest.mark.parametrize('low, high, parts', [(1, 1, 4), (1, 10, 3), (5, 104, 10), (1, 7, 100), (-3, 3, 2)])
+def test_split_covers_range_without_overlap(low, high, parts):
+    ranges = BalanceReconciler.split(low, high, parts)
+    assert ranges[0][0] == low
+    assert ranges[-1][1] == high + 1
+    assert all(start < end for start, end in ranges)
+    assert all(previous[1] == current[0] for previous, current in zip(ranges, ranges[1:]))
+    assert len(ranges) <= parts
+
+
+def test_split_even_parts():
+    assert BalanceReconciler.split(1, 10, 2) == [(1, 6), (6, 11)]
+    assert BalanceReconciler.split(1, 10, 3) == [(1, 5), (5, 9), (9, 11)]
@@ -0,0 +1,103 @@
+import io
+
+import pytest
+
+from script_runner import SqlScriptReader
+
+# Размеры блоков, при которых токены (кавычки, $tag$, /* */, \.) разрезаются границей чтения
+CHUNK_SIZES = [1, 2, 3, 5, 7, 64, 1 << 20]
+
+
+def read_statements(script, chunk_size):
+    statements = []
+    for statement in SqlScriptReader(io.StringIO(script).read, chunk_size):
+        data = statement.copy_data.read() if statement.copy_data is not None else None
+        statements.append((statement.sql, statement.line, data))
+    return statements
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_dollar_quoted_bodies(chunk_size):
+    script = (
+        "CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $$ not an end; $body$ LANGUAGE sql;\n"
+        "DO $$ BEGIN PERFORM 'x;'; END $$;\n"
+        "SELECT a$b; SELECT 2;"
+    )
+    assert [sql for sql, _, _ in read_statements(script, chunk_size)] == [
+        "CREATE FUNCTION f() RETURNS int AS $body$ SELECT 1; $$ not an end; $body$ LANGUAGE sql;",
+        "DO $$ BEGIN PERFORM 'x;'; END $$;",
+        "SELECT a$b;",
+        "SELECT 2;",
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_strings_and_e_strings(chunk_size):
+    script = (
+        "SELECT 'it''s; fine';\n"
+        "SELECT E'escaped \\' quote; here';\n"
+        "SELECT e'\\\\';\n"
+        "SELECT name'';\n"
+        "SELECT \"semi;colon\" FROM t;"
+    )
+    assert [sql for sql, _, _ in read_statements(script, chunk_size)] == [
+        "SELECT 'it''s; fine';",
+        "SELECT E'escaped \\' quote; here';",
+        "SELECT e'\\\\';",
+        "SELECT name'';",
+        "SELECT \"semi;colon\" FROM t;",
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_comments(chunk_size):
+    script = (
+        "/* outer /* inner; */ still comment; */ SELECT 1;\n"
+        "-- line comment; with semicolon\n"
+        "SELECT 2; -- trailing\n"
+        "/* only a comment; */;\n"
+    )
+    statements = read_statements(script, chunk_size)
+    assert [(sql, line) for sql, line, _ in statements] == [
+        ("/* outer /* inner; */ still comment; */ SELECT 1;", 1),
+        ("-- line comment; with semicolon\nSELECT 2;", 2),
+    ]
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_copy_from_stdin(chunk_size):
+    script = (
+        "COPY t (a, b) FROM stdin;\n"
+        "1\t'x;\n"
+        "2\t$$\n"
+        "\\.\n"
+        "SELECT 3;\n"
+        "COPY t FROM STDIN;\n"
+        "4\tunread\n"
+        "\\.\n"
+        "SELECT 4;"
+    )
+    statements = []
+    for statement in SqlScriptReader(io.StringIO(script).read, chunk_size):
+        # Данные второго COPY не читаются: итератор пропускает их сам
+        data = statement.copy_data.read() if statement.copy_data is not None and not statements else None
+        statements.append((statement.sql, statement.line, data))
+    assert statements == [
+        ("COPY t (a, b) FROM stdin;", 1, "1\t'x;\n2\t$$\n"),
+        ("SELECT 3;", 5, None),
+        ("COPY t FROM STDIN;", 6, None),
+        ("SELECT 4;", 9, None),
+    ]
+
+
+def test_copy_data_partial_reads():
+    script = "COPY t FROM stdin;\nabc\ndef\n\\.\n"
+    statement = next(iter(SqlScriptReader(io.StringIO(script).read, 4)))
+    assert statement.copy_data.read(2) == "ab"
+    assert statement.copy_data.read(4) == "c\nde"
+    assert statement.copy_data.read() == "f\n"
+    assert statement.copy_data.read() == ""
+
+
+def test_statement_without_semicolon_at_end():
+    assert read_statements("SELECT 1;\n\nSELECT 2\n", 3) == [("SELECT 1;", 1, None), ("SELECT 2", 3, None)]
@@ -0,0 +1,328 @@
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import psycopg2
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from pnl_report import PnLReport
+from transaction_types import signed_case
+
+ARCHIVE_COLUMNS = ['transaction_id', 'account_id', 'transaction_type', 'amount', 'currency_code',
+                   'exchange_rate', 'commission', 'transaction_date', 'description', 'employee_name',
+                   'is_completed', 'request_key']
+
+
+def archive_schema():
+    return pa.schema([
+        ('transaction_id', pa.int64()),
+        ('account_id', pa.int64()),
+        ('transaction_type', pa.string()),
+        ('amount', pa.decimal128(15, 2)),
+        ('currency_code', pa.string()),
+        ('exchange_rate', pa.decimal128(12, 6)),
+        ('commission', pa.decimal128(8, 2)),
+        ('transaction_date', pa.timestamp('us')),
+        ('description', pa.string()),
+        ('employee_name', pa.string()),
+        ('is_completed', pa.bool_()),
+        ('request_key', pa.string()),
+    ])
+
+
+def _parse_date(value: Any) -> Optional[datetime]:
+    if value in (None, ''):
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(str(value).strip())
+
+
+def _next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+class TransactionArchive:
+    """Архив старых транзакций в сжатых файлах Parquet, по файлу на месяц.
+
+    archive(cutoff) выгружает полные месяцы до месяца cutoff в файлы каталога
+    archive_dir, регистрирует их в transaction_archive_manifest и удаляет
+    выгруженные строки пачками. Каждая пачка удаляется одним оператором вместе
+    с добавлением сумм в account_archived_balances, поэтому сверка остатков
+    остается точной в любой момент. Дневные снимки P&L месяца пересчитываются
+    в одной транзакции с записью месяца в манифест, до удаления строк: после
+    архивации PnLReport их не пересчитывает. Прерванная архивация продолжается при
+    следующем запуске по списку транзакций из уже записанного файла.
+
+    merge() дополняет результат get_transactions строками из файлов архивных
+    месяцев, попадающих в запрошенный период. Каталог архива должен быть
+    доступен всем рабочим местам. Требуется pyarrow.
+    """
+
+    MANIFEST_TTL = 60.0
+
+    def __init__(self, db_manager, archive_dir: str = 'archive', batch_size: int = 5000):
+        self.db_manager = db_manager
+        self.archive_dir = archive_dir
+        self.batch_size = max(1, batch_size)
+        self.logger = logging.getLogger('TransactionArchive')
+        self._manifest: Optional[List[Tuple[date, str, str]]] = None
+        self._manifest_loaded = 0.0
+        self._lock = threading.Lock()
+        self._warned = False
+
+    def reset(self):
+        with self._lock:
+            self._manifest = None
+
+    def _require_pyarrow(self):
+        if pa is None:
+            raise ValueError("Для работы с архивом транзакций требуется пакет pyarrow")
+
+    def _path(self, file_name: str) -> str:
+        return os.path.join(self.archive_dir, file_name)
+
+    def manifest(self) -> List[Tuple[date, str, str]]:
+        """[(месяц, файл, статус)] архивных файлов; кэшируется на MANIFEST_TTL секунд"""
+        with self._lock:
+            if self._manifest is not None and time.monotonic() - self._manifest_loaded < self.MANIFEST_TTL:
+                return self._manifest
+        try:
+            rows = self.db_manager.execute_read(
+                "SELECT month, file_name, status FROM bank_system.transaction_archive_manifest ORDER BY month"
+            )
+        except ValueError as e:
+            # База без таблиц архива: считается, что архива нет
+            self.logger.warning("Archive manifest is unavailable: %s", e)
+            rows = []
+        with self._lock:
+            self._manifest = [tuple(row) for row in rows]
+            self._manifest_loaded = time.monotonic()
+            return self._manifest
+
+    # ---- архивация ----
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.db_manager.connection_params, options="-c client_encoding=UTF8")
+        conn.autocommit = False
+        return conn
+
+    def _export_month(self, conn, month: date) -> Optional[Tuple[str, int, int, int]]:
+        """Выгрузка месяца в файл; возвращает (файл, строк, мин. ID, макс. ID) или None, если строк нет"""
+        schema = archive_schema()
+        cursor = conn.cursor(name=f"archive_{month:%Y%m}")
+        cursor.itersize = self.batch_size
+        cursor.execute(f"""
+            SELECT {', '.join(ARCHIVE_COLUMNS)}
+            FROM bank_system.transactions
+            WHERE transaction_date >= %s AND transaction_date < %s
+            ORDER BY transaction_id
+        """, (month, _next_month(month)))
+        os.makedirs(self.archive_dir, exist_ok=True)
+        temp_path = self._path(f".transactions_{month:%Y-%m}.parquet.tmp")
+        writer = pq.ParquetWriter(temp_path, schema, compression='zstd')
+        count, min_id, max_id = 0, None, None
+        completed = False
+        try:
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    break
+                columns = [list(column) for column in zip(*rows)]
+                # Значения ENUM (PgEnum) сохраняются обычными строками
+                columns[2] = [None if value is None else str(value) for value in columns[2]]
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)], schema=schema
+                ))
+                count += len(rows)
+                min_id = rows[0][0] if min_id is None else min_id
+                max_id = rows[-1][0]
+            cursor.close()
+            conn.commit()
+            completed = True
+        finally:
+            writer.close()
+            if not completed or not count:
+                os.remove(temp_path)
+        if not count:
+            return None
+        file_name = f"transactions_{month:%Y-%m}_{min_id}-{max_id}.parquet"
+        os.replace(temp_path, self._path(file_name))
+        return file_name, count, min_id, max_id
+
+    def _delete_archived(self, conn, file_name: str):
+        """Удаление строк файла пачками с переносом их сумм в account_archived_balances"""
+        query = f"""
+            WITH deleted AS (
+                DELETE FROM bank_system.transactions
+                WHERE transaction_id = ANY(%s)
+                RETURNING account_id, transaction_type, amount, is_completed
+            )
+            INSERT INTO bank_system.account_archived_balances AS b (account_id, archived_total, archived_count)
+            SELECT account_id,
+                   SUM(CASE WHEN is_completed THEN {signed_case('amount')} ELSE 0 END),
+                   COUNT(*) FILTER (WHERE is_completed)
+            FROM deleted
+            GROUP BY account_id
+            ON CONFLICT (account_id) DO UPDATE
+            SET archived_total = b.archived_total + EXCLUDED.archived_total,
+                archived_count = b.archived_count + EXCLUDED.archived_count
+        """
+        ids = pq.read_table(self._path(file_name), columns=['transaction_id']).column(0).to_pylist()
+        cursor = conn.cursor()
+        try:
+            for start in range(0, len(ids), self.batch_size):
+                cursor.execute(query, (ids[start:start + self.batch_size],))
+                conn.commit()
+            cursor.execute(
+                "UPDATE bank_system.transaction_archive_manifest SET status = 'archived' WHERE file_name = %s",
+                (file_name,)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def archive(self, cutoff: date,
+                progress: Optional[Callable[[date, int], None]] = None) -> List[Tuple[date, int]]:
+        """Архивация полных месяцев до месяца cutoff; возвращает [(месяц, строк)]"""
+        self._require_pyarrow()
+        conn = self._connect()
+        archived: List[Tuple[date, int]] = []
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT file_name FROM bank_system.transaction_archive_manifest WHERE status = 'pending'"
+            )
+            pending = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            conn.commit()
+            for file_name in pending:
+                self.logger.info("Resuming archive deletion for %s", file_name)
+                self._delete_archived(conn, file_name)
+
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT date_trunc('month', transaction_date)::date AS month
+                FROM bank_system.transactions
+                WHERE transaction_date < date_trunc('month', %s::date)
+                GROUP BY 1
+                ORDER BY 1
+            """, (cutoff,))
+            months = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            conn.commit()
+
+            for month in months:
+                exported = self._export_month(conn, month)
+                if exported is None:
+                    continue
+                file_name, count, min_id, max_id = exported
+                cursor = conn.cursor()
+                try:
+                    PnLReport(self.db_manager).write_snapshots(cursor, month, _next_month(month))
+                    cursor.execute("""
+                        INSERT INTO bank_system.transaction_archive_manifest
+                        (file_name, month, row_count, min_transaction_id, max_transaction_id, status)
+                        VALUES (%s, %s, %s, %s, %s, 'pending')
+                    """, (file_name, month, count, min_id, max_id))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    os.remove(self._path(file_name))
+                    raise
+                finally:
+                    cursor.close()
+                self._delete_archived(conn, file_name)
+                archived.append((month, count))
+                self.logger.info("Archived %d transactions of %s to %s", count, f"{month:%Y-%m}", file_name)
+                if progress:
+                    progress(month, count)
+        finally:
+            conn.close()
+            self.reset()
+        return archived
+
+    # ---- чтение ----
+
+    def _read(self, files: Sequence[str], account_id: Optional[int], trans_type: Optional[str],
+              from_dt: Optional[datetime], to_dt: Optional[datetime]) -> List[Tuple]:
+        filters = []
+        if account_id:
+            filters.append(('account_id', '=', int(account_id)))
+        if trans_type and trans_type != 'ALL':
+            filters.append(('transaction_type', '=', str(trans_type)))
+        if from_dt:
+            filters.append(('transaction_date', '>=', from_dt))
+        if to_dt:
+            filters.append(('transaction_date', '<=', to_dt))
+        rows: List[Tuple] = []
+        for file_name in files:
+            table = pq.read_table(self._path(file_name), columns=ARCHIVE_COLUMNS[:10], filters=filters or None)
+            rows.extend(zip(*(column.to_pylist() for column in table.columns)))
+        return rows
+
+    def merge(self, hot_rows: List[Tuple], account_id: Optional[int] = None, trans_type: Optional[str] = None,
+              from_date: Any = None, to_date: Any = None, limit: int = 1000) -> List[Tuple]:
+        """Результат get_transactions, дополненный строками архивных месяцев периода.
+
+        Архив читается только для периода с заданной границей, пересекающего
+        архивные месяцы: без границ показываются лишь горячие строки. Строки
+        упорядочены по дате по убыванию; если горячая таблица уже дала limit
+        строк новее всех подходящих архивных месяцев, файлы не читаются.
+        """
+        from_dt, to_dt = _parse_date(from_date), _parse_date(to_date)
+        if from_dt is None and to_dt is None:
+            return hot_rows
+        files = [(month, file_name) for month, file_name, _ in self.manifest()
+                 if (to_dt is None or month <= to_dt.date())
+                 and (from_dt is None or _next_month(month) > from_dt.date())]
+        if len(hot_rows) >= limit:
+            oldest = hot_rows[-1][8]
+            files = [(month, file_name) for month, file_name in files if month <= oldest.date()]
+        if not files:
+            return hot_rows
+        if pa is None:
+            if not self._warned:
+                self.logger.warning("pyarrow is not installed, archived transactions are not shown")
+                self._warned = True
+            return hot_rows
+
+        # Прерванная архивация: строки могут быть и в таблице, и в файле
+        hot_ids = {row[0] for row in hot_rows}
+        archived = [row for row in self._read([f for _, f in files], account_id, trans_type, from_dt, to_dt)
+                    if row[0] not in hot_ids]
+        if not archived:
+            return hot_rows
+        archived.sort(key=lambda row: row[7], reverse=True)
+        archived = archived[:limit]
+
+        accounts: Dict[int, Tuple[str, str]] = {
+            row[0]: (row[1], row[2]) for row in self.db_manager.execute_read("""
+                SELECT a.account_id, c.full_name, a.account_number
+                FROM bank_system.currency_accounts a
+                JOIN bank_system.clients c ON a.client_id = c.client_id
+                WHERE a.account_id = ANY(%s)
+            """, (sorted({row[1] for row in archived}),))
+        }
+        converted = [
+            (transaction_id, *accounts.get(account, (None, None)), trans, amount, currency,
+             rate, commission, transaction_date, description, employee)
+            for (transaction_id, account, trans, amount, currency, rate, commission,
+                 transaction_date, description, employee) in archived
+        ]
+        merged = sorted(list(hot_rows) + converted, key=lambda row: row[8], reverse=True)
+        return merged[:limit]
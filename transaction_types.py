@@ -0,0 +1,28 @@
+"""Направление операций: BUY и SELL везде записываются со стороны клиента.
+
+BUY - клиент покупает валюту на валютный счет (банк продает ее по sell_rate),
+SELL - клиент продает валюту со счета (банк покупает ее по buy_rate).
+Так считаются остатки (сверка, архив), разрешенные клиенту операции,
+проверка курса и P&L банка.
+"""
+
+from typing import Dict
+
+# Знак суммы операции для остатка валютного счета клиента
+BALANCE_SIGNS: Dict[str, int] = {'DEPOSIT': 1, 'BUY': 1, 'WITHDRAWAL': -1, 'SELL': -1, 'TRANSFER': -1}
+
+# Котировка exchange_rates, по которой банк проводит обменную операцию клиента
+QUOTE_RATES: Dict[str, str] = {'BUY': 'sell_rate', 'SELL': 'buy_rate'}
+
+
+def signed_case(expression: str, signs: Dict[str, int] = BALANCE_SIGNS,
+                type_column: str = 'transaction_type') -> str:
+    """SQL CASE: expression со знаком signs по типу операции, 0 для остальных типов"""
+    branches = ' '.join(f"WHEN '{trans_type}' THEN {sign} * {expression}" for trans_type, sign in signs.items())
+    return f"CASE {type_column} {branches} ELSE 0 END"
+
+
+def quote_case(prefix: str = 'r.', type_column: str = 'transaction_type') -> str:
+    """SQL CASE: курс котировки для обменной операции (NULL для остальных типов)"""
+    branches = ' '.join(f"WHEN '{trans_type}' THEN {prefix}{column}" for trans_type, column in QUOTE_RATES.items())
+    return f"CASE {type_column} {branches} END"
@@ -0,0 +1,203 @@
+import logging
+import re
+import threading
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type
+
+import psycopg2.extensions
+import psycopg2.extras
+
+
+class PgEnum(str, Enum):
+    """Значение ENUM PostgreSQL.
+
+    Члены - строки, поэтому сравнение с 'BUY' и передача в запрос работают как
+    раньше, но каждое значение существует в единственном экземпляре. Каждому
+    члену соответствует бит (в порядке объявления ENUM) для масок.
+    """
+
+    def __str__(self) -> str:
+        return self.value
+
+    @property
+    def bit(self) -> int:
+        return type(self)._bits[self]
+
+    @classmethod
+    def to_mask(cls, values: Iterable[Any]) -> int:
+        """Маска из членов или их текстовых значений"""
+        mask = 0
+        for value in values:
+            mask |= cls._bits[cls(value)]
+        return mask
+
+    @classmethod
+    def from_mask(cls, mask: int) -> 'EnumArray':
+        return EnumArray(member for member in cls if mask & cls._bits[member])
+
+
+class EnumArray(tuple):
+    """Массив значений ENUM; неизменяемый, поэтому разбирается один раз на каждый текст"""
+
+    __slots__ = ()
+
+    @property
+    def mask(self) -> int:
+        mask = 0
+        for member in self:
+            mask |= member.bit
+        return mask
+
+    def __str__(self) -> str:
+        return '{' + ','.join(self) + '}'
+
+
+# Кортеж по умолчанию передается как запись '(...)'; массив ENUM уходит в запрос как ARRAY[...]
+psycopg2.extensions.register_adapter(EnumArray, lambda value: psycopg2.extensions.adapt(list(value)))
+
+
+class CompositeRecord:
+    """Базовый класс записей составных типов: поля в __slots__, без словаря атрибутов"""
+
+    __slots__ = ()
+    type_name = ''
+
+    def __init__(self, *values: Any):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __iter__(self):
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other: Any) -> bool:
+        return type(other) is type(self) and tuple(self) == tuple(other)
+
+    def __hash__(self) -> int:
+        return hash(tuple(self))
+
+    def __repr__(self) -> str:
+        fields = ', '.join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __str__(self) -> str:
+        return '(' + ','.join('' if value is None else str(value) for value in self) + ')'
+
+
+class _RecordCaster(psycopg2.extras.CompositeCaster):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._record = record_class(self.name, self.attnames)
+
+    def make(self, values: List[Any]) -> CompositeRecord:
+        return self._record(*values)
+
+
+def class_name(type_name: str) -> str:
+    """'transaction_type' -> 'TransactionType'"""
+    return ''.join(part.capitalize() for part in re.split(r'[^0-9A-Za-z]+', type_name) if part) or 'PgType'
+
+
+_records: Dict[Tuple[str, Tuple[str, ...]], Type[CompositeRecord]] = {}
+
+
+def record_class(type_name: str, fields: Iterable[str]) -> Type[CompositeRecord]:
+    """Класс записи для составного типа; одинаковые типы получают один и тот же класс"""
+    key = (type_name, tuple(fields))
+    cls = _records.get(key)
+    if cls is None:
+        cls = type(class_name(type_name), (CompositeRecord,), {'__slots__': key[1], 'type_name': type_name})
+        _records[key] = cls
+    return cls
+
+
+class TypeAdapterRegistry:
+    """Преобразователи пользовательских типов схемы для соединений psycopg2.
+
+    При подключении из каталога читаются ENUM и составные типы схемы, и для
+    каждого соединения регистрируются преобразователи: ENUM - в члены PgEnum,
+    массивы ENUM - в EnumArray (разобранный массив кэшируется по тексту),
+    составные типы - в записи со слотами. Классы общие для всех соединений.
+    """
+
+    ENUMS_QUERY = """
+        SELECT t.oid, t.typarray, t.typname, array_agg(e.enumlabel::text ORDER BY e.enumsortorder)
+        FROM pg_type t
+        JOIN pg_enum e ON e.enumtypid = t.oid
+        WHERE t.typnamespace = (SELECT oid FROM pg_namespace WHERE nspname = %s)
+        GROUP BY t.oid, t.typarray, t.typname
+    """
+
+    COMPOSITES_QUERY = """
+        SELECT t.typname
+        FROM pg_type t
+        JOIN pg_class c ON c.oid = t.typrelid
+        WHERE t.typnamespace = (SELECT oid FROM pg_namespace WHERE nspname = %s) AND t.typtype = 'c' AND c.relkind = 'c'
+    """
+
+    ARRAY_CACHE_SIZE = 1024
+
+    def __init__(self, schema: str = 'bank_system'):
+        self.schema = schema
+        self.logger = logging.getLogger('TypeAdapterRegistry')
+        self._enums: Dict[str, Type[PgEnum]] = {}
+        self._lock = threading.Lock()
+
+    def enum(self, type_name: str) -> Optional[Type[PgEnum]]:
+        return self._enums.get(type_name)
+
+    def _enum_class(self, type_name: str, labels: List[str]) -> Type[PgEnum]:
+        with self._lock:
+            cls = self._enums.get(type_name)
+            if cls is None or [member.value for member in cls] != labels:
+                cls = PgEnum(class_name(type_name), [(label, label) for label in labels])
+                cls._bits = {member: 1 << i for i, member in enumerate(cls)}
+                self._enums[type_name] = cls
+            return cls
+
+    def _enum_casters(self, oid: int, array_oid: int, type_name: str, cls: Type[PgEnum]):
+        members = {member.value: member for member in cls}
+
+        def cast_enum(value: Optional[str], cursor) -> Optional[PgEnum]:
+            if value is None:
+                return None
+            return members[value]
+
+        enum_type = psycopg2.extensions.new_type((oid,), type_name, cast_enum)
+        parse_array = psycopg2.extensions.new_array_type((array_oid,), f"{type_name}[]", enum_type)
+        arrays: Dict[str, EnumArray] = {}
+
+        def cast_array(value: Optional[str], cursor) -> Optional[EnumArray]:
+            if value is None:
+                return None
+            result = arrays.get(value)
+            if result is None:
+                if len(arrays) >= self.ARRAY_CACHE_SIZE:
+                    arrays.clear()
+                result = EnumArray(parse_array(value, cursor))
+                arrays[value] = result
+            return result
+
+        array_type = psycopg2.extensions.new_type((array_oid,), f"{type_name}[]", cast_array)
+        return enum_type, array_type
+
+    def register(self, connection) -> None:
+        """Регистрация преобразователей ENUM и составных типов схемы на соединении"""
+        cursor = connection.cursor()
+        try:
+            cursor.execute(self.ENUMS_QUERY, (self.schema,))
+            enums = cursor.fetchall()
+            cursor.execute(self.COMPOSITES_QUERY, (self.schema,))
+            composites = [row[0] for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+        for oid, array_oid, type_name, labels in enums:
+            cls = self._enum_class(type_name, list(labels))
+            for caster in self._enum_casters(oid, array_oid, type_name, cls):
+                psycopg2.extensions.register_type(caster, connection)
+        for type_name in composites:
+            self.register_composite(connection, type_name)
+        self.logger.info("Registered %d enum and %d composite types", len(enums), len(composites))
+
+    def register_composite(self, connection, type_name: str) -> None:
+        psycopg2.extras.register_composite(f"{self.schema}.{type_name}", connection, factory=_RecordCaster)